@@ -0,0 +1,83 @@
+# backend/app.py
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi_cache import FastAPICache
+from redis import asyncio as aioredis
+import logging
+from contextlib import asynccontextmanager
+
+from .config import settings
+from .tracing import instrument_app, setup_tracing, shutdown_tracing
+# Before .database creates its MongoClient, so pymongo commands are traced
+setup_tracing()
+# Configures the broker that tasks published from the API go to
+from .celery_app import celery_app
+from .database import close_client
+from .health import start_startup_tasks
+from .revocation import revocation_list
+from .cards.registry import card_registry
+from .response_cache import TieredBackend, local_response_cache
+from .hashing import shutdown_executor
+from .metrics import metrics_endpoint, prometheus_middleware
+from .log import request_id_middleware, setup_logging, shutdown_logging
+
+logger = logging.getLogger(__name__)
+
+# --- Lifespan Manager ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Handles startup and shutdown events.
+    - Starts the non-blocking JSON log writer.
+    - Initializes the response cache (in-process, then Redis) on startup.
+    - Ensures indexes and seeds the database in the background (see /readyz).
+    - Starts listening for token revocations and cache invalidations.
+    - Closes the Redis and MongoDB connections on shutdown.
+    """
+    # Startup
+    setup_logging()
+    redis = aioredis.from_url(settings.REDIS_URI, encoding="utf8", decode_responses=False)
+    FastAPICache.init(TieredBackend(redis, local_response_cache), prefix="fastapi-cache")
+    logger.info("FastAPI-Cache initialized")
+    start_startup_tasks()
+    revocation_list.start()
+    card_registry.start()
+    local_response_cache.start()
+    yield
+    # Shutdown
+    revocation_list.stop()
+    card_registry.stop()
+    local_response_cache.stop()
+    shutdown_executor()
+    await redis.close()
+    logger.info("Redis connection closed")
+    close_client()
+    shutdown_tracing()
+    shutdown_logging()
+
+# --- App Initialization ---
+app = FastAPI(title="Shopping Cart API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# --- Middleware ---
+app.middleware("http")(prometheus_middleware)
+# Added last so it runs first and the request ID is set for everything below it
+app.middleware("http")(request_id_middleware)
+app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
+instrument_app(app)
+
+# --- API Routers ---
+from .products.routes import router as products_router
+from .users.routes import router as users_router
+from .orders.routes import router as orders_router
+from .me.routes import router as me_router
+from .map.routes import router as map_router
+from .cards.routes import router as cards_router
+from .health import router as health_router
+
+app.include_router(products_router)
+app.include_router(users_router)
+app.include_router(orders_router)
+app.include_router(me_router)
+app.include_router(map_router)
+app.include_router(cards_router)
+app.include_router(health_router)
\ No newline at end of file
@@ -3,58 +3,172 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
 from typing import List, Optional
+import hashlib
+import threading
+import time
+import uuid
  
 from .config import settings
 from .models import Role
+from .revocation import revocation_list
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
 class TokenData(BaseModel):
     identity: str
     role: Optional[str] = None
+    # The store the session belongs to (the "store" claim); see stores.py
+    store_id: str = settings.DEFAULT_STORE_ID
+    token_type: Optional[str] = None
+    jti: Optional[str] = None
+    expires_at: Optional[float] = None
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+class TokenCache:
+    """
+    Bounded LRU cache of already verified tokens, keyed by the SHA-256 digest of
+    the raw token. Entries are dropped once the token's exp has passed.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[TokenData]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, token_data = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token_data
+
+    def put(self, token: str, expires_at: float, token_data: TokenData):
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, token_data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
+def _encode_token(data: dict, token_type: str, expires_delta: timedelta) -> str:
+    now = datetime.utcnow()
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + settings.JWT_ACCESS_TOKEN_EXPIRES
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm="HS256")
-    return encoded_jwt
+    to_encode.update({
+        "type": token_type,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + expires_delta,
+    })
+    return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm="HS256")
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    return _encode_token(data, ACCESS_TOKEN_TYPE, expires_delta or settings.JWT_ACCESS_TOKEN_EXPIRES)
 
 def create_refresh_token(data: dict):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + settings.JWT_REFRESH_TOKEN_EXPIRES
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm="HS256")
-    return encoded_jwt
+    """Refresh tokens should carry the 'role' claim so refreshing needs no database lookup."""
+    return _encode_token(data, REFRESH_TOKEN_TYPE, settings.JWT_REFRESH_TOKEN_EXPIRES)
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> TokenData:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
+
+# Tokens issued before the "type" claim existed carry no "iat" either, so an old
+# refresh token can't be told apart from an access token by its lifetime. Those
+# access tokens were all issued before the rollout and lived at most 24 hours
+# (/api/me/status), so an untyped token is accepted only if it expires by
+# UNTYPED_TOKENS_EXPIRE_BY: anything expiring later is a refresh token, and
+# after that time no untyped token is accepted at all.
+def _accepts_untyped_token(expires_at: Optional[float]) -> bool:
+    cutoff = settings.UNTYPED_TOKENS_EXPIRE_BY
+    if cutoff is None or expires_at is None:
+        return False
+    if cutoff.tzinfo is None:
+        cutoff = cutoff.replace(tzinfo=timezone.utc)
+    return expires_at <= cutoff.timestamp()
+
+def decode_token(token: str) -> TokenData:
+    """Verifies a token and returns its claims, or raises a 401 HTTPException."""
+    # Kiosks send the same token on every request; skip re-verifying it
+    token_data = token_cache.get(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
+        except JWTError:
+            raise _credentials_exception()
         identity: str = payload.get("sub")
-        role: str = payload.get("role")
         if identity is None:
-            raise credentials_exception
-        token_data = TokenData(identity=identity, role=role)
-    except JWTError:
-        raise credentials_exception
+            raise _credentials_exception()
+        if payload.get("type") is None and not _accepts_untyped_token(payload.get("exp")):
+            raise _credentials_exception()
+        token_data = TokenData(
+            identity=identity,
+            role=payload.get("role"),
+            # Tokens issued before stores existed belong to the default store
+            store_id=payload.get("store") or settings.DEFAULT_STORE_ID,
+            token_type=payload.get("type"),
+            jti=payload.get("jti"),
+            expires_at=payload.get("exp"),
+        )
+        if token_data.expires_at is not None:
+            token_cache.put(token, token_data.expires_at, token_data)
+    # Checked on every request: a token can be revoked while it is cached
+    if token_data.jti and revocation_list.is_revoked(token_data.jti):
+        raise _credentials_exception()
     return token_data
 
+def decode_token_dependency(token: str = Depends(oauth2_scheme)) -> TokenData:
+    """Accepts any valid, unrevoked token regardless of its type."""
+    return decode_token(token)
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> TokenData:
+    token_data = decode_token(token)
+    if token_data.token_type == REFRESH_TOKEN_TYPE:
+        raise _credentials_exception()
+    return token_data
+
+def get_refresh_token_user(token: str = Depends(oauth2_scheme)) -> TokenData:
+    token_data = decode_token(token)
+    if token_data.token_type != REFRESH_TOKEN_TYPE:
+        raise _credentials_exception()
+    return token_data
+
+def revoke_token(token_data: TokenData):
+    if token_data.jti:
+        revocation_list.revoke(token_data.jti, token_data.expires_at or time.time())
+
 def role_required(roles: List[Role]):
+    allowed_roles = frozenset(r.value for r in roles)
+    forbidden_detail = f"Access forbidden: This endpoint requires one of the following roles: {', '.join(r.value for r in roles)}"
+
     def role_checker(current_user: TokenData = Depends(get_current_user)):
-        if current_user.role not in [r.value for r in roles]:
+        if current_user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Access forbidden: This endpoint requires one of the following roles: {', '.join(r.value for r in roles)}",
+                detail=forbidden_detail,
             )
         return current_user
     return role_checker
\ No newline at end of file
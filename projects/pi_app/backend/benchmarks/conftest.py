@@ -0,0 +1,26 @@
+# backend/benchmarks/conftest.py
+import pytest
+from pymongo import MongoClient
+
+from backend.config import settings
+from backend.database import generate_products
+
+BENCHMARK_MONGO_URI = "mongodb://localhost:27017/benchmark_shopping_cart_db"
+
+@pytest.fixture(scope="session")
+def catalog():
+    """The development seed catalog, as stored in the products collection."""
+    return generate_products(200)
+
+@pytest.fixture(scope="session")
+def products_collection(catalog):
+    """A products collection seeded with the catalog, in the default store, and its text index, dropped afterwards."""
+    client = MongoClient(BENCHMARK_MONGO_URI)
+    db = client.get_database("benchmark_shopping_cart_db")
+    collection = db["products"]
+    collection.drop()
+    collection.insert_many([{**product, "store_id": settings.DEFAULT_STORE_ID} for product in catalog])
+    collection.create_index([("store_id", 1), ("name", "text")])
+    yield collection
+    client.drop_database("benchmark_shopping_cart_db")
+    client.close()
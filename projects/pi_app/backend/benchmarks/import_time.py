@@ -0,0 +1,56 @@
+# backend/benchmarks/import_time.py
+"""
+Measures cold import time of the API and the Celery worker with
+`python -X importtime`, and fails when either grows past its budget.
+
+Run with: python -m backend.benchmarks.import_time [api_budget_ms] [worker_budget_ms]
+Exits with status 1 when a budget is exceeded, so it can gate CI
+(.github/workflows/05-Backend-Import-Time.yml). tests/test_import_time.py only
+checks the budgets when RUN_IMPORT_TIME_BUDGET is set.
+"""
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+API_MODULE = "backend.app"
+WORKER_MODULE = "backend.celery_app"
+API_BUDGET_MS = 1500.0
+WORKER_BUDGET_MS = 800.0
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Imports `module` in a fresh interpreter. Returns the total import time in ms
+    and the cumulative time of every top-level package it pulled in.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    packages: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith("  "):
+            continue  # nested import, already counted in its parent's cumulative time
+        packages[name.strip()] = int(cumulative) / 1000
+    return sum(packages.values()), packages
+
+def slowest(packages: Dict[str, float], count: int = 10) -> List[Tuple[str, float]]:
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:count]
+
+def run(api_budget_ms: float = API_BUDGET_MS, worker_budget_ms: float = WORKER_BUDGET_MS) -> bool:
+    within_budget = True
+    for module, budget_ms in ((API_MODULE, api_budget_ms), (WORKER_MODULE, worker_budget_ms)):
+        total_ms, packages = measure(module)
+        verdict = "ok" if total_ms <= budget_ms else "OVER BUDGET"
+        print(f"{module:<20} {total_ms:8.1f} ms (budget {budget_ms:.0f} ms) {verdict}")
+        for name, elapsed_ms in slowest(packages):
+            print(f"    {name:<40} {elapsed_ms:8.1f} ms")
+        within_budget = within_budget and total_ms <= budget_ms
+    return within_budget
+
+if __name__ == "__main__":
+    budgets = [float(arg) for arg in sys.argv[1:3]]
+    sys.exit(0 if run(*budgets) else 1)
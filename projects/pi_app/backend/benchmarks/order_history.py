@@ -0,0 +1,61 @@
+# backend/benchmarks/order_history.py
+"""
+Compares serializing a user's order history through the checkout model
+(OrderHistoryItem) against the read-only OrderHistoryRecord.
+
+Run with: python -m backend.benchmarks.order_history [num_orders]
+"""
+import sys
+import timeit
+from datetime import datetime
+from typing import List
+
+from pydantic import TypeAdapter
+
+from ..models import OrderHistoryItem, OrderHistoryRecord, OrderStatus
+
+
+def make_orders(num_orders: int, items_per_order: int = 10) -> List[dict]:
+    """Builds order documents shaped like the ones stored in order_history."""
+    orders = []
+    for n in range(num_orders):
+        items = [
+            {
+                "id": i, "name": f"Product {i}", "subtitle": "Fresh", "price": 12500.0 + i,
+                "currency": "VND", "quantity": 1 + i % 3, "unit": "each",
+                "product_img_url": None, "barcode": None,
+            }
+            for i in range(items_per_order)
+        ]
+        subtotal = sum(item["price"] * item["quantity"] for item in items)
+        orders.append({
+            "order_id": f"order-{n}",
+            "user_identity": "client@example.com",
+            "created_at": datetime(2025, 1, 1),
+            "status": OrderStatus.COMPLETED.value,
+            "items": items,
+            "shipping_cost": 15000.0,
+            "subtotal": subtotal,
+            "total_cost": subtotal + 15000.0,
+        })
+    return orders
+
+
+def run(num_orders: int = 500, repeat: int = 20):
+    orders = make_orders(num_orders)
+    results = {}
+    for model in (OrderHistoryItem, OrderHistoryRecord):
+        adapter = TypeAdapter(List[model])
+        # Mirrors what FastAPI does with a response_model: validate, then dump to JSON.
+        timer = timeit.Timer(lambda: adapter.dump_json(adapter.validate_python(orders)))
+        results[model.__name__] = min(timer.repeat(repeat=repeat, number=1))
+
+    for name, seconds in results.items():
+        print(f"{name:<20} {seconds * 1000:8.2f} ms for {num_orders} orders")
+    speedup = results["OrderHistoryItem"] / results["OrderHistoryRecord"]
+    print(f"Speedup: {speedup:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
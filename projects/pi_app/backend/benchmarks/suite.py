@@ -0,0 +1,66 @@
+# backend/benchmarks/suite.py
+"""
+Runs the pytest-benchmark microbenchmarks for the backend and the Qt client,
+saving a baseline or comparing against the last one saved.
+
+Run from projects/pi_app (the backend ones need MongoDB on localhost):
+
+    python -m backend.benchmarks.suite save                # record a new baseline
+    python -m backend.benchmarks.suite compare [--fail 15] # compare with it
+
+`compare` exits with status 1 when any benchmark's mean is more than --fail
+percent slower than the baseline, so it can gate CI. Baselines are kept per
+machine in .benchmarks/, one storage per suite; timings from different
+machines are not comparable.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+# Each suite runs in its own pytest session: both directories have a conftest.py
+# outside any package, and the client needs qt_client/ on sys.path for its own imports.
+SUITES: Dict[str, Dict[str, str]] = {
+    "backend": {"path": "backend/benchmarks/test_hot_paths.py", "pythonpath": ""},
+    "qt_client": {"path": "qt_client/benchmarks/test_hot_paths.py", "pythonpath": "qt_client"},
+}
+STORAGE_DIR = ".benchmarks"
+DEFAULT_FAIL_PERCENT = 15.0
+
+def pytest_args(suite: str, command: str, fail_percent: float) -> List[str]:
+    args = [
+        sys.executable, "-m", "pytest", SUITES[suite]["path"], "-q",
+        "--benchmark-only",
+        f"--benchmark-storage={os.path.join(STORAGE_DIR, suite)}",
+        "--benchmark-columns=min,mean,median,stddev,rounds",
+        "--benchmark-sort=name",
+    ]
+    if command == "save":
+        args.append(f"--benchmark-save={suite}")
+    else:
+        args += ["--benchmark-compare", f"--benchmark-compare-fail=mean:{fail_percent:g}%"]
+    return args
+
+def run_suite(suite: str, command: str, fail_percent: float) -> bool:
+    env = dict(os.environ)
+    extra_path = SUITES[suite]["pythonpath"]
+    if extra_path:
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.abspath(extra_path), env.get("PYTHONPATH")]))
+    print(f"== {suite} ==", flush=True)
+    return subprocess.run(pytest_args(suite, command, fail_percent), env=env).returncode == 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Save or compare microbenchmark baselines.")
+    parser.add_argument("command", choices=["save", "compare"])
+    parser.add_argument("--suite", choices=sorted(SUITES), action="append",
+                        help="Run only this suite (repeatable); default is all of them")
+    parser.add_argument("--fail", type=float, default=DEFAULT_FAIL_PERCENT,
+                        help="Slowdown of the mean, in percent, that fails a comparison")
+    args = parser.parse_args(argv)
+
+    results = [run_suite(suite, args.command, args.fail) for suite in args.suite or SUITES]
+    return 0 if all(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
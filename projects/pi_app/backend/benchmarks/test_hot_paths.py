@@ -0,0 +1,97 @@
+# backend/benchmarks/test_hot_paths.py
+"""
+pytest-benchmark suite for the backend's per-request hot paths.
+Baselines and comparisons: see backend/benchmarks/suite.py.
+"""
+import asyncio
+import inspect
+from typing import List
+
+import orjson
+import pytest
+from pydantic import TypeAdapter
+
+from backend import auth
+from backend.benchmarks.order_history import make_orders
+from backend.config import settings
+from backend.map.routes import search_products
+from backend.models import CheckoutPayload, OrderHistoryRecord, Product, Role
+from backend.response_cache import LocalResponseCache
+
+def make_cart(catalog, num_items: int = 20) -> dict:
+    items = [{**product, "quantity": 1 + i % 3} for i, product in enumerate(catalog[:num_items])]
+    subtotal = sum(item["price"] * item["quantity"] for item in items)
+    return {"items": items, "shipping_cost": 15000, "subtotal": subtotal, "total_cost": subtotal + 15000}
+
+def test_checkout_payload_validation(benchmark, catalog):
+    payload = make_cart(catalog)
+    result = benchmark(CheckoutPayload.model_validate, payload)
+    assert len(result.items) == 20
+
+def test_get_current_user_cold(benchmark):
+    token = auth.create_access_token({"sub": "client@example.com", "role": Role.SHOP_CLIENT.value})
+
+    def resolve():
+        auth.token_cache.clear()
+        return auth.get_current_user(token)
+
+    assert benchmark(resolve).identity == "client@example.com"
+
+def test_get_current_user_cached(benchmark):
+    token = auth.create_access_token({"sub": "client@example.com", "role": Role.SHOP_CLIENT.value})
+    auth.get_current_user(token)
+    assert benchmark(auth.get_current_user, token).identity == "client@example.com"
+
+# The product and order history endpoints send stored documents straight to
+# orjson (see backend/responses.py). Each pair below times that against the
+# response_model pass it replaced, validate then serialize, on the same documents.
+
+def test_product_list_serialization(benchmark, catalog):
+    """What GET /api/products did with its response_model on a cache miss."""
+    adapter = TypeAdapter(List[Product])
+
+    def serialize():
+        return adapter.dump_json(adapter.validate_python(catalog))
+
+    assert benchmark(serialize)
+
+def test_product_list_orjson(benchmark, catalog):
+    # As projected by PRODUCT_PROJECTION, without the map locations
+    documents = [{field: product[field] for field in Product.model_fields} for product in catalog]
+    assert benchmark(orjson.dumps, documents)
+
+@pytest.mark.parametrize("num_orders", [50, 500])
+def test_order_history_serialization(benchmark, num_orders):
+    orders = make_orders(num_orders)
+    adapter = TypeAdapter(List[OrderHistoryRecord])
+
+    def serialize():
+        return adapter.dump_json(adapter.validate_python(orders))
+
+    assert benchmark(serialize)
+
+@pytest.mark.parametrize("num_orders", [50, 500])
+def test_order_history_orjson(benchmark, num_orders):
+    assert benchmark(orjson.dumps, make_orders(num_orders))
+
+# The search endpoint without its response cache: what a cache miss costs
+search_products_uncached = inspect.unwrap(search_products)
+
+def test_map_search(benchmark, products_collection):
+    def search():
+        return asyncio.run(search_products_uncached(q="coffee", store_id=settings.DEFAULT_STORE_ID, products_collection=products_collection))
+
+    assert benchmark(search)
+
+def test_map_search_regex_fallback(benchmark, products_collection):
+    """A partial word finds nothing through the text index, so the route falls back to a regex scan."""
+    def search():
+        return asyncio.run(search_products_uncached(q="coff", store_id=settings.DEFAULT_STORE_ID, products_collection=products_collection))
+
+    assert benchmark(search)
+
+def test_local_response_cache_hit(benchmark, catalog):
+    """An L1 hit on the cached catalog, which replaced a Redis round trip (see backend/response_cache.py)."""
+    local = LocalResponseCache(max_bytes=1024 * 1024)
+    local.put("fastapi-cache:store:main:get_products:key", orjson.dumps(catalog), ttl=60)
+    assert benchmark(local.get_with_ttl, "fastapi-cache:store:main:get_products:key")[1]
@@ -0,0 +1,107 @@
+# backend/cards/registry.py
+"""
+Card registry lookups.
+
+Card taps are authenticated against the `cards` collection through a bounded
+in-process LRU cache, so a repeat tap never leaves the process. Unknown card
+IDs are cached too (as None), which keeps a reader spamming bad cards off the
+database. Every write to a card publishes its ID on a pub/sub channel and each
+API process drops that entry, so blocking or re-linking a card takes effect
+everywhere on the next tap. Expiry is checked against the cached record, so
+it needs no invalidation.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from pymongo import collection
+
+from ..config import settings
+from ..models import Card, CardStatus
+from ..redis_client import Subscription, get_redis
+
+CARD_INVALIDATION_CHANNEL = "cards:invalidations"
+
+_MISSING = object()
+
+class CardRegistry:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Optional[Card]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, so a lookup racing a write doesn't cache the old record
+        self._generation = 0
+        self._subscription: Optional[Subscription] = None
+
+    def start(self):
+        """
+        Subscribes to invalidations, then drops anything cached before the
+        subscription was live. The cache is dropped again whenever the
+        subscription is re-established, since invalidations may have been missed.
+        """
+        self._subscription = Subscription(CARD_INVALIDATION_CHANNEL, self._on_message, resync=self.clear)
+        self._subscription.start()
+
+    def stop(self):
+        if self._subscription is not None:
+            self._subscription.stop()
+            self._subscription = None
+
+    def _on_message(self, message):
+        card_id = message["data"]
+        self._forget(card_id.decode() if isinstance(card_id, bytes) else card_id)
+
+    def _forget(self, card_id: str):
+        with self._lock:
+            self._entries.pop(card_id, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def get(self, card_id: str, cards_collection: collection.Collection) -> Optional[Card]:
+        """Returns the card record, reading through to MongoDB on a cache miss."""
+        with self._lock:
+            card = self._entries.get(card_id, _MISSING)
+            if card is not _MISSING:
+                self._entries.move_to_end(card_id)
+                return card
+            generation = self._generation
+
+        doc = cards_collection.find_one({"card_id": card_id}, {"_id": 0})
+        card = Card.model_validate(doc) if doc else None
+        with self._lock:
+            if generation != self._generation:
+                return card
+            self._entries[card_id] = card
+            self._entries.move_to_end(card_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return card
+
+    def authenticate(self, card_id: str, cards_collection: collection.Collection) -> Optional[Card]:
+        """Returns the card if it may log in right now: known, active and not expired."""
+        card = self.get(card_id, cards_collection)
+        if card is None or card.status != CardStatus.ACTIVE:
+            return None
+        if card.expires_at is not None and card.expires_at <= datetime.utcnow():
+            return None
+        return card
+
+    def invalidate(self, card_ids: Iterable[str]):
+        """Drops the given cards here and tells every other process to do the same."""
+        card_ids = list(card_ids)
+        if not card_ids:
+            return
+        pipe = get_redis().pipeline(transaction=False)
+        for card_id in card_ids:
+            pipe.publish(CARD_INVALIDATION_CHANNEL, card_id)
+        pipe.execute()
+        # Don't wait for our own messages to come back
+        for card_id in card_ids:
+            self._forget(card_id)
+
+card_registry = CardRegistry(settings.CARD_CACHE_SIZE)
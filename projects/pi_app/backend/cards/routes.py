@@ -0,0 +1,105 @@
+# backend/cards/routes.py
+import logging
+from fastapi import APIRouter, HTTPException, status, Depends
+from pymongo import UpdateOne, collection
+
+from ..config import settings
+from ..database import get_cards_collection
+from ..models import Card, CardUpdate, CardBatchCreate, CardBatchResult, Role
+from .registry import card_registry
+from .. import auth
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api/cards",
+    tags=["Cards"]
+)
+
+# Admins only manage their own store's cards: those whose store_ids include it.
+# Cards without store_ids (from before stores existed) belong to the default store.
+
+def store_card_filter(store_id: str) -> dict:
+    if store_id == settings.DEFAULT_STORE_ID:
+        return {"$or": [{"store_ids": store_id}, {"store_ids": None}]}
+    return {"store_ids": store_id}
+
+def manages_card(store_id: str, card: dict) -> bool:
+    store_ids = card.get("store_ids")
+    if store_ids is None:
+        return store_id == settings.DEFAULT_STORE_ID
+    return store_id in store_ids
+
+def check_assigned_stores(store_ids, current_user: auth.TokenData):
+    """Refuses to bind a card to any store but the admin's own."""
+    if store_ids is not None and (not store_ids or set(store_ids) != {current_user.store_id}):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Cards can only be assigned to store '{current_user.store_id}'",
+        )
+
+@router.post('/batch', response_model=CardBatchResult)
+def provision_cards(
+    batch: CardBatchCreate,
+    current_user: auth.TokenData = Depends(auth.role_required([Role.ADMIN])),
+    cards_collection: collection.Collection = Depends(get_cards_collection),
+):
+    """
+    Creates or replaces up to 1000 cards in a single bulk write.
+    Existing cards with the same card_id are overwritten, unless one belongs to
+    another store, in which case nothing is written. New cards without
+    store_ids are bound to the admin's store.
+    """
+    for card in batch.cards:
+        check_assigned_stores(card.store_ids, current_user)
+    existing = cards_collection.find(
+        {"card_id": {"$in": [card.card_id for card in batch.cards]}}, {"_id": 0, "card_id": 1, "store_ids": 1},
+    )
+    if any(not manages_card(current_user.store_id, card) for card in existing):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Some of these cards belong to another store")
+
+    operations = [
+        UpdateOne(
+            {"card_id": card.card_id},
+            {"$set": {**card.model_dump(), "store_ids": card.store_ids or [current_user.store_id]}},
+            upsert=True,
+        )
+        for card in batch.cards
+    ]
+    result = cards_collection.bulk_write(operations, ordered=False)
+    card_registry.invalidate(card.card_id for card in batch.cards)
+    logger.info("Provisioned cards", extra={"count": len(operations)})
+    return CardBatchResult(created=result.upserted_count, updated=result.matched_count)
+
+@router.get('/{card_id}', response_model=Card)
+def get_card(
+    card_id: str,
+    current_user: auth.TokenData = Depends(auth.role_required([Role.ADMIN])),
+    cards_collection: collection.Collection = Depends(get_cards_collection),
+):
+    """Returns one of the store's cards as stored in the database."""
+    card = cards_collection.find_one({"card_id": card_id, **store_card_filter(current_user.store_id)}, {"_id": 0})
+    if card is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Card not found")
+    return card
+
+@router.patch('/{card_id}', response_model=Card)
+def update_card(
+    card_id: str,
+    card_update: CardUpdate,
+    current_user: auth.TokenData = Depends(auth.role_required([Role.ADMIN])),
+    cards_collection: collection.Collection = Depends(get_cards_collection),
+):
+    """Updates one of the store's cards, e.g. to block it or link it to an account."""
+    update_data = card_update.model_dump(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No update fields provided")
+    if "store_ids" in update_data:
+        check_assigned_stores(update_data["store_ids"] or [], current_user)
+
+    store_filter = store_card_filter(current_user.store_id)
+    result = cards_collection.update_one({"card_id": card_id, **store_filter}, {"$set": update_data})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Card not found")
+    card_registry.invalidate([card_id])
+    return cards_collection.find_one({"card_id": card_id}, {"_id": 0})
@@ -0,0 +1,43 @@
+# backend/celery_app.py
+"""
+The Celery application, kept apart from the FastAPI app so a worker
+(`celery -A backend.celery_app:celery_app worker`) never imports the API's
+routers. Processes that only publish tasks (the API, the order watcher)
+import this module so tasks go to the configured broker.
+"""
+from celery import Celery
+
+from .config import settings
+from .tracing import setup_tracing
+# Before any task module creates a MongoClient, so pymongo commands are traced
+setup_tracing()
+# Imported for their Celery signal handlers: JSON logging, task metrics
+from . import log, metrics  # noqa: F401
+
+celery_app = Celery(
+    "tasks",
+    broker=settings.REDIS_URI,
+    backend=settings.REDIS_URI,
+    include=["backend.orders.tasks", "backend.orders.batching", "backend.orders.reservations", "backend.orders.archive"],
+)
+celery_app.conf.update(
+    task_track_started=True,
+    beat_schedule={
+        "release-expired-reservations": {
+            "task": "backend.orders.reservations.release_expired_reservations",
+            "schedule": 30.0,
+        },
+        "expire-abandoned-orders": {
+            "task": "backend.orders.tasks.expire_abandoned_orders",
+            "schedule": 60.0,
+        },
+        "resubmit-stalled-orders": {
+            "task": "backend.orders.batching.resubmit_stalled_orders",
+            "schedule": 60.0,
+        },
+        "archive-old-orders": {
+            "task": "backend.orders.archive.archive_old_orders",
+            "schedule": 24 * 3600.0,
+        },
+    },
+)
@@ -1,8 +1,8 @@
 # backend/config.py
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import EmailStr
-from datetime import timedelta
-from typing import Literal
+from datetime import datetime, timedelta
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
     """
@@ -13,8 +13,14 @@ class Settings(BaseSettings):
     APP_ENV: Literal["development", "production"] = "development"
 
     # --- Database & Cache ---
-    MONGO_URI: str = "mongodb://mongo:27017/shopping_cart_db"
+    MONGO_URI: str = "mongodb://mongo:27017/shopping_cart_db?replicaSet=rs0"
     REDIS_URI: str = "redis://redis:6379/0"
+    # Size of each API process's in-process response cache, in front of Redis (response_cache.py)
+    RESPONSE_CACHE_L1_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # --- Stores ---
+    # Store used when a request or token names none, and the one development seeding fills
+    DEFAULT_STORE_ID: str = "main"
 
     # --- Security ---
     JWT_SECRET_KEY: str = "super-secret-key-for-dev"
@@ -24,13 +30,71 @@ class Settings(BaseSettings):
     ADMIN_EMAIL: EmailStr = "admin@example.com"
 
     # --- VietQR Configuration ---
+    VIETQR_API_URL: str = "https://api.vietqr.io/v2/generate"
     VIETQR_BANK_BIN: str = "970436"
     VIETQR_ACCOUNT_NO: str = "1234567890"
     VIETQR_ACCOUNT_NAME: str = "NGUYEN VAN A"
+    # How long a payment QR code stays valid; checkout holds the stock for this long.
+    QR_PAYMENT_TTL_SECONDS: int = 300
+    # Unpaid orders are marked failed once their QR code expires and deleted after this many days.
+    ABANDONED_ORDER_RETENTION_DAYS: int = 7
+    # Finished orders older than this move from order_history to monthly archive collections.
+    ORDER_HOT_RETENTION_DAYS: int = 90
+
+    # --- Inventory Batching ---
+    # Paid orders are collected for up to this window, or until this many arrive,
+    # and their stock decrements are applied together.
+    INVENTORY_BATCH_WINDOW_MS: int = 50
+    INVENTORY_BATCH_MAX_ORDERS: int = 50
+    # Orders still PAID this long after payment are queued again (their batch was lost)
+    PAID_ORDER_STALL_SECONDS: int = 120
+
+    # --- Production Server (gunicorn.conf.py) ---
+    PORT: int = 5000
+    # API worker processes; 0 means one per CPU core available to the process
+    WEB_CONCURRENCY: int = 0
+    # Seconds a worker gets on SIGTERM to finish in-flight requests before it is killed
+    GRACEFUL_TIMEOUT_SECONDS: int = 30
 
     # --- JWT Token Expiration (not from .env, but good to keep here) ---
     JWT_ACCESS_TOKEN_EXPIRES: timedelta = timedelta(minutes=15)
     JWT_REFRESH_TOKEN_EXPIRES: timedelta = timedelta(days=30)
+    # Tokens issued before the "type" claim existed are accepted only if they expire by this
+    # time; set it to the rollout time plus 24 hours. Unset rejects them all (see auth.py).
+    UNTYPED_TOKENS_EXPIRE_BY: Optional[datetime] = None
+    # Number of verified tokens get_current_user keeps in its in-process cache
+    AUTH_TOKEN_CACHE_SIZE: int = 4096
+
+    # --- Login Admission Control ---
+    # Password hashing runs in its own process pool; requests beyond the queue limit get 503.
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_LIMIT: int = 16
+    # bcrypt cost; run `python -m backend.hashing` on the target machine to choose it
+    PASSWORD_HASH_ROUNDS: int = 12
+    # Per client IP and endpoint; a store's carts usually share one NAT address
+    LOGIN_RATE_LIMIT_PER_MINUTE: int = 30
+    REGISTER_RATE_LIMIT_PER_MINUTE: int = 10
+    CARD_LOGIN_IP_RATE_LIMIT_PER_MINUTE: int = 300
+    GUEST_LOGIN_RATE_LIMIT_PER_MINUTE: int = 600
+    # Per card
+    CARD_LOGIN_RATE_LIMIT_PER_MINUTE: int = 10
+
+    # Number of card records each API process keeps in its card registry cache
+    CARD_CACHE_SIZE: int = 10000
+
+    # --- Observability ---
+    # Port a Celery worker serves its Prometheus metrics on (the API uses /metrics)
+    WORKER_METRICS_PORT: int = 9100
+    LOG_LEVEL: str = "INFO"
+    # Records waiting to be written; once full, new records are dropped rather than block
+    LOG_QUEUE_SIZE: int = 10000
+    # Share of high-frequency events (e.g. product cache misses) that are logged
+    LOG_SAMPLE_RATE: float = 0.01
+    # Identifies this process in traces; set per service (API, worker, watcher) in docker-compose
+    SERVICE_NAME: str = "shopping-cart-api"
+    # Tracing is enabled when either is set: a directory for JSON-lines span files, or an OTLP/HTTP collector
+    TRACE_EXPORT_DIR: Optional[str] = None
+    TRACE_OTLP_ENDPOINT: Optional[str] = None
 
     model_config = SettingsConfigDict(
         env_file=".env",
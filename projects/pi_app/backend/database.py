@@ -1,34 +1,119 @@
 # backend/database.py
-from pymongo import MongoClient, ASCENDING, collection
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne, collection
+from pymongo.database import Database
+from datetime import datetime
+from typing import Optional
 from .config import settings
+from .metrics import mongo_command_listener
+from .models import Product
+import hashlib
+import json
+import logging
 import random
 import os
+import threading
 
 # --- Database Connection ---
-# This setup creates a single client that can be shared across the application.
-# PyMongo's client is thread-safe and includes connection pooling.
-client = MongoClient(settings.MONGO_URI)
-db = client["shopping_cart_db"]
+# A single client shared across the process. PyMongo's client is thread-safe and
+# includes connection pooling, but must not be carried across fork(), so it is
+# created on first use: with a preloading server (see gunicorn.conf.py) that is
+# in each worker, after it has been forked.
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(settings.MONGO_URI, event_listeners=[mongo_command_listener])
+    return _client
+
+def get_db() -> Database:
+    return get_client()["shopping_cart_db"]
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+logger = logging.getLogger(__name__)
 
 # --- Collection Getters (for Dependency Injection) ---
 def get_products_collection() -> collection.Collection:
-    return db["products"]
+    return get_db()["products"]
 
 def get_users_collection() -> collection.Collection:
-    return db["users"]
+    return get_db()["users"]
 
 def get_orders_collection() -> collection.Collection:
-    return db["order_history"]
+    return get_db()["order_history"]
 
 def get_map_collection() -> collection.Collection:
-    return db["map"]
+    return get_db()["map"]
+
+def get_order_archive_index_collection() -> collection.Collection:
+    return get_db()["order_archive_index"]
+
+def get_cards_collection() -> collection.Collection:
+    return get_db()["cards"]
 
 # --- Database Helpers ---
 def ensure_indexes():
-    """Creates unique indexes for collections if they don't exist."""
-    get_products_collection().create_index([("id", ASCENDING)], unique=True)
+    """
+    Creates indexes for collections if they don't exist. Indexes on store-scoped
+    collections lead with store_id (see stores.py).
+    """
+    get_products_collection().create_index([("store_id", ASCENDING), ("id", ASCENDING)], unique=True)
+    get_products_collection().create_index([("store_id", ASCENDING), ("barcode", ASCENDING)])
+    get_products_collection().create_index([("store_id", ASCENDING), ("name", "text")])
+    get_map_collection().create_index([("store_id", ASCENDING), ("name", ASCENDING)], unique=True)
     get_users_collection().create_index([("email", ASCENDING)], unique=True)
-    print("Database indexes ensured.")
+    get_cards_collection().create_index([("card_id", ASCENDING)], unique=True)
+    get_orders_collection().create_index([("status", ASCENDING)])
+    get_orders_collection().create_index([("store_id", ASCENDING), ("user_identity", ASCENDING), ("created_at", DESCENDING)])
+    get_order_archive_index_collection().create_index(
+        [("store_id", ASCENDING), ("user_identity", ASCENDING), ("month", ASCENDING)], unique=True,
+    )
+    # Only pending orders carry expires_at, so the sweeper's index stays small.
+    get_orders_collection().create_index(
+        [("expires_at", ASCENDING)],
+        partialFilterExpression={"status": "pending"},
+    )
+    # Abandoned orders are purged by MongoDB once the retention period has passed.
+    get_orders_collection().create_index(
+        [("abandoned_at", ASCENDING)],
+        expireAfterSeconds=settings.ABANDONED_ORDER_RETENTION_DAYS * 24 * 3600,
+    )
+    logger.info("Database indexes ensured")
+
+# Indexes from before stores that did not lead with store_id. A collection can
+# only have one text index, so name_text must go before the store-scoped one is built.
+LEGACY_INDEXES = {"id_1", "name_text", "user_identity_1_created_at_-1", "user_identity_1_month_1"}
+
+def migrate_to_stores():
+    """
+    Assigns products, maps and orders written before stores existed to the
+    default store and drops the indexes they replace. Runs before ensure_indexes;
+    does nothing once every document has a store_id.
+    """
+    # Imported here: the archive module pulls in the Celery tasks
+    from .orders.archive import ARCHIVE_PREFIX
+    db = get_db()
+    names = ["products", "map", "order_history"] + sorted(
+        name for name in db.list_collection_names() if name.startswith(ARCHIVE_PREFIX)
+    )
+    for name in names:
+        result = db[name].update_many(
+            {"store_id": {"$exists": False}}, {"$set": {"store_id": settings.DEFAULT_STORE_ID}},
+        )
+        if result.modified_count:
+            logger.info("Assigned documents to the default store", extra={"collection": name, "count": result.modified_count})
+        for index_name in LEGACY_INDEXES & set(db[name].index_information()):
+            db[name].drop_index(index_name)
+            logger.info("Dropped index not scoped by store", extra={"collection": name, "index": index_name})
 
 PRODUCT_NAMES = [
     "Apple", "Banana", "Orange", "Milk", "Bread", "Eggs", "Cheese", "Chicken", "Rice", "Pasta",
@@ -36,12 +121,13 @@ PRODUCT_NAMES = [
 ]
 SUBTITLES = ["Fresh", "Organic", "Imported", "Local", "Premium", "Budget"]
 UNITS = ["each", "kg", "pack", "bottle", "box"]
-random.seed(42)
 
-def random_location():
-    return {"x": random.randint(30, 470), "y": random.randint(30, 470)}
+def random_location(rng: random.Random):
+    return {"x": rng.randint(30, 470), "y": rng.randint(30, 470)}
 
 def generate_products(n=20):
+    # A private, fixed-seed generator: the same products every call, so the seed fingerprint is stable
+    rng = random.Random(42)
     products = []
     # Add original demo products with locations
     demo_products = [
@@ -56,41 +142,86 @@ def generate_products(n=20):
         product = {
             "id": i+100,
             "name": name,
-            "subtitle": random.choice(SUBTITLES),
-            "price": random.randint(10000, 2000000),  # VND price range
+            "subtitle": rng.choice(SUBTITLES),
+            "price": rng.randint(10000, 2000000),  # VND price range
             "currency": "VND",
-            "quantity": random.randint(1, 50),
-            "unit": random.choice(UNITS),
+            "quantity": rng.randint(1, 50),
+            "unit": rng.choice(UNITS),
             "product_img_url": "https://via.placeholder.com/80/cccccc/000000?Text=Product",
-            "location": [random_location() for _ in range(random.randint(1, 3))]
+            "location": [random_location(rng) for _ in range(rng.randint(1, 3))]
         }
         products.append(product)
-    return products
+    # Store every Product field, defaults included, as create_product does; the
+    # product endpoints send stored documents without re-validating them
+    return [{**Product.model_validate(product).model_dump(), "location": product["location"]} for product in products]
+
+DEMO_CARD_IDS = ["CARD123", "GUEST456", "TEMP789"]
+
+def get_seed_state_collection() -> collection.Collection:
+    return get_db()["seed_state"]
+
+def load_map_image() -> bytes:
+    default_map_path = os.path.join(os.path.dirname(__file__), "default_map.png")
+    with open(default_map_path, "rb") as f:
+        return f.read()
+
+def seed_fingerprint(products, map_image: bytes) -> str:
+    """Hash of everything the development seed writes, to tell whether it changed."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(products, sort_keys=True).encode())
+    digest.update(map_image)
+    digest.update(json.dumps(DEMO_CARD_IDS).encode())
+    return digest.hexdigest()
 
 def seed_database_if_empty():
-    """Clears and reseeds the products and map collections with initial data, only in development."""
+    """
+    Seeds the default store's products and mall map, and the demo cards, in development. Idempotent:
+    nothing is written when the seed data is unchanged since the last run, and
+    otherwise documents are upserted in place, never deleted and reinserted.
+    """
     if getattr(settings, "APP_ENV", "development") != "development":
-        print("Skipping database seeding: not in development environment.")
+        logger.info("Skipping database seeding: not in development environment")
         return
     products_collection = get_products_collection()
-    map_collection = get_map_collection()
-    # Always ensure text index exists
-    products_collection.create_index([("name", "text")])
+    seed_state_collection = get_seed_state_collection()
 
-    # Clear collections before reseeding
-    products_collection.delete_many({})
-    map_collection.delete_many({})
-
-    # Reseed products
-    initial_products = generate_products(20)
-    print("Seeding database with mock products...")
-    products_collection.insert_many(initial_products)
-    print("Database seeded.")
+    store_id = settings.DEFAULT_STORE_ID
+    initial_products = [{**product, "store_id": store_id} for product in generate_products(20)]
+    map_image = load_map_image()
+    fingerprint = seed_fingerprint(initial_products, map_image)
+    state = seed_state_collection.find_one({"_id": "development"}) or {}
+    if state.get("fingerprint") == fingerprint and products_collection.estimated_document_count():
+        logger.info("Seed data unchanged, skipping seeding")
+        return
 
-    # Seed default_map.png
-    default_map_path = os.path.join(os.path.dirname(__file__), "default_map.png")
-    with open(default_map_path, "rb") as f:
-        image_bytes = f.read()
-    map_doc = {"name": "mall_map", "image": image_bytes, "content_type": "image/png"}
-    map_collection.insert_one(map_doc)
-    print("Seeded mall map image from default_map.png.")
\ No newline at end of file
+    logger.info("Seeding database with mock products")
+    products_collection.bulk_write(
+        [
+            UpdateOne({"store_id": store_id, "id": product["id"]}, {"$set": product}, upsert=True)
+            for product in initial_products
+        ],
+        ordered=False,
+    )
+    get_map_collection().update_one(
+        {"store_id": store_id, "name": "mall_map"},
+        {"$set": {"image": map_image, "content_type": "image/png"}},
+        upsert=True,
+    )
+    # Demo cards are only added if missing, so changes made through the API survive
+    get_cards_collection().bulk_write(
+        [
+            UpdateOne(
+                {"card_id": card_id},
+                {"$setOnInsert": {"card_id": card_id, "user_identity": None, "status": "active", "expires_at": None}},
+                upsert=True,
+            )
+            for card_id in DEMO_CARD_IDS
+        ],
+        ordered=False,
+    )
+    seed_state_collection.update_one(
+        {"_id": "development"},
+        {"$set": {"fingerprint": fingerprint, "seeded_at": datetime.utcnow()}},
+        upsert=True,
+    )
+    logger.info("Database seeded")
@@ -0,0 +1,53 @@
+# backend/gunicorn.conf.py
+"""
+Production server: gunicorn managing uvicorn workers.
+
+    python -m gunicorn -c backend/gunicorn.conf.py backend.app:app
+
+Run it as a module from the directory containing backend/, so that this file
+can import backend.config.
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, so they share its memory pages and start fast. Anything that
+must not cross fork() is created lazily in the worker: the MongoDB client, the
+password hashing pool, Redis connections, and the lifespan's listeners, log
+writer and startup tasks. One worker per CPU core by default (WEB_CONCURRENCY).
+
+On SIGTERM the master stops accepting connections and each worker finishes
+its in-flight requests, closes idle keep-alive connections and runs the
+lifespan shutdown, for up to GRACEFUL_TIMEOUT_SECONDS before it is killed.
+
+With more than one worker, set PROMETHEUS_MULTIPROC_DIR (see metrics.py); the
+master empties it on start and drops the samples of workers that exit.
+"""
+import os
+import shutil
+
+from backend.config import settings
+
+def available_cores() -> int:
+    # Honours CPU affinity (e.g. docker --cpuset-cpus), unlike os.cpu_count()
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{settings.PORT}"
+workers = settings.WEB_CONCURRENCY or available_cores()
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+graceful_timeout = settings.GRACEFUL_TIMEOUT_SECONDS
+# The client (the cart, or a load balancer) reuses connections between requests
+keepalive = 5
+accesslog = None
+
+def on_starting(server):
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        # Samples from a previous run would be added to this one's
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,130 @@
+# backend/hashing.py
+"""
+Password hashing off the request threadpool.
+
+bcrypt runs in a small, dedicated process pool, so a burst of logins neither
+holds the GIL nor takes up FastAPI's shared threadpool. Admission is bounded:
+once PASSWORD_HASH_WORKERS jobs are running and PASSWORD_HASH_QUEUE_LIMIT more
+are waiting, new requests are turned away with 503 at once instead of queueing
+behind the burst.
+
+The bcrypt cost comes from PASSWORD_HASH_ROUNDS. Pick it for the hardware with
+    python -m backend.hashing [target_ms]
+Stored hashes with a different cost are rehashed on the user's next login, so
+the setting can be moved in either direction without password resets.
+"""
+import asyncio
+import functools
+import multiprocessing
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from .config import settings
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+def make_context(rounds: int) -> "CryptContext":
+    # passlib is only needed where hashes are computed, i.e. in the pool's processes
+    from passlib.context import CryptContext
+    # min == max == default, so needs_update() flags any hash with another cost
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_pwd_context() -> "CryptContext":
+    return make_context(settings.PASSWORD_HASH_ROUNDS)
+
+# Run in the pool's worker processes
+def _hash_password(password: str) -> str:
+    return get_pwd_context().hash(password)
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return get_pwd_context().verify_and_update(password, hashed_password)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_LIMIT)
+
+def get_executor() -> ProcessPoolExecutor:
+    """Creates the pool on first use, i.e. after the server has forked its workers."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+async def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins in progress. Please try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await asyncio.wrap_future(get_executor().submit(fn, *args))
+    finally:
+        _slots.release()
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash_password, password)
+
+async def verify_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Checks a password. Also returns a new hash when the stored one was made
+    with a different cost (else None); the caller should store it.
+    """
+    return await _run(_verify_and_update, password, hashed_password)
+
+# --- Calibration ---
+
+def time_rounds(rounds: int, samples: int = 5) -> float:
+    """Median seconds to hash one password at the given bcrypt cost on this machine."""
+    context = make_context(rounds)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("calibration-password")
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def calibrate_rounds(target_ms: float, min_rounds: int = 10, max_rounds: int = 16) -> int:
+    """
+    Returns the highest bcrypt cost whose hash time stays within target_ms.
+    Each extra round doubles the work, so it stops at the first one over budget.
+    """
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        elapsed_ms = time_rounds(rounds) * 1000
+        print(f"rounds={rounds:<3} {elapsed_ms:8.1f} ms")
+        if elapsed_ms > target_ms:
+            break
+        chosen = rounds
+    return chosen
+
+if __name__ == "__main__":
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 250.0
+    rounds = calibrate_rounds(target_ms)
+    print(f"Target {target_ms:.0f} ms per hash. Set in .env:")
+    print(f"PASSWORD_HASH_ROUNDS={rounds}")
@@ -0,0 +1,64 @@
+# backend/health.py
+"""
+Liveness and readiness probes, and the startup work readiness waits for.
+
+Index creation and development seeding run on a background thread, so the
+server starts accepting connections right away. /healthz answers as soon as
+the process is up. /readyz answers 503 until that startup work has finished
+and MongoDB and Redis both respond, so a load balancer only sends traffic to
+instances that can serve it.
+"""
+import logging
+import threading
+import time
+
+from fastapi import APIRouter, HTTPException, status
+
+from .database import ensure_indexes, get_client, migrate_to_stores, seed_database_if_empty
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+STARTUP_RETRY_SECONDS = 5
+
+startup_complete = threading.Event()
+
+router = APIRouter(tags=["Health"])
+
+def run_startup_tasks():
+    """Migrates, ensures indexes and seeds the database, retrying until MongoDB is reachable."""
+    while True:
+        try:
+            started = time.perf_counter()
+            migrate_to_stores()
+            ensure_indexes()
+            seed_database_if_empty()
+            startup_complete.set()
+            logger.info("Startup tasks finished", extra={"duration_ms": round((time.perf_counter() - started) * 1000)})
+            return
+        except Exception:
+            logger.exception("Startup tasks failed, retrying", extra={"retry_in_seconds": STARTUP_RETRY_SECONDS})
+            time.sleep(STARTUP_RETRY_SECONDS)
+
+def start_startup_tasks():
+    threading.Thread(target=run_startup_tasks, name="startup-tasks", daemon=True).start()
+
+@router.get('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@router.get('/readyz')
+def readyz():
+    """Readiness: startup work is done and MongoDB and Redis respond."""
+    if not startup_complete.is_set():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Startup tasks still running")
+    try:
+        get_client().admin.command("ping")
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="MongoDB unavailable")
+    try:
+        get_redis().ping()
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Redis unavailable")
+    return {"status": "ready"}
@@ -0,0 +1,218 @@
+# backend/loadtest/fleet.py
+"""
+Simulates a fleet of shopping carts against a running backend and reports
+per-endpoint latency percentiles and throughput.
+
+Each cart repeats a realistic session until the test ends: guest or card
+login, catalog fetch, a few barcode scans and map searches, checkout, status
+polling, a signed payment webhook, then polling until the order is settled.
+Carts start spread evenly over the ramp period and pause for a randomised
+think time between steps, like a shopper would.
+
+Start the backend with VIETQR_API_URL pointing at the stub (see vietqr_stub.py),
+and raise GUEST_LOGIN_RATE_LIMIT_PER_MINUTE, CARD_LOGIN_IP_RATE_LIMIT_PER_MINUTE
+and CARD_LOGIN_RATE_LIMIT_PER_MINUTE, or logins will be throttled with 429. Then run:
+
+    python -m backend.loadtest.fleet --base-url http://localhost:5001 --carts 50 --ramp 30 --duration 120
+
+Pass --store-id to run the carts against one store (sent as X-Store-ID);
+otherwise they use the default store.
+
+Seeded stock runs out under sustained load. Checkouts then answer 409, which
+is reported per status code like everything else.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from ..config import settings
+from ..models import OrderStatus
+from ..stores import STORE_HEADER
+
+MAP_QUERIES = ["apple", "milk", "bread", "coffee", "rice", "cheese", "ps4", "juice"]
+SETTLED_STATUSES = {OrderStatus.COMPLETED.value, OrderStatus.FAILED.value}
+
+class Recorder:
+    """Collects latency and status code per endpoint (method plus path template)."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.sessions_completed = 0
+        self.started = time.perf_counter()
+
+    async def request(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.latencies[name].append(time.perf_counter() - started)
+            self.statuses[name][type(e).__name__] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - started)
+        self.statuses[name][response.status_code] += 1
+        return response
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        total = sum(len(samples) for samples in self.latencies.values())
+        print(f"\n{'endpoint':<42} {'count':>7} {'req/s':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+        for name in sorted(self.latencies):
+            samples = sorted(self.latencies[name])
+            statuses = ", ".join(f"{code}:{count}" for code, count in sorted(self.statuses[name].items(), key=str))
+            print(
+                f"{name:<42} {len(samples):>7} {len(samples) / elapsed:>7.1f} "
+                f"{percentile(samples, 50):>8.1f} {percentile(samples, 90):>8.1f} "
+                f"{percentile(samples, 99):>8.1f} {samples[-1] * 1000:>8.1f}  {statuses}"
+            )
+        print(f"\n{total} requests in {elapsed:.1f} s ({total / elapsed:.1f} req/s), "
+              f"{self.sessions_completed} cart sessions completed")
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile, in milliseconds."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[rank] * 1000
+
+def webhook_payload(order_id: str, amount: int, secret: str) -> dict:
+    payload = {
+        "paymentRequestId": uuid.uuid4().hex,
+        "state": "SUCCESS",
+        "amount": amount,
+        "description": f"Thanh toan don hang {order_id}",
+        "referenceId": order_id,
+        "merchantId": "loadtest",
+        "extraData": "",
+    }
+    # Same fields, same order as generate_vietqr_webhook_signature in orders/routes.py
+    signed = f"{payload['paymentRequestId']}{payload['state']}{payload['amount']}{payload['referenceId']}{payload['extraData']}"
+    payload["signature"] = hmac.new(secret.encode(), signed.encode(), hashlib.sha256).hexdigest()
+    return payload
+
+class Cart:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, args: argparse.Namespace):
+        self.client = client
+        self.recorder = recorder
+        self.args = args
+
+    async def think(self):
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.args.think_time)
+
+    async def login(self) -> Optional[Dict[str, str]]:
+        if self.args.card_ids and random.random() < self.args.card_share:
+            response = await self.recorder.request(
+                self.client, "POST /api/auth/card_login", "POST", "/api/auth/card_login",
+                json={"card_id": random.choice(self.args.card_ids)},
+            )
+        else:
+            response = await self.recorder.request(self.client, "POST /api/auth/guest_login", "POST", "/api/auth/guest_login")
+        if response is None or response.status_code != 200:
+            return None
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def session(self):
+        headers = await self.login()
+        if headers is None:
+            return
+        await self.think()
+
+        response = await self.recorder.request(self.client, "GET /api/products", "GET", "/api/products")
+        if response is None or response.status_code != 200 or not response.json():
+            return
+        catalog = response.json()
+
+        cart = []
+        for product in random.sample(catalog, min(len(catalog), random.randint(1, self.args.max_items))):
+            await self.think()
+            if product.get("barcode"):
+                await self.recorder.request(
+                    self.client, "GET /api/products/barcode/{barcode}", "GET", f"/api/products/barcode/{product['barcode']}",
+                )
+            else:
+                await self.recorder.request(self.client, "GET /api/products/{id}", "GET", f"/api/products/{product['id']}")
+            cart.append({**product, "quantity": 1})
+            if random.random() < self.args.map_search_share:
+                await self.recorder.request(
+                    self.client, "GET /api/map/search", "GET", "/api/map/search", params={"q": random.choice(MAP_QUERIES)},
+                )
+
+        await self.think()
+        subtotal = sum(item["price"] for item in cart)
+        response = await self.recorder.request(
+            self.client, "POST /api/orders/checkout", "POST", "/api/orders/checkout", headers=headers,
+            json={"items": cart, "shipping_cost": 0, "subtotal": subtotal, "total_cost": subtotal},
+        )
+        if response is None or response.status_code != 200:
+            return
+        order_id = response.json()["order_id"]
+
+        # The shopper scans the QR code and pays while the cart polls
+        for _ in range(random.randint(1, 3)):
+            await asyncio.sleep(self.args.poll_interval)
+            await self.poll_status(order_id)
+        await self.recorder.request(
+            self.client, "POST /api/orders/webhook/payment_confirmation", "POST", "/api/orders/webhook/payment_confirmation",
+            json=webhook_payload(order_id, int(subtotal), self.args.webhook_secret),
+        )
+        deadline = time.monotonic() + self.args.settle_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            if await self.poll_status(order_id) in SETTLED_STATUSES:
+                break
+        self.recorder.sessions_completed += 1
+
+    async def poll_status(self, order_id: str) -> Optional[str]:
+        response = await self.recorder.request(
+            self.client, "GET /api/orders/{order_id}/status", "GET", f"/api/orders/{order_id}/status",
+        )
+        if response is None or response.status_code != 200:
+            return None
+        return response.json()["status"]
+
+    async def run(self, start_delay: float, deadline: float):
+        await asyncio.sleep(start_delay)
+        while time.monotonic() < deadline:
+            await self.session()
+            await self.think()
+
+async def run_fleet(args: argparse.Namespace) -> Recorder:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.carts, max_keepalive_connections=args.carts)
+    headers = {STORE_HEADER: args.store_id} if args.store_id else {}
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout, headers=headers) as client:
+        deadline = time.monotonic() + args.duration
+        step = args.ramp / args.carts if args.carts else 0
+        await asyncio.gather(*(
+            Cart(client, recorder, args).run(i * step, deadline) for i in range(args.carts)
+        ))
+    return recorder
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulate a fleet of shopping carts against the backend.")
+    parser.add_argument("--base-url", default="http://localhost:5001")
+    parser.add_argument("--carts", type=int, default=20, help="Concurrent carts")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Seconds over which carts start")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds before carts stop starting new sessions")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between a shopper's steps, in seconds")
+    parser.add_argument("--max-items", type=int, default=5, help="Most products scanned per session")
+    parser.add_argument("--map-search-share", type=float, default=0.3, help="Share of scans followed by a map search")
+    parser.add_argument("--card-ids", nargs="*", default=["CARD123", "GUEST456", "TEMP789"])
+    parser.add_argument("--card-share", type=float, default=0.5, help="Share of sessions that log in with a card")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--settle-timeout", type=float, default=15.0, help="How long to poll for a paid order to complete")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds")
+    parser.add_argument("--store-id", default=None, help="Store the carts belong to (default: the server's default store)")
+    parser.add_argument("--webhook-secret", default=settings.VIETQR_WEBHOOK_SECRET_KEY)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(run_fleet(parse_args())).report()
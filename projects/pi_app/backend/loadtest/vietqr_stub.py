@@ -0,0 +1,29 @@
+# backend/loadtest/vietqr_stub.py
+"""
+A stand-in for the VietQR generate API, so load tests never call the real
+service. Point the backend at it with VIETQR_API_URL=http://<host>:8090/v2/generate.
+
+Run with: uvicorn backend.loadtest.vietqr_stub:app --port 8090
+Set STUB_LATENCY_MS to simulate the real API's response time.
+"""
+import asyncio
+import os
+
+from fastapi import FastAPI
+
+from ..models import VietQRGenerateRequest, VietQRGenerateResponse, VietQRGenerateResponseData
+
+LATENCY_SECONDS = float(os.environ.get("STUB_LATENCY_MS", "0")) / 1000
+
+app = FastAPI(title="VietQR stub")
+
+@app.post('/v2/generate', response_model=VietQRGenerateResponse)
+async def generate(request: VietQRGenerateRequest):
+    if LATENCY_SECONDS:
+        await asyncio.sleep(LATENCY_SECONDS)
+    qr_code = f"00020101021238540010A000000727{request.acqId}{request.accountNo}{request.amount}{request.addInfo}"
+    return VietQRGenerateResponse(
+        code="00",
+        desc="Gen VietQR successful!",
+        data=VietQRGenerateResponseData(qrCode=qr_code, qrDataURL=""),
+    )
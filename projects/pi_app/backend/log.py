@@ -0,0 +1,160 @@
+# backend/log.py
+"""
+Structured, non-blocking logging.
+
+Records are formatted as one JSON object per line in the calling thread and
+put on a bounded in-memory queue. A QueueListener thread writes them to stdout.
+If stdout can't keep up and the queue fills, records are dropped and counted
+instead of blocking the request or task that logged them.
+
+High-frequency events can pass `extra={"sample_rate": 0.01}` to keep only that
+share of them. Each API request gets a request ID (taken from X-Request-ID or
+generated), which is attached to every record and carried into Celery tasks
+published while handling it. Checkout also stores it on the order as
+`request_id`, since a paid order reaches inventory processing through the
+watcher rather than through a task the request published; the watcher and
+the inventory tasks log each order's work under that ID (see bound_request_id).
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+
+from celery.signals import before_task_publish, setup_logging as celery_setup_logging, task_postrun, task_prerun
+
+from .config import settings
+
+if TYPE_CHECKING:
+    from fastapi import Request
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+@contextlib.contextmanager
+def bound_request_id(request_id: Optional[str]):
+    """Logs the block under the given request ID, e.g. one stored on an order. None keeps the current one."""
+    if request_id is None:
+        yield
+        return
+    token = request_id_var.set(request_id)
+    try:
+        yield
+    finally:
+        request_id_var.reset(token)
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sample_rate"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class ContextFilter(logging.Filter):
+    """Stamps the current request ID and applies per-record sampling."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample_rate = getattr(record, "sample_rate", None)
+        if sample_rate is not None and random.random() >= sample_rate:
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+def setup_logging():
+    """Routes the root logger through the queue. Safe to call more than once."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.setFormatter(JsonFormatter())
+
+        # The record already carries the JSON line by the time it reaches stdout
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter("%(message)s"))
+
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(settings.LOG_LEVEL)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+
+def shutdown_logging():
+    """Flushes what is queued and stops the writer thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+# --- FastAPI ---
+
+async def request_id_middleware(request: "Request", call_next):
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+# --- Celery ---
+
+@celery_setup_logging.connect
+def _setup_worker_logging(**kwargs):
+    # Connecting this signal also stops Celery from installing its own handlers
+    setup_logging()
+
+@before_task_publish.connect
+def _attach_request_id(headers=None, **kwargs):
+    request_id = request_id_var.get()
+    if request_id and headers is not None:
+        headers.setdefault("request_id", request_id)
+
+@task_prerun.connect
+def _restore_request_id(task=None, **kwargs):
+    request_id_var.set(task.request.get("request_id") if task is not None else None)
+
+@task_postrun.connect
+def _clear_request_id(**kwargs):
+    request_id_var.set(None)
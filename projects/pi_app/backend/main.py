@@ -1,4 +1,5 @@
 import uvicorn
-from . import app
+from .app import app
+# Development server with auto-reload; production runs gunicorn (see gunicorn.conf.py)
 if __name__ == '__main__':
-    uvicorn.run("backend.main:app", host="0.0.0.0", port=5000, reload=True)
\ No newline at end of file
+    uvicorn.run("backend.app:app", host="0.0.0.0", port=5000, reload=True)
\ No newline at end of file
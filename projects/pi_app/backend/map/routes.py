@@ -1,11 +1,12 @@
 # backend/map/routes.py
 from fastapi import APIRouter, Query, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
 from pymongo.collection import Collection
 from typing import List, Optional
-from io import BytesIO
 from bson.binary import Binary
 from ..database import get_products_collection, get_map_collection
+from ..responses import PNGCoder, cache_response
+from ..stores import store_from_header, store_key_builder
 
 router = APIRouter(
     prefix="/api/map",
@@ -13,28 +14,32 @@ router = APIRouter(
 )
 
 @router.get("/search", response_model=List[str])
+@cache_response(expire=60, key_builder=store_key_builder)
 async def search_products(
     q: str = Query(..., min_length=1, description="Product search query"),
+    store_id: str = Depends(store_from_header),
     products_collection: Collection = Depends(get_products_collection),
 ):
     """Return product name suggestions based on text search."""
-    # MongoDB text search (ensure text index on 'name')
-    results = products_collection.find({"$text": {"$search": q}}, {"name": 1, "_id": 0})
+    # MongoDB text search (the text index is prefixed by store_id, so the store must be matched exactly)
+    results = products_collection.find({"store_id": store_id, "$text": {"$search": q}}, {"name": 1, "_id": 0})
     names = [doc["name"] for doc in results]
     if not names:
         # fallback: partial match
-        results = products_collection.find({"name": {"$regex": q, "$options": "i"}}, {"name": 1, "_id": 0})
+        results = products_collection.find({"store_id": store_id, "name": {"$regex": q, "$options": "i"}}, {"name": 1, "_id": 0})
         names = [doc["name"] for doc in results]
     return names
 
 @router.get("/location")
+@cache_response(expire=60, key_builder=store_key_builder)
 async def get_product_location(
     name: str = Query(..., description="Product name"),
+    store_id: str = Depends(store_from_header),
     products_collection: Collection = Depends(get_products_collection),
 ):
     """Return product location(s) and details. Case-insensitive name match."""
     # Use case-insensitive exact match for name
-    product = products_collection.find_one({"name": {"$regex": f"^{name}$", "$options": "i"}}, {"location": 1, "name": 1, "subtitle": 1, "price": 1, "currency": 1, "quantity": 1, "unit": 1, "product_img_url": 1, "_id": 0})
+    product = products_collection.find_one({"store_id": store_id, "name": {"$regex": f"^{name}$", "$options": "i"}}, {"location": 1, "name": 1, "subtitle": 1, "price": 1, "currency": 1, "quantity": 1, "unit": 1, "product_img_url": 1, "_id": 0})
     if not product or "location" not in product:
         raise HTTPException(status_code=404, detail="Product or location not found")
     # Ensure location is always a list
@@ -44,10 +49,10 @@ async def get_product_location(
     return product
 
 @router.get("/map_image")
-async def get_map_image(map_collection=Depends(get_map_collection)):
-    """Return the shopping mall map image from MongoDB."""
-    map_doc = map_collection.find_one({"name": "mall_map"})
+@cache_response(expire=600, key_builder=store_key_builder, coder=PNGCoder)
+async def get_map_image(store_id: str = Depends(store_from_header), map_collection=Depends(get_map_collection)):
+    """Return the store's shopping mall map image from MongoDB."""
+    map_doc = map_collection.find_one({"store_id": store_id, "name": "mall_map"})
     if not map_doc or "image" not in map_doc:
         raise HTTPException(status_code=404, detail="Map image not found")
-    image_bytes = map_doc["image"]
-    return StreamingResponse(BytesIO(image_bytes), media_type="image/png")
+    return Response(content=bytes(map_doc["image"]), media_type="image/png")
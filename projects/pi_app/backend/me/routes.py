@@ -20,8 +20,8 @@ def update_user_status_and_extend_jwt(
     and returns a new JWT with an extended expiration and the status included.
     """
     # Prepare new claims for the extended token.
-    # It's crucial to preserve existing important claims like 'role'.
-    new_claims = {"sub": current_user.identity, "role": current_user.role}
+    # It's crucial to preserve existing important claims like 'role' and 'store'.
+    new_claims = {"sub": current_user.identity, "role": current_user.role, "store": current_user.store_id}
     
     # Add the new status data under a specific key, e.g., 'client_status'
     new_claims["client_status"] = status_data
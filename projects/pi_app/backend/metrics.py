@@ -0,0 +1,164 @@
+# backend/metrics.py
+"""
+Prometheus metrics for the API, MongoDB, the response cache and Celery tasks.
+
+The API serves them on /metrics. A Celery worker serves its own on
+WORKER_METRICS_PORT. When PROMETHEUS_MULTIPROC_DIR is set (needed with several
+uvicorn workers or Celery's prefork pool), each process writes its samples
+there and they are aggregated at scrape time.
+"""
+import logging
+import os
+import threading
+import time
+
+from celery.signals import task_failure, task_postrun, task_prerun, worker_ready
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+from typing import TYPE_CHECKING
+
+from .config import settings
+
+if TYPE_CHECKING:
+    # The worker imports this module for its task metrics; it has no use for the web stack
+    from fastapi import Request, Response
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "API request latency.",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "API requests currently being handled.",
+    # No route: it is only known once the router has matched the request
+    ["method"],
+    multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "fastapi-cache lookups on cached routes, by result.",
+    ["route", "result"],
+)
+RESPONSE_CACHE_TIER_LOOKUPS = Counter(
+    "response_cache_tier_lookups_total",
+    "Response cache lookups per tier (l1: in-process, l2: Redis), by result.",
+    ["tier", "result"],
+)
+RESPONSE_CACHE_L1_BYTES = Gauge(
+    "response_cache_l1_bytes",
+    "Bytes held in the in-process response caches.",
+    multiprocess_mode="livesum",
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency as reported by the driver.",
+    ["command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task run time.",
+    ["task", "state"],
+)
+CELERY_TASK_FAILURES = Counter(
+    "celery_task_failures_total",
+    "Celery tasks that raised.",
+    ["task", "exception"],
+)
+
+def metrics_registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+def metrics_endpoint() -> "Response":
+    from fastapi import Response
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+# --- API ---
+
+def _route_template(request: "Request") -> str:
+    """
+    The matched route's path template, so /api/products/7 is counted as
+    /api/products/{product_id}. The router stores the route in the scope, so
+    this only works once the request has been handled.
+    """
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+async def prometheus_middleware(request: "Request", call_next):
+    if request.url.path == "/metrics":
+        return await call_next(request)
+
+    in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(request.method)
+    in_progress.inc()
+    started = time.perf_counter()
+    response = None
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        route = _route_template(request)
+        status_code = response.status_code if response is not None else 500
+        HTTP_REQUEST_DURATION.labels(request.method, route, str(status_code)).observe(time.perf_counter() - started)
+        cache_status = response.headers.get("X-FastAPI-Cache") if response is not None else None
+        if cache_status:
+            CACHE_REQUESTS.labels(route, cache_status.lower()).inc()
+        in_progress.dec()
+
+# --- MongoDB ---
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Records every driver command's duration. Pass to MongoClient(event_listeners=[...])."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.labels(event.command_name, "success").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_DURATION.labels(event.command_name, "failure").observe(event.duration_micros / 1e6)
+
+mongo_command_listener = CommandMetricsListener()
+
+# --- Celery ---
+
+_task_started = {}
+_task_started_lock = threading.Lock()
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, **kwargs):
+    with _task_started_lock:
+        _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    with _task_started_lock:
+        started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+@task_failure.connect
+def _on_task_failure(sender=None, exception=None, **kwargs):
+    CELERY_TASK_FAILURES.labels(sender.name, type(exception).__name__).inc()
+
+@worker_ready.connect
+def _start_worker_metrics_server(**kwargs):
+    start_http_server(settings.WORKER_METRICS_PORT, registry=metrics_registry())
+    logger.info("Serving worker metrics", extra={"port": settings.WORKER_METRICS_PORT})
@@ -1,10 +1,11 @@
 # models.py
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from enum import Enum
-from decimal import Decimal
 from pydantic import BaseModel, Field, model_validator, EmailStr
 from datetime import datetime
 
+from .pricing import from_minor_units, to_minor_units
+
 
 # This model represents the core, shared data of a product
 class ProductBase(BaseModel):
@@ -69,12 +70,51 @@ class User(BaseModel):
     email: EmailStr
     hashed_password: str
     role: Role = Role.SHOP_CLIENT
+    store_ids: Optional[List[str]] = Field(
+        default=None, description="Stores the account may log in at. None means any store, except for admins."
+    )
 
 
 class CardLogin(BaseModel):
     card_id: str = Field(..., min_length=4, max_length=16)  # Example length constraints
 
 
+# --- Card Registry Models ---
+
+
+class CardStatus(str, Enum):
+    ACTIVE = "active"
+    BLOCKED = "blocked"
+
+
+class Card(BaseModel):
+    card_id: str = Field(..., min_length=4, max_length=16)
+    user_identity: Optional[str] = Field(
+        default=None, description="Account the card logs in as. Unlinked cards log in as themselves."
+    )
+    status: CardStatus = CardStatus.ACTIVE
+    expires_at: Optional[datetime] = None
+    store_ids: Optional[List[str]] = Field(
+        default=None, description="Stores the card is accepted at. None means any store."
+    )
+
+
+class CardUpdate(BaseModel):
+    user_identity: Optional[str] = None
+    status: Optional[CardStatus] = None
+    expires_at: Optional[datetime] = None
+    store_ids: Optional[List[str]] = None
+
+
+class CardBatchCreate(BaseModel):
+    cards: List[Card] = Field(..., min_length=1, max_length=1000)
+
+
+class CardBatchResult(BaseModel):
+    created: int
+    updated: int
+
+
 # --- Order History Models ---
 
 
@@ -98,26 +138,22 @@ class CheckoutPayload(BaseModel):
         """
         Validates that the subtotal and total_cost sent by the client are correct.
         This is a security measure to prevent price manipulation from the client-side.
+        The item prices themselves are checked against the catalog at checkout (see pricing.py).
         """
-        # Use Decimal for precision with currency to avoid floating point errors
+        # Compare in integer minor units so the sums are exact and cheap
         calculated_subtotal = sum(
-            Decimal(str(item.price)) * Decimal(item.quantity) for item in self.items
+            to_minor_units(item.price) * item.quantity for item in self.items
         )
-        calculated_total = calculated_subtotal + Decimal(str(self.shipping_cost))
+        calculated_total = calculated_subtotal + to_minor_units(self.shipping_cost)
 
-        # Compare with a small tolerance for floating point inaccuracies
-        if not abs(Decimal(str(self.subtotal)) - calculated_subtotal) < Decimal(
-            "0.01"
-        ):
+        if to_minor_units(self.subtotal) != calculated_subtotal:
             raise ValueError(
-                f"Subtotal mismatch. Client sent {self.subtotal}, server calculated {calculated_subtotal:.2f}"
+                f"Subtotal mismatch. Client sent {self.subtotal}, server calculated {from_minor_units(calculated_subtotal):.2f}"
             )
 
-        if not abs(Decimal(str(self.total_cost)) - calculated_total) < Decimal(
-            "0.01"
-        ):
+        if to_minor_units(self.total_cost) != calculated_total:
             raise ValueError(
-                f"Total cost mismatch. Client sent {self.total_cost}, server calculated {calculated_total:.2f}"
+                f"Total cost mismatch. Client sent {self.total_cost}, server calculated {from_minor_units(calculated_total):.2f}"
             )
 
         return self
@@ -128,8 +164,29 @@ class OrderHistoryItem(CheckoutPayload):
 
     order_id: str
     user_identity: str
+    store_id: str
     created_at: datetime
     status: OrderStatus = OrderStatus.PENDING
+    expires_at: Optional[datetime] = Field(
+        default=None, description="When an unpaid (pending) order is abandoned. Cleared once paid."
+    )
+
+
+class OrderHistoryRecord(BaseModel):
+    """
+    Read-only view of a stored order, used when listing order history.
+    Stored orders were already validated at checkout, so this model does not
+    re-run the totals check or re-validate every line item as a Product.
+    """
+
+    order_id: str
+    user_identity: str
+    created_at: datetime
+    status: OrderStatus
+    items: List[Dict[str, Any]]
+    shipping_cost: float
+    subtotal: float
+    total_cost: float
 
 
 class OrderStatusResponse(BaseModel):
@@ -0,0 +1,131 @@
+# backend/orders/archive.py
+"""
+Hot/cold tiers for order history.
+
+Recent orders live in order_history (the hot tier). Finished orders older
+than ORDER_HOT_RETENTION_DAYS are moved by archive_old_orders into one
+collection per month, e.g. order_archive_2024_05 (the cold tier). The
+order_archive_index collection records which months hold orders for each
+user in each store, so history reads only open the archive collections they need.
+"""
+import logging
+from celery import shared_task
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, UpdateOne, collection, database
+from pymongo.errors import BulkWriteError
+from typing import Dict, List, Optional
+
+from ..config import settings
+from ..models import OrderStatus
+from .tasks import get_db_client
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "order_archive_"
+ARCHIVE_INDEX = "order_archive_index"
+# Server error code for a duplicate key; archived orders are re-inserted after a crash.
+DUPLICATE_KEY = 11000
+
+def archive_collection_name(created_at: datetime) -> str:
+    return f"{ARCHIVE_PREFIX}{created_at.year:04d}_{created_at.month:02d}"
+
+def get_archive_collection(db: database.Database, name: str) -> collection.Collection:
+    """Returns a monthly archive collection, making sure its indexes exist."""
+    archive = db[name]
+    archive.create_index([("order_id", ASCENDING)], unique=True)
+    archive.create_index([("store_id", ASCENDING), ("user_identity", ASCENDING), ("created_at", DESCENDING)])
+    return archive
+
+def archive_orders(db: database.Database, cutoff: datetime, batch_size: int = 1000) -> int:
+    """
+    Moves up to batch_size finished orders created before cutoff into their
+    monthly archive collections. Safe to re-run: orders are copied first and
+    removed from the hot tier only afterwards.
+    """
+    orders_collection = db["order_history"]
+    old_orders = list(orders_collection.find(
+        {
+            "created_at": {"$lt": cutoff},
+            "status": {"$in": [OrderStatus.COMPLETED, OrderStatus.FAILED]},
+            "abandoned_at": {"$exists": False},
+        },
+        {"_id": 0},
+    ).limit(batch_size))
+    if not old_orders:
+        return 0
+
+    by_month: Dict[str, List[dict]] = {}
+    for order in old_orders:
+        by_month.setdefault(archive_collection_name(order["created_at"]), []).append(order)
+
+    for name, orders in by_month.items():
+        try:
+            get_archive_collection(db, name).insert_many(orders, ordered=False)
+        except BulkWriteError as e:
+            if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+                raise
+        db[ARCHIVE_INDEX].bulk_write([
+            UpdateOne(
+                {"store_id": store_id, "user_identity": user_identity, "month": name},
+                {"$setOnInsert": {"store_id": store_id, "user_identity": user_identity, "month": name}},
+                upsert=True,
+            )
+            for store_id, user_identity in {(order["store_id"], order["user_identity"]) for order in orders}
+        ])
+
+    orders_collection.delete_many({"order_id": {"$in": [order["order_id"] for order in old_orders]}})
+    return len(old_orders)
+
+def find_order_history(
+    orders_collection: collection.Collection,
+    store_id: str,
+    user_identity: str,
+    limit: Optional[int] = None,
+    projection: Optional[dict] = None,
+) -> List[dict]:
+    """
+    Returns a user's orders in a store, newest first, from the hot tier and then
+    the archive. Archive months are only read if the hot tier doesn't fill the limit.
+    Pending orders and abandoned checkouts (never paid) are left out.
+    """
+    projection = projection or {"_id": 0}
+    history = list(orders_collection.find(
+        {
+            "store_id": store_id,
+            "user_identity": user_identity,
+            "status": {"$ne": OrderStatus.PENDING},
+            "abandoned_at": {"$exists": False},
+        },
+        projection,
+        limit=limit or 0,
+    ).sort("created_at", DESCENDING))
+    if limit is not None and len(history) >= limit:
+        return history
+
+    db = orders_collection.database
+    months = sorted(
+        (doc["month"] for doc in db[ARCHIVE_INDEX].find(
+            {"store_id": store_id, "user_identity": user_identity}, {"_id": 0, "month": 1},
+        )),
+        reverse=True,
+    )
+    for month in months:
+        remaining = limit - len(history) if limit is not None else 0
+        history.extend(db[month].find(
+            {"store_id": store_id, "user_identity": user_identity}, projection, limit=remaining,
+        ).sort("created_at", DESCENDING))
+        if limit is not None and len(history) >= limit:
+            break
+    return history
+
+@shared_task
+def archive_old_orders(batch_size: int = 1000):
+    """Periodic task: moves finished orders out of the hot tier once they are old enough."""
+    db = get_db_client()["shopping_cart_db"]
+    cutoff = datetime.utcnow() - timedelta(days=settings.ORDER_HOT_RETENTION_DAYS)
+    archived = archive_orders(db, cutoff, batch_size)
+    if archived:
+        logger.info("Archived old orders", extra={"count": archived, "cutoff": f"{cutoff:%Y-%m-%d}"})
+    if archived == batch_size:
+        archive_old_orders.delay(batch_size)
+    return archived
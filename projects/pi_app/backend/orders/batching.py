@@ -0,0 +1,78 @@
+# backend/orders/batching.py
+from celery import shared_task
+from datetime import datetime, timedelta
+from typing import List, Optional
+import logging
+
+from ..config import settings
+from ..models import OrderStatus
+from ..redis_client import get_redis
+from .tasks import get_db_client, process_order_batch
+
+logger = logging.getLogger(__name__)
+
+# Paid orders waiting for inventory processing. The list is drained by
+# flush_order_batch, which hands each drained chunk to process_order_batch.
+BATCH_KEY = "orders:inventory_batch"
+
+def submit_paid_order(order_id: str):
+    """
+    Queues a paid order for batched inventory processing.
+    The first order in an empty buffer schedules a flush after the batch window;
+    a full buffer is flushed right away.
+    """
+    buffered = get_redis().rpush(BATCH_KEY, order_id)
+    if buffered == 1:
+        flush_order_batch.apply_async(countdown=settings.INVENTORY_BATCH_WINDOW_MS / 1000)
+    elif buffered == settings.INVENTORY_BATCH_MAX_ORDERS:
+        flush_order_batch.delay()
+
+def drain_batch(max_orders: int) -> List[str]:
+    """Atomically pops up to max_orders buffered order IDs, oldest first."""
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.lrange(BATCH_KEY, 0, max_orders - 1)
+    pipe.ltrim(BATCH_KEY, max_orders, -1)
+    pipe.llen(BATCH_KEY)
+    order_ids, _, remaining = pipe.execute()
+    if remaining:
+        # Anything left over arrived while this batch was full; don't leave it waiting.
+        flush_order_batch.delay()
+    return [order_id.decode() for order_id in order_ids]
+
+def catch_up(orders_collection, paid_before: Optional[datetime] = None) -> int:
+    """
+    Queues every order still waiting in PAID, or only those paid before
+    paid_before. Returns how many were queued.
+    """
+    query = {"status": OrderStatus.PAID}
+    if paid_before is not None:
+        # Orders paid before paid_at was recorded have none; they count as old
+        query["paid_at"] = {"$not": {"$gt": paid_before}}
+    queued = 0
+    for order in orders_collection.find(query, {"_id": 0, "order_id": 1}):
+        submit_paid_order(order["order_id"])
+        queued += 1
+    return queued
+
+@shared_task
+def flush_order_batch():
+    """Drains the buffer and processes the drained orders as one batch."""
+    order_ids = drain_batch(settings.INVENTORY_BATCH_MAX_ORDERS)
+    if not order_ids:
+        return {}
+    return process_order_batch(order_ids)
+
+@shared_task
+def resubmit_stalled_orders():
+    """
+    Periodic task: re-queues orders that have been PAID for longer than
+    PAID_ORDER_STALL_SECONDS. drain_batch removes order IDs from the buffer
+    before their batch is committed, so a worker crash or a MongoDB error in
+    between would otherwise leave those orders PAID for good. Only orders that
+    are still PAID are committed, so a re-queued order never decrements stock twice.
+    """
+    paid_before = datetime.utcnow() - timedelta(seconds=settings.PAID_ORDER_STALL_SECONDS)
+    queued = catch_up(get_db_client()["shopping_cart_db"]["order_history"], paid_before=paid_before)
+    if queued:
+        logger.warning("Re-queued paid orders that were never processed", extra={"count": queued})
+    return queued
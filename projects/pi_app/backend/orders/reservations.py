@@ -0,0 +1,185 @@
+# backend/orders/reservations.py
+"""
+Checkout-time stock reservations kept in Redis.
+
+For every product Redis holds two counters, namespaced by store:
+  stock:level:<store_id>:<id>     a mirror of the product's stock in MongoDB
+  stock:reserved:<store_id>:<id>  units held by checkouts that have not been paid for yet
+A checkout may reserve a quantity only if level - reserved covers it. Each
+reservation is a hash of reserved counter key -> quantity, and its expiry time is kept
+in a sorted set so that unpaid reservations can be released after the QR code
+stops being valid. MongoDB is only written when a paid order is committed.
+"""
+import logging
+import time
+from celery import shared_task
+from typing import Callable, Dict, Iterable, List
+
+from ..config import settings
+from ..redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+LEVEL_PREFIX = "stock:level:"
+RESERVED_PREFIX = "stock:reserved:"
+RESERVATION_PREFIX = "reservation:"
+EXPIRING_KEY = "reservations:expiring"
+
+# KEYS: reservation hash, expiry zset, level_1..n, reserved_1..n
+# ARGV: order_id, expires_at, n, quantity_1..n
+# Returns {1, 0} on success, {0, i} if product i is short, {-1, i} if its level is not loaded.
+RESERVE_SCRIPT = """
+local n = tonumber(ARGV[3])
+for i = 1, n do
+    local level = redis.call('GET', KEYS[2 + i])
+    if not level then return {-1, i} end
+    local reserved = tonumber(redis.call('GET', KEYS[2 + n + i]) or '0')
+    if tonumber(level) - reserved < tonumber(ARGV[3 + i]) then return {0, i} end
+end
+for i = 1, n do
+    redis.call('INCRBY', KEYS[2 + n + i], ARGV[3 + i])
+    redis.call('HSET', KEYS[1], KEYS[2 + n + i], ARGV[3 + i])
+end
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return {1, 0}
+"""
+
+# KEYS: reservation hash, expiry zset
+# ARGV: order_id, only_if_pending ("1" skips reservations already confirmed)
+RELEASE_SCRIPT = """
+if ARGV[2] == '1' and not redis.call('ZSCORE', KEYS[2], ARGV[1]) then return 0 end
+local entries = redis.call('HGETALL', KEYS[1])
+for i = 1, #entries, 2 do
+    redis.call('DECRBY', entries[i], entries[i + 1])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return #entries / 2
+"""
+
+# KEYS: reservation hash, expiry zset
+# ARGV: order_id, then level key/quantity pairs for what was just decremented in MongoDB.
+FINALIZE_SCRIPT = """
+local entries = redis.call('HGETALL', KEYS[1])
+for i = 1, #entries, 2 do
+    redis.call('DECRBY', entries[i], entries[i + 1])
+end
+for i = 2, #ARGV, 2 do
+    if redis.call('EXISTS', ARGV[i]) == 1 then
+        redis.call('DECRBY', ARGV[i], ARGV[i + 1])
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+"""
+
+class StockUnavailableError(Exception):
+    """Raised when a checkout asks for more than the unreserved stock of a product."""
+
+    def __init__(self, product_id: int):
+        super().__init__(f"Insufficient stock for product ID {product_id}")
+        self.product_id = product_id
+
+def _reservation_key(order_id: str) -> str:
+    return f"{RESERVATION_PREFIX}{order_id}"
+
+def _level_key(store_id: str, product_id: int) -> str:
+    return f"{LEVEL_PREFIX}{store_id}:{product_id}"
+
+def _reserved_key(store_id: str, product_id: int) -> str:
+    return f"{RESERVED_PREFIX}{store_id}:{product_id}"
+
+def prime_stock_levels(
+    store_id: str,
+    product_ids: Iterable[int],
+    load_stock_levels: Callable[[List[int]], Dict[int, int]],
+):
+    """
+    Loads the stock level of any of the store's products that Redis does not
+    know about yet. Products missing from the database are primed with zero stock.
+    """
+    product_ids = list(product_ids)
+    r = get_redis()
+    known = r.mget([_level_key(store_id, product_id) for product_id in product_ids])
+    missing = [product_id for product_id, level in zip(product_ids, known) if level is None]
+    if not missing:
+        return
+    levels = load_stock_levels(missing)
+    pipe = r.pipeline(transaction=False)
+    for product_id in missing:
+        pipe.set(_level_key(store_id, product_id), levels.get(product_id, 0), nx=True)
+    pipe.execute()
+
+def reserve_stock(
+    order_id: str,
+    store_id: str,
+    quantities: Dict[int, int],
+    load_stock_levels: Callable[[List[int]], Dict[int, int]],
+):
+    """
+    Atomically reserves every quantity for the order, or nothing at all.
+    The reservation expires after QR_PAYMENT_TTL_SECONDS unless payment confirms it first.
+    Raises StockUnavailableError if any product is short.
+    """
+    product_ids = list(quantities)
+    keys = (
+        [_reservation_key(order_id), EXPIRING_KEY]
+        + [_level_key(store_id, product_id) for product_id in product_ids]
+        + [_reserved_key(store_id, product_id) for product_id in product_ids]
+    )
+    expires_at = time.time() + settings.QR_PAYMENT_TTL_SECONDS
+    args = [order_id, expires_at, len(product_ids)] + [quantities[p] for p in product_ids]
+
+    r = get_redis()
+    for _ in range(2):
+        reserved, index = r.eval(RESERVE_SCRIPT, len(keys), *keys, *args)
+        if reserved == 1:
+            return
+        if reserved == 0:
+            raise StockUnavailableError(product_ids[index - 1])
+        # A stock level is not cached yet: load the missing ones from MongoDB and retry.
+        prime_stock_levels(store_id, product_ids, load_stock_levels)
+    raise StockUnavailableError(product_ids[index - 1])
+
+def confirm_reservation(order_id: str) -> bool:
+    """
+    Marks a reservation as paid so that it no longer expires. Returns False if
+    it had already expired; the order is then checked against MongoDB alone.
+    """
+    return bool(get_redis().zrem(EXPIRING_KEY, order_id))
+
+def release_reservation(order_id: str, only_if_pending: bool = False) -> int:
+    """Returns a reservation's quantities to the available stock. Returns the number of products released."""
+    return get_redis().eval(
+        RELEASE_SCRIPT, 2, _reservation_key(order_id), EXPIRING_KEY,
+        order_id, "1" if only_if_pending else "0",
+    )
+
+def finalize_reservation(order_id: str, store_id: str, quantities: Dict[int, int]):
+    """
+    Called once an order's stock has been decremented in MongoDB: drops the
+    reservation and lowers the store's cached stock levels by the same amounts.
+    """
+    args = [order_id]
+    for product_id, quantity in quantities.items():
+        args += [_level_key(store_id, product_id), quantity]
+    get_redis().eval(FINALIZE_SCRIPT, 2, _reservation_key(order_id), EXPIRING_KEY, *args)
+
+def invalidate_stock_levels(store_id: str, product_ids: Iterable[int]):
+    """Forgets cached stock levels so they are reloaded from MongoDB on the next checkout."""
+    keys = [_level_key(store_id, product_id) for product_id in product_ids]
+    if keys:
+        get_redis().delete(*keys)
+
+@shared_task
+def release_expired_reservations():
+    """Periodic task: releases reservations whose QR code expired without payment."""
+    expired = get_redis().zrangebyscore(EXPIRING_KEY, "-inf", time.time())
+    released = 0
+    for order_id in expired:
+        if release_reservation(order_id.decode(), only_if_pending=True):
+            released += 1
+    if released:
+        logger.info("Released expired stock reservations", extra={"count": released})
+    return released
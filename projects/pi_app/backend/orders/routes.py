@@ -1,19 +1,22 @@
 # backend/orders/routes.py
-from fastapi import APIRouter, HTTPException, status, Depends, Body
+from fastapi import APIRouter, HTTPException, status, Depends, Body, Query
+from fastapi.responses import ORJSONResponse
 from pymongo import DESCENDING, collection
+from pymongo.errors import PyMongoError
+from pydantic import ValidationError
+import json
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Optional
-import io
-import qrcode
-import qrcode.image.svg
-import httpx
+import logging
+from opentelemetry import trace
 
 import hmac
 import hashlib
 from ..models import (
     CheckoutPayload,
     OrderHistoryItem,
+    OrderHistoryRecord,
     OrderStatus,
     VietQRWebhookPayload,
     VietQRGenerateRequest,
@@ -21,11 +24,21 @@ from ..models import (
     VietQRGenerateResponse,
     OrderStatusResponse,
 )
-from ..database import get_orders_collection
-from .tasks import process_order
+from ..database import get_orders_collection, get_products_collection
+from .reservations import StockUnavailableError, reserve_stock, confirm_reservation, release_reservation
+from .tasks import merge_quantities
+from .archive import find_order_history
+from ..pricing import pricing_engine, to_minor_units
 from ..models import Role
+from ..tracing import current_trace_context, links_to, tracer
+from ..log import request_id_var
+from ..responses import projection_for
 from .. import auth, config
 
+logger = logging.getLogger(__name__)
+
+ORDER_HISTORY_PROJECTION = projection_for(OrderHistoryRecord)
+
 router = APIRouter(
     prefix="/api/orders",
     tags=["Orders"]
@@ -35,26 +48,75 @@ async def initiate_checkout_and_generate_qr(
     cart_data: CheckoutPayload,
     current_user: auth.TokenData = Depends(auth.role_required([Role.SHOP_CLIENT, Role.GUEST])),
     orders_collection: collection.Collection = Depends(get_orders_collection),
+    products_collection: collection.Collection = Depends(get_products_collection),
 ):
     """API endpoint to handle checkout and generate QR code via VietQR API."""
     if not cart_data.items:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot checkout with an empty cart")
 
     user_identity = current_user.identity
+    store_id = current_user.store_id
     order_id = str(uuid.uuid4())
-    print(f"--- [API] Initiating payment for order {order_id} by {user_identity} ---")
-    
-    # Create a pending order record in the database
+    trace.get_current_span().set_attribute("order.id", order_id)
+    logger.info("Initiating payment", extra={"order_id": order_id, "user_identity": user_identity})
+
+    # Re-price the cart from the catalog; the client's prices are only trusted if they match.
+    catalog_prices = pricing_engine.resolve(products_collection, store_id, (item.id for item in cart_data.items))
+    for item in cart_data.items:
+        if item.id not in catalog_prices:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product ID {item.id} not found")
+        if catalog_prices[item.id] != to_minor_units(item.price):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Price of '{item.name}' has changed. Please refresh your cart.",
+            )
+
+    # Hold the stock in Redis for as long as the QR code is valid, so the customer
+    # cannot pay for items that are already gone.
+    def load_stock_levels(product_ids):
+        return {
+            p["id"]: p["quantity"]
+            for p in products_collection.find(
+                {"store_id": store_id, "id": {"$in": product_ids}}, {"_id": 0, "id": 1, "quantity": 1},
+            )
+        }
+    try:
+        reserve_stock(order_id, store_id, merge_quantities([cart_data]), load_stock_levels)
+    except StockUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    # Create a pending order record in the database. It is abandoned, and its
+    # stock released, if it is not paid before the QR code expires.
+    created_at = datetime.utcnow()
     pending_order = OrderHistoryItem(
         **cart_data.model_dump(),
         order_id=order_id,
         user_identity=user_identity,
-        created_at=datetime.utcnow(),
-        status=OrderStatus.PENDING
+        store_id=store_id,
+        created_at=created_at,
+        status=OrderStatus.PENDING,
+        expires_at=created_at + timedelta(seconds=config.settings.QR_PAYMENT_TTL_SECONDS),
     )
-    orders_collection.insert_one(pending_order.model_dump())
+    # Later stages of the order (webhook, watcher, worker) link their spans back to this
+    # trace, and log under this request's ID
+    try:
+        orders_collection.insert_one({
+            **pending_order.model_dump(),
+            "trace_context": current_trace_context(),
+            "request_id": request_id_var.get(),
+        })
+    except PyMongoError:
+        # No order was stored, so nothing would ever release the stock held above
+        release_reservation(order_id)
+        raise
 
     # --- Generate VietQR code via external API ---
+    # Only checkout needs these, so they are loaded on the first checkout rather than at startup
+    import io
+    import httpx
+    import qrcode
+    import qrcode.image.svg
+
     vietqr_request_data = VietQRGenerateRequest(
         acqId=int(config.settings.VIETQR_BANK_BIN),
         accountNo=config.settings.VIETQR_ACCOUNT_NO,
@@ -68,7 +130,7 @@ async def initiate_checkout_and_generate_qr(
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(
-                "https://api.vietqr.io/v2/generate",
+                config.settings.VIETQR_API_URL,
                 json=vietqr_request_data.model_dump(),
                 timeout=10.0 # It's good practice to set a timeout
             )
@@ -76,7 +138,8 @@ async def initiate_checkout_and_generate_qr(
             api_response = VietQRGenerateResponse.model_validate(response.json())
 
             if api_response.code != "00" or not api_response.data:
-                print(f"--- [API] VietQR API error for order {order_id}: {api_response.desc} ---")
+                logger.error("VietQR API error", extra={"order_id": order_id, "vietqr_desc": api_response.desc})
+                release_reservation(order_id)
                 raise HTTPException(
                     status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                     detail=f"Failed to generate QR code: {api_response.desc}"
@@ -91,12 +154,21 @@ async def initiate_checkout_and_generate_qr(
             stream = io.BytesIO()
             img.save(stream)
             qr_svg_string = stream.getvalue().decode('utf-8')
-    except httpx.RequestError as e:
-        print(f"--- [API] HTTP request to VietQR API failed for order {order_id}: {e} ---")
+    except httpx.HTTPError as e:
+        # Connection errors and error statuses (raise_for_status)
+        logger.error("HTTP request to VietQR API failed", extra={"order_id": order_id, "error": str(e)})
+        release_reservation(order_id)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Could not connect to the payment QR service."
         )
+    except (json.JSONDecodeError, ValidationError) as e:
+        logger.error("VietQR API returned a malformed response", extra={"order_id": order_id, "error": str(e)})
+        release_reservation(order_id)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The payment QR service returned an invalid response."
+        )
 
     return {
         "message": "Order created. Please scan the QR code to pay.",
@@ -104,21 +176,132 @@ async def initiate_checkout_and_generate_qr(
         "qr_svg": qr_svg_string
     }
 
-@router.get('/history', response_model=List[OrderHistoryItem])
+def generate_vietqr_webhook_signature(payload: VietQRWebhookPayload) -> str:
+    """Computes the HMAC-SHA256 signature VietQR attaches to payment webhooks."""
+    payload_string = f"{payload.paymentRequestId}{payload.state.value}{payload.amount}{payload.referenceId}{payload.extraData}"
+    return hmac.new(
+        config.settings.VIETQR_WEBHOOK_SECRET_KEY.encode(),
+        payload_string.encode(),
+        hashlib.sha256,
+    ).hexdigest()
+
+def flag_late_payment(orders_collection: collection.Collection, order_id: str, payload: VietQRWebhookPayload) -> dict:
+    """
+    Records a successful payment for an order that has already failed. The money
+    arrived but the order is gone; keep the record (abandoned orders are deleted
+    by a TTL index) so the payment can be refunded or honoured.
+    """
+    orders_collection.update_one(
+        {"order_id": order_id},
+        {
+            "$set": {"late_payment": {
+                "payment_request_id": payload.paymentRequestId,
+                "amount": payload.amount,
+                "received_at": datetime.utcnow(),
+            }},
+            "$unset": {"abandoned_at": ""},
+        },
+    )
+    logger.error(
+        "Payment received for a failed order, flagged for reconciliation",
+        extra={"order_id": order_id, "payment_request_id": payload.paymentRequestId, "amount": payload.amount},
+    )
+    return {"message": "Order already failed. Payment flagged for reconciliation."}
+
+@router.post('/webhook/payment_confirmation')
+def receive_payment_webhook(
+    payload: VietQRWebhookPayload,
+    orders_collection: collection.Collection = Depends(get_orders_collection),
+):
+    """
+    Receives payment confirmations from VietQR. A successful payment moves the
+    order from PENDING to PAID and queues it for batched inventory processing.
+    A successful payment for an order that has already failed, e.g. one whose QR
+    code expired, is flagged on the order as `late_payment` for reconciliation.
+    """
+    if not hmac.compare_digest(generate_vietqr_webhook_signature(payload), payload.signature):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature")
+
+    order_id = payload.referenceId
+    order = orders_collection.find_one({"order_id": order_id}, {"_id": 0, "status": 1, "total_cost": 1, "trace_context": 1})
+    if not order:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    if order["status"] == OrderStatus.FAILED and payload.state == VietQRTransactionState.SUCCESS:
+        return flag_late_payment(orders_collection, order_id, payload)
+    if order["status"] != OrderStatus.PENDING:
+        return {"message": f"Order already {order['status']}."}
+
+    # Failing the order is conditional on it still being PENDING, so a webhook racing the
+    # PAID transition or the expiry sweeper can't undo a payment or release its stock.
+    if payload.state != VietQRTransactionState.SUCCESS:
+        failed = orders_collection.update_one(
+            {"order_id": order_id, "status": OrderStatus.PENDING}, {"$set": {"status": OrderStatus.FAILED}},
+        )
+        if not failed.modified_count:
+            return {"message": "Order is no longer pending."}
+        release_reservation(order_id)
+        return {"message": "Payment failed. Order marked as failed."}
+
+    if payload.amount != int(order["total_cost"]):
+        failed = orders_collection.update_one(
+            {"order_id": order_id, "status": OrderStatus.PENDING}, {"$set": {"status": OrderStatus.FAILED}},
+        )
+        if failed.modified_count:
+            release_reservation(order_id)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Amount mismatch. Expected {int(order['total_cost'])}, received {payload.amount}",
+        )
+
+    with tracer.start_as_current_span(
+        "confirm_payment",
+        links=links_to([order.get("trace_context")]),
+        attributes={"order.id": order_id},
+    ):
+        # The order watcher (orders/watcher.py) sees the PENDING -> PAID change on the
+        # change stream and queues inventory processing, so nothing is lost if this
+        # process dies right after the write.
+        result = orders_collection.update_one(
+            {"order_id": order_id, "status": OrderStatus.PENDING},
+            # paid_at lets resubmit_stalled_orders find orders whose processing was lost
+            {"$set": {"status": OrderStatus.PAID, "paid_at": datetime.utcnow()}, "$unset": {"expires_at": ""}},
+        )
+        if result.modified_count:
+            # Paid in time: keep the reserved stock until the order is committed. Only
+            # after the status change, so the expiry sweeper still releases it if it won.
+            confirm_reservation(order_id)
+    if result.modified_count:
+        logger.info("Payment confirmed", extra={"order_id": order_id})
+        return {"message": "Payment confirmed. Order is being processed."}
+
+    # The order moved on since it was read: a duplicate confirmation, or the
+    # expiry sweeper or a failure webhook got there first.
+    current = orders_collection.find_one({"order_id": order_id}, {"_id": 0, "status": 1})
+    if current is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    if current["status"] == OrderStatus.FAILED:
+        release_reservation(order_id)
+        return flag_late_payment(orders_collection, order_id, payload)
+    return {"message": f"Order already {current['status']}."}
+
+@router.get('/history', response_model=List[OrderHistoryRecord])
 def get_order_history(
+    limit: Optional[int] = Query(default=None, ge=1, description="Return only the most recent orders"),
     current_user: auth.TokenData = Depends(auth.role_required([Role.SHOP_CLIENT, Role.GUEST])),
     orders_collection: collection.Collection = Depends(get_orders_collection),
 ):
-    """Retrieves the order history for the currently logged-in user."""
+    """
+    Retrieves the order history for the currently logged-in user, newest first.
+    Reads recent orders from order_history and older ones from the monthly archive.
+    Stored orders were validated at checkout, so they are sent as they are.
+    """
     user_identity = current_user.identity
     try:
-        history = list(orders_collection.find(
-            {"user_identity": user_identity, "status": {"$ne": OrderStatus.PENDING}},
-            {'_id': 0}
-        ).sort("created_at", DESCENDING))
-        return history
+        return ORJSONResponse(find_order_history(
+            orders_collection, current_user.store_id, user_identity, limit, projection=ORDER_HISTORY_PROJECTION,
+        ))
     except Exception as e:
-        print(f"Error fetching order history for {user_identity}: {e}")
+        logger.exception("Error fetching order history", extra={"user_identity": user_identity})
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred while fetching order history.")
 
 @router.get('/{order_id}/status', response_model=OrderStatusResponse)
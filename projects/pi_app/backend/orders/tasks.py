@@ -1,59 +1,287 @@
 # backend/orders/tasks.py
 from celery import shared_task
-from pymongo import MongoClient
-import redis
+from celery.signals import worker_process_init, worker_process_shutdown
+from pymongo import MongoClient, UpdateOne
 from datetime import datetime
+from typing import Dict, List, Optional
+import logging
 
-from .. import config
-from ..models import OrderHistoryItem, OrderStatus
+from ..config import settings
+from ..log import bound_request_id
+from ..metrics import mongo_command_listener
+from ..tracing import links_to, tracer
+from ..models import CheckoutPayload, OrderHistoryItem, OrderStatus
+from .reservations import finalize_reservation, invalidate_stock_levels, release_reservation
 
-# --- Helper function to get a database client within the worker ---
-def get_db_client():
-    return MongoClient(config.MONGO_URI)
+logger = logging.getLogger(__name__)
+
+# --- Worker-scoped database client ---
+# Each worker process creates one client after it has been forked and reuses its
+# connection pool for every task it runs. PyMongo clients must not be shared across fork().
+_client: Optional[MongoClient] = None
+
+@worker_process_init.connect
+def init_db_client(**kwargs):
+    global _client
+    _client = MongoClient(settings.MONGO_URI, event_listeners=[mongo_command_listener])
+
+@worker_process_shutdown.connect
+def close_db_client(**kwargs):
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+def get_db_client() -> MongoClient:
+    """Returns this process's client, creating it lazily (e.g. when tasks run eagerly)."""
+    global _client
+    if _client is None:
+        _client = MongoClient(settings.MONGO_URI, event_listeners=[mongo_command_listener])
+    return _client
+
+class InsufficientStockError(Exception):
+    """Raised inside the inventory transaction to abort it."""
+
+def merge_quantities(orders: List[CheckoutPayload]) -> Dict[int, int]:
+    """Sums the quantity of every product across the given orders' cart lines."""
+    quantities: Dict[int, int] = {}
+    for order in orders:
+        for item in order.items:
+            quantities[item.id] = quantities.get(item.id, 0) + item.quantity
+    return quantities
+
+def commit_inventory(client: MongoClient, store_id: str, quantities: Dict[int, int], order_ids: List[str]) -> bool:
+    """
+    Decrements the store's stock for the merged quantities and marks the orders as
+    completed, all in one multi-document transaction. Returns False, with nothing
+    written, if any product does not have enough stock or any order is no longer PAID.
+    """
+    db = client["shopping_cart_db"]
+    products_collection = db["products"]
+    order_history_collection = db["order_history"]
+    stock_updates = [
+        UpdateOne({"store_id": store_id, "id": product_id, "quantity": {"$gte": quantity}}, {"$inc": {"quantity": -quantity}})
+        for product_id, quantity in quantities.items()
+    ]
+
+    def decrement_stock(session):
+        result = products_collection.bulk_write(stock_updates, ordered=True, session=session)
+        if result.matched_count != len(stock_updates):
+            raise InsufficientStockError()
+        completed = order_history_collection.update_many(
+            {"order_id": {"$in": order_ids}, "status": OrderStatus.PAID},
+            {"$set": {"status": OrderStatus.COMPLETED}},
+            session=session,
+        )
+        # Another run already completed one of these orders; don't decrement twice.
+        if completed.modified_count != len(order_ids):
+            raise InsufficientStockError()
+
+    try:
+        with client.start_session() as session:
+            session.with_transaction(decrement_stock)
+    except InsufficientStockError:
+        return False
+    return True
+
+def get_stock_levels(client: MongoClient, store_id: str, product_ids) -> Dict[int, int]:
+    """Reads the current stock of several of a store's products in one query."""
+    products_collection = client["shopping_cart_db"]["products"]
+    return {
+        p["id"]: p["quantity"]
+        for p in products_collection.find(
+            {"store_id": store_id, "id": {"$in": list(product_ids)}}, {"_id": 0, "id": 1, "quantity": 1},
+        )
+    }
 
 @shared_task(bind=True)
 def process_order(self, order_id: str):
     """
     Processes a paid order by decrementing stock quantities in the database.
-    This task is designed to be transactional and safe for concurrency.
+    All stock decrements and the status change run in a single multi-document
+    transaction, so either every item is reserved or nothing is.
     """
-    print(f"\n--- [CELERY WORKER] PROCESSING INVENTORY FOR ORDER {order_id} ---")
-    
     client = get_db_client()
-    db = client["shopping_cart_db"]
-    products_collection = db["products"]
-    order_history_collection = db["order_history"]
-    
+    order_history_collection = client["shopping_cart_db"]["order_history"]
+
     order_data = order_history_collection.find_one({"order_id": order_id})
     if not order_data or order_data.get("status") != OrderStatus.PAID:
-        print(f"--- [CELERY WORKER] ERROR: Order {order_id} not found or not in 'paid' state. Aborting. ---")
+        logger.error("Order not found or not in 'paid' state, aborting", extra={"order_id": order_id})
         return {"status": "failure", "message": "Order not found or not paid."}
 
+    # Log under the order's checkout request
+    with bound_request_id(order_data.get("request_id")):
+        return process_paid_order(client, order_data)
+
+def process_paid_order(client: MongoClient, order_data: dict) -> dict:
+    """process_order's work once the order is known to be PAID."""
+    order_history_collection = client["shopping_cart_db"]["order_history"]
+    order_id = order_data["order_id"]
+    logger.info("Processing inventory for order", extra={"order_id": order_id})
+
     order = OrderHistoryItem.model_validate(order_data)
+    quantities = merge_quantities([order])
+
+    with tracer.start_as_current_span(
+        "commit_inventory",
+        links=links_to([order_data.get("trace_context")]),
+        attributes={"order.id": order_id},
+    ):
+        committed = commit_inventory(client, order.store_id, quantities, [order_id])
+    if not committed:
+        # The transaction was aborted, so no stock was touched.
+        failed = order_history_collection.update_one(
+            {"order_id": order_id, "status": OrderStatus.PAID},
+            {"$set": {"status": OrderStatus.FAILED}},
+        )
+        if not failed.modified_count:
+            logger.info("Order was already processed elsewhere, skipping", extra={"order_id": order_id})
+            return {"status": "failure", "message": "Order already processed."}
+        # Look up the short items once, only to report them.
+        in_stock = get_stock_levels(client, order.store_id, quantities)
+        short_items = list(dict.fromkeys(
+            item.name for item in order.items if in_stock.get(item.id, 0) < quantities[item.id]
+        ))
+        logger.warning("Insufficient stock, marked order as failed", extra={"order_id": order_id, "short_items": short_items})
+        release_reservation(order_id)
+        # The cached levels let this order through, so they are stale; reload them.
+        invalidate_stock_levels(order.store_id, quantities)
+        return {"status": "failure", "message": f"Insufficient stock for {', '.join(short_items)}."}
+
+    finalize_reservation(order_id, order.store_id, quantities)
+    logger.info("Inventory for order processed", extra={"order_id": order_id})
+    return {"status": "success", "message": "Inventory updated and order completed."}
+
+@shared_task(bind=True)
+def process_order_batch(self, order_ids: List[str]):
+    """
+    Processes several paid orders at once. Each store's orders are handled
+    together: their per-product decrements are merged and applied in one
+    transaction; if some product runs short, the available stock is allocated
+    to orders in arrival order and each order succeeds or fails on its own.
+    Returns a mapping of order_id to "success" or "failure".
+    """
+    logger.info("Processing inventory for order batch", extra={"batch_size": len(order_ids)})
+
+    client = get_db_client()
+    order_history_collection = client["shopping_cart_db"]["order_history"]
+
+    order_ids = list(dict.fromkeys(order_ids))
+    arrival = {order_id: position for position, order_id in enumerate(order_ids)}
+    docs = list(order_history_collection.find({"order_id": {"$in": order_ids}, "status": OrderStatus.PAID}))
+    orders = sorted(
+        (OrderHistoryItem.model_validate(doc) for doc in docs),
+        key=lambda order: arrival[order.order_id],
+    )
+    trace_contexts = {doc["order_id"]: doc.get("trace_context") for doc in docs}
+    request_ids = {doc["order_id"]: doc.get("request_id") for doc in docs}
+    results = {order_id: "failure" for order_id in order_ids}
+
+    by_store: Dict[str, List[OrderHistoryItem]] = {}
+    for order in orders:
+        by_store.setdefault(order.store_id, []).append(order)
+    for store_id, store_orders in by_store.items():
+        results.update(process_store_orders(client, store_id, store_orders, trace_contexts))
+
+    # One line per order under its checkout request, so an order can be followed from checkout to here
+    for order_id, result in results.items():
+        with bound_request_id(request_ids.get(order_id)):
+            logger.info("Inventory for order processed in batch", extra={"order_id": order_id, "result": result})
+    logger.info("Order batch processed", extra={"completed": sum(r == "success" for r in results.values()), "batch_size": len(order_ids)})
+    return results
+
+def process_store_orders(
+    client: MongoClient,
+    store_id: str,
+    orders: List[OrderHistoryItem],
+    trace_contexts: Dict[str, Optional[Dict[str, str]]],
+) -> Dict[str, str]:
+    """Commits one store's share of a batch. Orders are in arrival order."""
+    order_history_collection = client["shopping_cart_db"]["order_history"]
+    results = {}
+
+    # One span for the merged write, linked to every order's checkout trace
+    with tracer.start_as_current_span(
+        "commit_inventory_batch",
+        links=links_to(trace_contexts.get(o.order_id) for o in orders),
+        attributes={"order.ids": [o.order_id for o in orders], "store.id": store_id},
+    ):
+        committed = commit_inventory(client, store_id, merge_quantities(orders), [o.order_id for o in orders])
+    if committed:
+        for order in orders:
+            finalize_reservation(order.order_id, store_id, merge_quantities([order]))
+            results[order.order_id] = "success"
+        return results
+
+    # Some product is short: hand out the stock that is left, first come first served.
+    stock = get_stock_levels(client, store_id, merge_quantities(orders))
+    accepted, rejected = [], []
+    for order in orders:
+        needed = merge_quantities([order])
+        if all(stock.get(product_id, 0) >= quantity for product_id, quantity in needed.items()):
+            for product_id, quantity in needed.items():
+                stock[product_id] -= quantity
+            accepted.append(order)
+        else:
+            rejected.append(order)
+
+    if rejected:
+        logger.warning("Insufficient stock for part of the batch, marking those orders as failed", extra={"rejected": len(rejected), "store_id": store_id})
+        order_history_collection.update_many(
+            {"order_id": {"$in": [o.order_id for o in rejected]}, "status": OrderStatus.PAID},
+            {"$set": {"status": OrderStatus.FAILED}},
+        )
+        for order in rejected:
+            release_reservation(order.order_id)
+            results[order.order_id] = "failure"
+        invalidate_stock_levels(store_id, merge_quantities(rejected))
+
+    if accepted:
+        if commit_inventory(client, store_id, merge_quantities(accepted), [o.order_id for o in accepted]):
+            for order in accepted:
+                finalize_reservation(order.order_id, store_id, merge_quantities([order]))
+                results[order.order_id] = "success"
+        else:
+            # Stock changed between the read and the write; settle these one by one.
+            for order in accepted:
+                results[order.order_id] = process_order(order.order_id)["status"]
+    return results
+
+@shared_task
+def expire_abandoned_orders(batch_size: int = 1000):
+    """
+    Periodic task: marks pending orders whose QR code expired as failed, in bulk,
+    and releases their stock reservations. Abandoned orders are then removed by
+    the TTL index on abandoned_at.
+    """
+    order_history_collection = get_db_client()["shopping_cart_db"]["order_history"]
+    now = datetime.utcnow()
+    expired_ids = [
+        doc["order_id"] for doc in order_history_collection.find(
+            {"status": OrderStatus.PENDING, "expires_at": {"$lte": now}},
+            {"_id": 0, "order_id": 1},
+        ).limit(batch_size)
+    ]
+    if not expired_ids:
+        return 0
 
-    updates_to_perform = []
-    for item in order.items:
-        result = products_collection.update_one(
-            {"id": item.id, "quantity": {"$gte": item.quantity}},
-            {"$inc": {"quantity": -item.quantity}}
+    result = order_history_collection.update_many(
+        {"order_id": {"$in": expired_ids}, "status": OrderStatus.PENDING},
+        {"$set": {"status": OrderStatus.FAILED, "abandoned_at": now}, "$unset": {"expires_at": ""}},
+    )
+    # Only the orders this sweep failed: one paid since the read keeps its stock,
+    # even if the webhook has not confirmed its reservation yet.
+    abandoned_ids = [
+        doc["order_id"] for doc in order_history_collection.find(
+            {"order_id": {"$in": expired_ids}, "status": OrderStatus.FAILED, "abandoned_at": now},
+            {"_id": 0, "order_id": 1},
         )
-        
-        if result.matched_count == 0:
-            print(f"--- [CELERY WORKER] FAILED: Insufficient stock for product ID {item.id}. Rolling back and marking order as failed. ---")
-            order_history_collection.update_one({"order_id": order_id}, {"$set": {"status": OrderStatus.FAILED}})
-            for u_item in updates_to_perform:
-                products_collection.update_one(
-                    {"id": u_item.id},
-                    {"$inc": {"quantity": u_item.quantity}}
-                )
-            return {"status": "failure", "message": f"Insufficient stock for {item.name}."}
-        
-        updates_to_perform.append(item)
-        print(f"--- [CELERY WORKER] Reserved {item.quantity} of '{item.name}' (ID: {item.id}).")
-
-    # If all items are reserved, mark the order as completed
-    order_history_collection.update_one({"order_id": order_id}, {"$set": {"status": OrderStatus.COMPLETED}})
-
-    client.close()
-    print(f"--- [CELERY WORKER] INVENTORY FOR ORDER {order_id} PROCESSED SUCCESSFULLY ---\n")
-    return {"status": "success", "message": "Inventory updated and order completed."}
\ No newline at end of file
+    ]
+    for order_id in abandoned_ids:
+        # Skips reservations a payment confirmed in the meantime.
+        release_reservation(order_id, only_if_pending=True)
+    logger.info("Marked abandoned orders as failed", extra={"count": result.modified_count})
+    if len(expired_ids) == batch_size:
+        # More may be waiting; keep going without waiting for the next beat.
+        expire_abandoned_orders.delay(batch_size)
+    return result.modified_count
@@ -0,0 +1,111 @@
+# backend/orders/watcher.py
+"""
+Order pipeline watcher.
+
+Follows the order_history change stream and queues inventory processing for
+every order that moves to PAID. The stream's resume token is checkpointed in
+MongoDB after each event, so after a restart the watcher picks up exactly
+where it stopped instead of rescanning order_history. Processing is
+idempotent (an order is only completed while it is still PAID), so an event
+replayed after a crash cannot decrement stock twice.
+
+The token moves on as soon as an order is queued, not when it is committed;
+orders whose batch is lost after that are re-queued by the
+resubmit_stalled_orders beat task.
+
+Run with: python -m backend.orders.watcher
+"""
+import logging
+from datetime import datetime
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+# Configures the broker that submit_paid_order's flush tasks are published to
+from ..celery_app import celery_app  # noqa: F401
+from ..config import settings
+from ..log import bound_request_id, setup_logging, shutdown_logging
+from ..tracing import instrument_celery, links_to, shutdown_tracing, tracer
+from ..models import OrderStatus
+from .batching import catch_up, submit_paid_order
+
+logger = logging.getLogger(__name__)
+
+WATCHER_ID = "order_pipeline"
+# Server error code for a resume token that has fallen off the oplog.
+CHANGE_STREAM_HISTORY_LOST = 286
+
+PAID_PIPELINE = [
+    {"$match": {
+        "operationType": "update",
+        "updateDescription.updatedFields.status": OrderStatus.PAID.value,
+    }},
+    {"$project": {"fullDocument.order_id": 1, "fullDocument.trace_context": 1, "fullDocument.request_id": 1}},
+]
+
+def save_resume_token(state_collection, token):
+    state_collection.update_one(
+        {"_id": WATCHER_ID},
+        {"$set": {"resume_token": token, "updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+def open_stream(orders_collection, resume_token):
+    """Opens the change stream, resuming from the token when the oplog still has it."""
+    options = {"full_document": "updateLookup", "max_await_time_ms": 1000}
+    if resume_token is not None:
+        try:
+            return orders_collection.watch(PAID_PIPELINE, resume_after=resume_token, **options), True
+        except OperationFailure as e:
+            if e.code != CHANGE_STREAM_HISTORY_LOST:
+                raise
+            logger.warning("Resume token is no longer in the oplog, falling back to a full catch-up")
+    return orders_collection.watch(PAID_PIPELINE, **options), False
+
+def handle_change(change):
+    """Queues the order a PENDING -> PAID change stream event is about."""
+    order = change.get("fullDocument") or {}
+    if not order.get("order_id"):
+        return
+    # Linked to the order's checkout trace
+    with tracer.start_as_current_span(
+        "dispatch_paid_order",
+        links=links_to([order.get("trace_context")]),
+        attributes={"order.id": order["order_id"]},
+    ):
+        submit_paid_order(order["order_id"])
+    # Not around submit_paid_order: the flush task it may publish serves other orders too
+    with bound_request_id(order.get("request_id")):
+        logger.info("Queued paid order for inventory processing", extra={"order_id": order["order_id"]})
+
+def run(client: MongoClient = None):
+    client = client or MongoClient(settings.MONGO_URI)
+    db = client["shopping_cart_db"]
+    orders_collection = db["order_history"]
+    state_collection = db["pipeline_state"]
+
+    state = state_collection.find_one({"_id": WATCHER_ID}) or {}
+    stream, resumed = open_stream(orders_collection, state.get("resume_token"))
+    with stream:
+        if not resumed:
+            # The stream is already open, so nothing that happens during the scan is missed.
+            logger.info("Caught up on paid orders", extra={"count": catch_up(orders_collection)})
+        logger.info("Watching order_history for paid orders")
+        last_saved = None
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None:
+                handle_change(change)
+            # Checkpoint after each event, and while idle so the token keeps up with the oplog.
+            if stream.resume_token is not None and stream.resume_token != last_saved:
+                save_resume_token(state_collection, stream.resume_token)
+                last_saved = stream.resume_token
+
+if __name__ == "__main__":
+    setup_logging()
+    # The flush tasks the watcher publishes then continue the dispatch_paid_order trace
+    instrument_celery()
+    try:
+        run()
+    finally:
+        shutdown_tracing()
+        shutdown_logging()
@@ -0,0 +1,73 @@
+# backend/pricing.py
+"""
+Server-side cart pricing.
+
+Prices are compared and summed as integers in minor units (hundredths), so
+totals are exact and cheap to compute. Product prices come from an
+in-process table per store that is filled lazily with one $in query per
+checkout for products it has not seen yet. Each table is tied to its store's
+catalog version counter in Redis. Any product write bumps the counter, and
+every worker then drops that store's table on its next checkout there.
+"""
+import threading
+from typing import Dict, Iterable, Tuple
+
+from .redis_client import get_redis
+
+MINOR_UNITS_PER_UNIT = 100
+CATALOG_VERSION_PREFIX = "catalog:version:"
+
+def to_minor_units(amount: float) -> int:
+    """Converts a price or total to an integer number of hundredths."""
+    return round(amount * MINOR_UNITS_PER_UNIT)
+
+def from_minor_units(amount: int) -> float:
+    return amount / MINOR_UNITS_PER_UNIT
+
+def get_catalog_version(store_id: str) -> int:
+    return int(get_redis().get(f"{CATALOG_VERSION_PREFIX}{store_id}") or 0)
+
+def bump_catalog_version(store_id: str):
+    """Call after any write to a store's products that can change a price."""
+    get_redis().incr(f"{CATALOG_VERSION_PREFIX}{store_id}")
+
+class PricingEngine:
+    """Resolves authoritative unit prices, in minor units, for a set of a store's product IDs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # store_id -> (catalog version, {product_id: price})
+        self._tables: Dict[str, Tuple[int, Dict[int, int]]] = {}
+
+    def resolve(self, products_collection, store_id: str, product_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Returns {product_id: unit price in minor units}. Products that do not
+        exist in the store are left out of the result.
+        """
+        product_ids = set(product_ids)
+        version = get_catalog_version(store_id)
+        with self._lock:
+            table_version, prices = self._tables.get(store_id, (None, {}))
+            # Any change counts: the counter starts again from 0 if its Redis key is lost.
+            if version != table_version:
+                table_version, prices = version, {}
+                self._tables[store_id] = (table_version, prices)
+            resolved = {product_id: prices[product_id] for product_id in product_ids if product_id in prices}
+
+        missing = [product_id for product_id in product_ids if product_id not in resolved]
+        if missing:
+            loaded = {
+                doc["id"]: to_minor_units(doc["price"])
+                for doc in products_collection.find(
+                    {"store_id": store_id, "id": {"$in": missing}}, {"_id": 0, "id": 1, "price": 1},
+                )
+            }
+            with self._lock:
+                # Only keep what we read if the catalog did not change in the meantime.
+                table_version, prices = self._tables[store_id]
+                if table_version == version:
+                    prices.update(loaded)
+            resolved.update(loaded)
+        return resolved
+
+pricing_engine = PricingEngine()
@@ -1,38 +1,52 @@
 # backend/products/routes.py
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.responses import ORJSONResponse
 from pymongo import DESCENDING, collection
 from typing import List
-from fastapi_cache.decorator import cache
+import logging
 
 from ..database import get_products_collection
 from ..models import Product, ProductCreate, ProductUpdate
 from ..models import Role
+from ..orders.reservations import invalidate_stock_levels
+from ..pricing import bump_catalog_version
+from ..responses import cache_response, projection_for
+from ..stores import clear_store_cache, store_from_header, store_key_builder
 from .. import auth
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Stored products are written from Product (or the seed, which goes through it),
+# so the read endpoints send them as they are instead of re-validating them
+PRODUCT_PROJECTION = projection_for(Product)
 
 router = APIRouter(
     prefix="/api/products",
     tags=["Products"]
 )
 
-def get_next_product_id(products_collection: collection.Collection):
+def get_next_product_id(products_collection: collection.Collection, store_id: str):
     """
-    Finds the highest product 'id' and returns the next integer.
+    Finds the store's highest product 'id' and returns the next integer.
     NOTE: In a highly concurrent production environment, a more robust solution like
     a dedicated 'counters' collection with atomic increments should be used.
     """
-    last_product = products_collection.find_one(sort=[("id", DESCENDING)])
+    last_product = products_collection.find_one({"store_id": store_id}, sort=[("id", DESCENDING)])
     if last_product and 'id' in last_product:
         return last_product['id'] + 1
     return 1 # Start from 1 if collection is empty
 
 @router.get('', response_model=List[Product])
-@cache(expire=60)
+@cache_response(expire=60, key_builder=store_key_builder)
 async def get_products(
+    store_id: str = Depends(store_from_header),
     products_collection: collection.Collection = Depends(get_products_collection),
 ):
     """API endpoint to get all available products."""
-    print("--- [DATABASE HIT] Fetching products from MongoDB ---")
-    return list(products_collection.find({}, {'_id': 0}))
+    # Logged on every cache miss, so only a sample is kept
+    logger.info("Products cache miss, fetching from MongoDB", extra={"sample_rate": settings.LOG_SAMPLE_RATE})
+    return ORJSONResponse(list(products_collection.find({"store_id": store_id}, PRODUCT_PROJECTION)))
 
 @router.post('', status_code=status.HTTP_201_CREATED, response_model=Product)
 async def create_product(
@@ -42,36 +56,39 @@ async def create_product(
 ):
     """Creates a new product in the database."""
     new_product_doc = product_to_create.model_dump()
-    new_product_doc['id'] = get_next_product_id(products_collection)
+    new_product_doc['id'] = get_next_product_id(products_collection, current_user.store_id)
     new_product = Product.model_validate(new_product_doc)
-    products_collection.insert_one(new_product.model_dump())
-    
-    # In FastAPI, cache invalidation is often handled differently,
-    # e.g., via a separate endpoint or event system. For simplicity, we'll skip explicit clearing.
-    # await FastAPICache.clear(namespace="fastapi-cache") # This would clear everything
-    print("--- Product created. Cache will expire naturally. ---")
+    products_collection.insert_one({**new_product.model_dump(), "store_id": current_user.store_id})
+    invalidate_stock_levels(current_user.store_id, [new_product.id])
+    bump_catalog_version(current_user.store_id)
+    await clear_store_cache(current_user.store_id)
+    logger.info("Product created, store cache cleared", extra={"product_id": new_product.id})
     return new_product
 
 @router.get('/{product_id}', response_model=Product)
+@cache_response(expire=60, key_builder=store_key_builder)
 async def get_product(
     product_id: int,
+    store_id: str = Depends(store_from_header),
     products_collection: collection.Collection = Depends(get_products_collection),
 ):
     """Retrieves a single product by its ID."""
-    product = products_collection.find_one({"id": product_id}, {'_id': 0})
+    product = products_collection.find_one({"store_id": store_id, "id": product_id}, PRODUCT_PROJECTION)
     if product:
-        return product
+        return ORJSONResponse(product)
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
 
 @router.get('/barcode/{barcode}', response_model=Product)
+@cache_response(expire=60, key_builder=store_key_builder)
 async def get_product_by_barcode(
     barcode: str,
+    store_id: str = Depends(store_from_header),
     products_collection: collection.Collection = Depends(get_products_collection),
 ):
     """Retrieves a single product by its barcode."""
-    product = products_collection.find_one({"barcode": barcode}, {'_id': 0})
+    product = products_collection.find_one({"store_id": store_id, "barcode": barcode}, PRODUCT_PROJECTION)
     if product:
-        return product
+        return ORJSONResponse(product)
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found by barcode")
 
 @router.put('/{product_id}', response_model=Product)
@@ -87,13 +104,18 @@ async def update_product(
     if not update_fields:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No update fields provided")
         
-    result = products_collection.update_one({"id": product_id}, {"$set": update_fields})
+    store_id = current_user.store_id
+    result = products_collection.update_one({"store_id": store_id, "id": product_id}, {"$set": update_fields})
     
     if result.matched_count == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-        
-    print("--- Product updated. Cache will expire naturally. ---")
-    updated_product = products_collection.find_one({"id": product_id}, {'_id': 0})
+    if "quantity" in update_fields:
+        invalidate_stock_levels(store_id, [product_id])
+    if "price" in update_fields:
+        bump_catalog_version(store_id)
+    await clear_store_cache(store_id)
+    logger.info("Product updated, store cache cleared", extra={"product_id": product_id})
+    updated_product = products_collection.find_one({"store_id": store_id, "id": product_id}, {'_id': 0})
     return updated_product
 
 @router.delete('/{product_id}', status_code=status.HTTP_204_NO_CONTENT)
@@ -103,9 +125,12 @@ async def delete_product(
     products_collection: collection.Collection = Depends(get_products_collection),
 ):
     """Deletes a product from the database."""
-    result = products_collection.delete_one({"id": product_id})
+    store_id = current_user.store_id
+    result = products_collection.delete_one({"store_id": store_id, "id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    
-    print("--- Product deleted. Cache will expire naturally. ---")
+    invalidate_stock_levels(store_id, [product_id])
+    bump_catalog_version(store_id)
+    await clear_store_cache(store_id)
+    logger.info("Product deleted, store cache cleared", extra={"product_id": product_id})
     return
\ No newline at end of file
@@ -0,0 +1,32 @@
+# backend/rate_limit.py
+import time
+from fastapi import HTTPException, Request, status
+
+from .redis_client import get_redis
+
+RATE_LIMIT_PREFIX = "ratelimit:"
+
+def check_rate_limit(scope: str, key: str, limit: int, window_seconds: int = 60):
+    """
+    Fixed-window rate limit kept in Redis. Raises 429 once `key` has made more
+    than `limit` calls in `scope` within the current window.
+    """
+    window = int(time.time() // window_seconds)
+    redis_key = f"{RATE_LIMIT_PREFIX}{scope}:{key}:{window}"
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.incr(redis_key)
+    pipe.expire(redis_key, window_seconds)
+    count, _ = pipe.execute()
+    if count > limit:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts. Please slow down.",
+            headers={"Retry-After": str(window_seconds - int(time.time()) % window_seconds)},
+        )
+
+def limit_by_ip(scope: str, limit: int, window_seconds: int = 60):
+    """Dependency factory: rate-limits an endpoint per client IP."""
+    def dependency(request: Request):
+        client_ip = request.client.host if request.client else "unknown"
+        check_rate_limit(scope, client_ip, limit, window_seconds)
+    return dependency
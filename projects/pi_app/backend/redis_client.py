@@ -0,0 +1,75 @@
+# backend/redis_client.py
+import logging
+import threading
+import redis
+from typing import Callable, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# A synchronous client for code that talks to Redis directly (batching, stock
+# reservations). redis-py's connection pool is reset automatically after fork().
+_redis: Optional[redis.Redis] = None
+
+def get_redis() -> redis.Redis:
+    """Returns the process-wide synchronous Redis client, creating it on first use."""
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.REDIS_URI)
+    return _redis
+
+class Subscription:
+    """
+    Handles a pub/sub channel's messages in a daemon thread, for in-process
+    state that other processes invalidate (revocations, cards, cached responses).
+
+    `resync` reloads that state. It runs once the channel is subscribed, so
+    nothing published in between is missed, and again after every reconnect,
+    because messages published while the connection was down are lost. If
+    Redis drops the connection, the thread keeps retrying instead of dying.
+    """
+
+    def __init__(self, channel: str, on_message: Callable[[dict], None], resync: Callable[[], None], retry_seconds: float = 1.0):
+        self.channel = channel
+        self.on_message = on_message
+        self.resync = resync
+        self.retry_seconds = retry_seconds
+        self._pubsub = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._stopping.clear()
+        self._pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: self.on_message})
+        self.resync()
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=self._on_error)
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.stop()
+            # Let it finish its current read before the connection is closed under it
+            self._thread.join(timeout=self.retry_seconds + 1.0)
+            self._thread = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+    def _on_error(self, error: BaseException, pubsub, thread):
+        """Runs in the listener thread when reading fails: reconnects, re-subscribes and resyncs."""
+        if self._stopping.is_set():
+            return
+        logger.warning("Lost Redis subscription, reconnecting", extra={"channel": self.channel, "error": str(error)})
+        while not self._stopping.wait(self.retry_seconds):
+            try:
+                pubsub.connection.disconnect()
+                # Connecting re-subscribes to the channel (PubSub.on_connect)
+                pubsub.connection.connect()
+                self.resync()
+            except redis.RedisError as e:
+                logger.warning("Reconnecting Redis subscription failed, retrying", extra={"channel": self.channel, "error": str(e)})
+                continue
+            logger.info("Redis subscription restored", extra={"channel": self.channel})
+            return
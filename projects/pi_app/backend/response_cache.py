@@ -0,0 +1,164 @@
+# backend/response_cache.py
+"""
+Two-tier backend for fastapi-cache.
+
+Cached responses are kept in Redis (L2), shared by every API worker, and in a
+per-process LRU bounded in bytes (L1), so a repeat read never leaves the
+process. An L1 entry expires when its Redis key does, and entries filled from
+Redis carry the key's remaining TTL.
+
+Clearing a namespace or key (FastAPICache.clear) deletes it from Redis and
+publishes it on a pub/sub channel; every API process then drops the matching
+L1 entries, the same way the card registry stays coherent. L1 is emptied
+whenever that subscription is re-established, as invalidations may have been
+missed while it was down. A lookup that
+raced the invalidation does not put the old body back into L1.
+
+Lookups are counted per tier in response_cache_tier_lookups_total.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi_cache.backends.redis import RedisBackend
+
+from .config import settings
+from .metrics import RESPONSE_CACHE_L1_BYTES, RESPONSE_CACHE_TIER_LOOKUPS
+from .redis_client import Subscription
+
+RESPONSE_CACHE_INVALIDATION_CHANNEL = "response-cache:invalidations"
+
+class LocalResponseCache:
+    """The L1 tier: cached bodies and their expiry, evicted least recently used first."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # key -> (body, monotonic expiry or None)
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, so a fill racing one is dropped
+        self.generation = 0
+        self._subscription: Optional[Subscription] = None
+
+    def start(self):
+        """Subscribes to invalidations, then drops anything cached before the subscription was live."""
+        self._subscription = Subscription(RESPONSE_CACHE_INVALIDATION_CHANNEL, self._on_message, resync=self.clear)
+        self._subscription.start()
+
+    def stop(self):
+        if self._subscription is not None:
+            self._subscription.stop()
+            self._subscription = None
+
+    def _on_message(self, message):
+        target = message["data"]
+        self.forget(target.decode() if isinstance(target, bytes) else target)
+
+    def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        """Returns (seconds left, body), like RedisBackend; -1 means no expiry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return -2, None
+            body, expires_at = entry
+            if expires_at is None:
+                ttl = -1
+            else:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    self._pop(key)
+                    return -2, None
+                ttl = math.ceil(remaining)
+            self._entries.move_to_end(key)
+            return ttl, body
+
+    def put(self, key: str, body: bytes, ttl: Optional[int], generation: Optional[int] = None):
+        """
+        Caches the body for ttl seconds (None: until evicted). With a generation,
+        the body is dropped if an invalidation arrived since it was read.
+        """
+        if len(body) > self.max_bytes:
+            return
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._pop(key)
+            self._entries[key] = (body, expires_at)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+        RESPONSE_CACHE_L1_BYTES.set(self._size)
+
+    def forget(self, target: str):
+        """Drops the entry for a key, or every entry in a namespace (keys starting with "<target>:")."""
+        prefix = f"{target}:"
+        with self._lock:
+            for key in [key for key in self._entries if key == target or key.startswith(prefix)]:
+                self._pop(key)
+            self.generation += 1
+        RESPONSE_CACHE_L1_BYTES.set(self._size)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.generation += 1
+        RESPONSE_CACHE_L1_BYTES.set(0)
+
+    def _pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+class TieredBackend(RedisBackend):
+    """fastapi-cache backend reading the local cache first, then Redis."""
+
+    def __init__(self, redis, local: LocalResponseCache):
+        super().__init__(redis)
+        self.local = local
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        ttl, body = self.local.get_with_ttl(key)
+        if body is not None:
+            RESPONSE_CACHE_TIER_LOOKUPS.labels("l1", "hit").inc()
+            return ttl, body
+        RESPONSE_CACHE_TIER_LOOKUPS.labels("l1", "miss").inc()
+
+        generation = self.local.generation
+        ttl, body = await super().get_with_ttl(key)
+        if body is None:
+            RESPONSE_CACHE_TIER_LOOKUPS.labels("l2", "miss").inc()
+            return ttl, body
+        RESPONSE_CACHE_TIER_LOOKUPS.labels("l2", "hit").inc()
+        self.local.put(key, body, ttl if ttl > 0 else None, generation)
+        return ttl, body
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_with_ttl(key))[1]
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await super().set(key, value, expire)
+        self.local.put(key, value, expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        """Deletes a namespace or key from Redis, then from every process's local cache."""
+        if namespace:
+            # SCAN rather than RedisBackend's KEYS, which blocks Redis while it walks every key
+            keys = [found async for found in self.redis.scan_iter(match=f"{namespace}:*", count=500)]
+            removed = await self.redis.unlink(*keys) if keys else 0
+            target = namespace
+        elif key:
+            removed = await self.redis.delete(key)
+            target = key
+        else:
+            return 0
+        await self.redis.publish(RESPONSE_CACHE_INVALIDATION_CHANNEL, target)
+        # Don't wait for our own message to come back
+        self.local.forget(target)
+        return removed
+
+local_response_cache = LocalResponseCache(settings.RESPONSE_CACHE_L1_MAX_BYTES)
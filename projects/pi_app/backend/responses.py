@@ -0,0 +1,82 @@
+# backend/responses.py
+"""
+Fast JSON responses for read-heavy endpoints.
+
+The app's default response class is ORJSONResponse. Endpoints that return
+stored documents whose shape is guaranteed at write time can also skip the
+response_model pass (validate, then serialize) by returning an
+ORJSONResponse of the raw documents. Their `response_model` is then only used
+for the OpenAPI schema, so the query must project exactly the model's fields;
+`projection_for` builds that projection.
+
+`cache_response` is fastapi-cache's `cache` for such endpoints: the body is
+cached as the encoded bytes and a hit is sent back as they are, without
+decoding. The bytes are kept in the process and in Redis (see response_cache.py).
+Endpoints with a binary body return a Response and pass a coder for its
+media type, like PNGCoder.
+"""
+from functools import wraps
+from typing import Any, Dict, Optional, Type
+
+import orjson
+from fastapi_cache.coder import Coder
+from fastapi_cache.decorator import cache
+from fastapi_cache.types import KeyBuilder
+from pydantic import BaseModel
+from starlette.responses import Response
+
+# The name fastapi-cache gives the Response it injects into cached endpoints
+_CACHE_RESPONSE_PARAM = "__fastapi_cache_response"
+
+def projection_for(model: Type[BaseModel]) -> Dict[str, int]:
+    """A MongoDB projection returning exactly the model's fields."""
+    return {"_id": 0, **dict.fromkeys(model.model_fields, 1)}
+
+class ORJSONCoder(Coder):
+    """Caches JSON bodies as bytes and hands them back as a response, undecoded."""
+
+    media_type = "application/json"
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        if isinstance(value, Response):
+            return value.body
+        return orjson.dumps(value)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return orjson.loads(value)
+
+    @classmethod
+    def decode_as_type(cls, value: bytes, *, type_: Optional[Any]) -> Response:
+        return Response(content=value, media_type=cls.media_type)
+
+class PNGCoder(ORJSONCoder):
+    """For endpoints returning a PNG Response."""
+
+    media_type = "image/png"
+
+def cache_response(
+    expire: Optional[int] = None,
+    key_builder: Optional[KeyBuilder] = None,
+    coder: Type[Coder] = ORJSONCoder,
+):
+    """
+    `@cache(expire)` for endpoints that return a Response (or plain JSON data).
+    fastapi-cache puts its Cache-Control, ETag and X-FastAPI-Cache headers on the
+    injected Response, which FastAPI ignores when the endpoint returns its own,
+    so copy them over.
+    """
+    def decorator(func):
+        cached = cache(expire=expire, coder=coder, key_builder=key_builder)(func)
+
+        @wraps(cached)
+        async def endpoint(*args, **kwargs):
+            result = await cached(*args, **kwargs)
+            injected = kwargs.get(_CACHE_RESPONSE_PARAM)
+            if injected is not None and isinstance(result, Response) and result is not injected:
+                result.headers.update(injected.headers)
+            return result
+
+        return endpoint
+    return decorator
@@ -0,0 +1,93 @@
+# backend/revocation.py
+"""
+Token revocation.
+
+Revoked token IDs (the jti claim) are kept in a Redis sorted set scored by
+the token's expiry, so entries can be pruned once the token would have
+expired anyway. Each API process mirrors the set in a Bloom filter, kept
+current through a pub/sub channel and reloaded whenever that subscription
+is re-established. Most tokens are not revoked, and for those
+the filter answers without a network call. Only a filter hit is confirmed
+against Redis.
+"""
+import hashlib
+import threading
+import time
+from typing import Iterable, Optional
+
+from .redis_client import Subscription, get_redis
+
+REVOKED_KEY = "auth:revoked"
+REVOCATION_CHANNEL = "auth:revocations"
+
+class BloomFilter:
+    """A fixed-size Bloom filter over strings, using double hashing on one SHA-256 digest."""
+
+    def __init__(self, size_bits: int = 1 << 20, num_hashes: int = 7):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self._bits = bytearray(size_bits // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return ((h1 + i * h2) % self.size_bits for i in range(self.num_hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationList:
+    def __init__(self):
+        self._filter = BloomFilter()
+        self._lock = threading.Lock()
+        self._subscription: Optional[Subscription] = None
+
+    def _rebuild(self, jtis: Iterable[bytes]):
+        bloom = BloomFilter()
+        for jti in jtis:
+            bloom.add(jti.decode() if isinstance(jti, bytes) else jti)
+        with self._lock:
+            self._filter = bloom
+
+    def _reload(self):
+        self._rebuild(get_redis().zrange(REVOKED_KEY, 0, -1))
+
+    def start(self):
+        """Subscribes to revocation messages, then loads the current set (in that order, so none are missed)."""
+        get_redis().zremrangebyscore(REVOKED_KEY, "-inf", time.time())
+        self._subscription = Subscription(REVOCATION_CHANNEL, self._on_message, resync=self._reload)
+        self._subscription.start()
+
+    def stop(self):
+        if self._subscription is not None:
+            self._subscription.stop()
+            self._subscription = None
+
+    def _on_message(self, message):
+        jti = message["data"]
+        with self._lock:
+            self._filter.add(jti.decode() if isinstance(jti, bytes) else jti)
+
+    def revoke(self, jti: str, expires_at: float):
+        r = get_redis()
+        pipe = r.pipeline(transaction=True)
+        pipe.zadd(REVOKED_KEY, {jti: expires_at})
+        pipe.publish(REVOCATION_CHANNEL, jti)
+        pipe.execute()
+        # Don't wait for our own message to come back
+        with self._lock:
+            self._filter.add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        with self._lock:
+            maybe_revoked = jti in self._filter
+        if not maybe_revoked:
+            return False
+        return get_redis().zscore(REVOKED_KEY, jti) is not None
+
+revocation_list = RevocationList()
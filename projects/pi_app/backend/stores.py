@@ -0,0 +1,76 @@
+# backend/stores.py
+"""
+Store scoping.
+
+One deployment serves several stores. Products, the map and orders carry a
+`store_id`, every query on them filters on it, and their compound indexes lead
+with it. Redis keys and cached responses for those collections are namespaced
+by store as well.
+
+Sessions belong to a store: the login endpoints take it from the X-Store-ID
+header (a cart is configured for the store it is in) and put it in the tokens'
+"store" claim, and authenticated endpoints use the claim. The header is only a
+request: user and card documents may carry `store_ids`, the stores they can
+log in at, and a login naming any other store is refused. Admin accounts are
+always bound; one without `store_ids` can only manage the default store. Unauthenticated
+endpoints, such as the catalog and the map, read the header directly. With
+no header, the default store (DEFAULT_STORE_ID) is used, so a single-store
+deployment needs no changes.
+
+Users and cards without `store_ids` are shared by all stores. Admins only
+manage their own store's cards; cards without `store_ids` count as the
+default store's (see cards/routes.py).
+"""
+import hashlib
+from typing import Callable, List, Optional
+
+from fastapi import Header, HTTPException, status
+from fastapi_cache import FastAPICache
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .config import settings
+
+STORE_HEADER = "X-Store-ID"
+STORE_ID_PATTERN = r"^[a-z0-9][a-z0-9_-]{0,63}$"
+
+def store_from_header(
+    store_id: Optional[str] = Header(default=None, alias=STORE_HEADER, pattern=STORE_ID_PATTERN),
+) -> str:
+    return store_id or settings.DEFAULT_STORE_ID
+
+def check_store_access(store_ids: Optional[List[str]], store_id: str):
+    """Refuses a login at a store the account or card is not bound to. None means any store."""
+    if store_ids is not None and store_id not in store_ids:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Not allowed to log in at store '{store_id}'",
+        )
+
+def store_cache_namespace(store_id: str) -> str:
+    return f"store:{store_id}"
+
+async def clear_store_cache(store_id: str):
+    """Drops the store's cached responses in Redis and in every API process. Call after writing its products."""
+    await FastAPICache.clear(namespace=store_cache_namespace(store_id))
+
+def store_key_builder(
+    func: Callable,
+    namespace: str = "",
+    *,
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: tuple = (),
+    kwargs: dict,
+) -> str:
+    """
+    fastapi-cache key builder for endpoints with a `store_id` parameter. Keys
+    look like <prefix>:store:<store_id>:<endpoint>:<path and query hash>, so each
+    store's entries are separate and can be cleared on their own.
+    """
+    target = f"{request.url.path}?{request.url.query}" if request is not None else ""
+    target_hash = hashlib.md5(target.encode()).hexdigest()
+    return (
+        f"{namespace.rstrip(':')}:{store_cache_namespace(kwargs['store_id'])}:"
+        f"{func.__module__}.{func.__name__}:{target_hash}"
+    )
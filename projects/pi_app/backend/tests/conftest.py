@@ -7,8 +7,14 @@ from backend.database import (
     get_products_collection,
     get_users_collection,
     get_orders_collection,
+    get_cards_collection,
+    get_map_collection,
 )
+from backend.cards.registry import card_registry
 from backend.models import Role
+from backend.redis_client import get_redis
+from backend.pricing import bump_catalog_version
+from backend.response_cache import local_response_cache
 import hmac
 import hashlib
 
@@ -33,10 +39,14 @@ def setup_test_db(test_db):
     def override_get_products(): return test_db["products"]
     def override_get_users(): return test_db["users"]
     def override_get_orders(): return test_db["order_history"]
+    def override_get_cards(): return test_db["cards"]
+    def override_get_map(): return test_db["map"]
 
     app.dependency_overrides[get_products_collection] = override_get_products
     app.dependency_overrides[get_users_collection] = override_get_users
     app.dependency_overrides[get_orders_collection] = override_get_orders
+    app.dependency_overrides[get_cards_collection] = override_get_cards
+    app.dependency_overrides[get_map_collection] = override_get_map
 
     for c in test_db.list_collection_names():
         test_db.drop_collection(c)
@@ -47,13 +57,30 @@ def setup_test_db(test_db):
         {'id': 2, 'name': 'Glacier White 500GB', 'subtitle': 'PS4', 'price': 8000000, 'currency': 'VND', 'quantity': 5, 'unit': 'each', 'product_img_url': 'https://via.placeholder.com/80/f0f0f0/000000?Text=Console'},
         {'id': 3, 'name': 'Platinum Headset', 'subtitle': 'PS4', 'price': 2500000, 'currency': 'VND', 'quantity': 20, 'unit': 'each', 'product_img_url': 'https://via.placeholder.com/80/e0e0e0/000000?Text=Accessory'},
     ]
-    test_db.products.insert_many(initial_products)
+    test_db.products.insert_many([{**product, 'store_id': config.settings.DEFAULT_STORE_ID} for product in initial_products])
+    # Products were written directly, so tell the pricing engine the catalog changed
+    bump_catalog_version(config.settings.DEFAULT_STORE_ID)
+    test_db.cards.insert_many([
+        {"card_id": card_id, "user_identity": None, "status": "active", "expires_at": None}
+        for card_id in ("CARD123", "GUEST456", "TEMP789")
+    ])
+    card_registry.clear()
     
     yield # Run the test
     
     # Clear overrides after test
     app.dependency_overrides = {}
 
+@pytest.fixture(scope="function", autouse=True)
+def clear_stock_reservations():
+    """Drops cached stock levels, reservations, batched orders, rate-limit counters and responses so each test starts clean."""
+    r = get_redis()
+    for pattern in ("stock:*", "reservation:*", "reservations:*", "orders:*", "ratelimit:*", "fastapi-cache:*"):
+        keys = list(r.scan_iter(match=pattern))
+        if keys:
+            r.delete(*keys)
+    local_response_cache.clear()
+
 @pytest.fixture(scope="session")
 def client():
     """A test client for the app, created once per session."""
@@ -69,7 +96,7 @@ def db(test_db):
 def register_and_login_user(client):
     """Helper to register and log in a user, returning their tokens and identity."""
     def _register_and_login(email, password, is_admin=False):
-        register_email = config.ADMIN_EMAIL if is_admin else email
+        register_email = config.settings.ADMIN_EMAIL if is_admin else email
 
         client.post('/api/auth/register', json={"email": register_email, "password": password})
         response = client.post(
@@ -84,7 +111,7 @@ def register_and_login_user(client):
 def admin_auth_headers(register_and_login_user):
     """Returns authorization headers for an admin user."""
     access_token, refresh_token, _ = register_and_login_user(
-        config.ADMIN_EMAIL, "admin_pass", is_admin=True
+        config.settings.ADMIN_EMAIL, "admin_pass", is_admin=True
     )
     return {"Authorization": f"Bearer {access_token}"}, {"Authorization": f"Bearer {refresh_token}"}
 
@@ -104,17 +131,37 @@ def card_user_auth_headers(client):
     data = response.json()
     return {"Authorization": f"Bearer {data['access_token']}"}, {"Authorization": f"Bearer {data['refresh_token']}"}
 
+class TestDatabaseClient:
+    """Stands in for the workers' MongoClient, with the test database as shopping_cart_db."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, name):
+        return self._db
+
+    def start_session(self, **kwargs):
+        return self._db.client.start_session(**kwargs)
+
+@pytest.fixture
+def worker_db_client(db, monkeypatch):
+    """
+    Points the inventory tasks at the test database. Skips unless MongoDB runs
+    as a replica set, which their stock transactions need.
+    """
+    if db.client.admin.command("hello").get("setName") is None:
+        pytest.skip("inventory transactions need MongoDB running as a replica set")
+    client = TestDatabaseClient(db)
+    monkeypatch.setattr("backend.orders.tasks.get_db_client", lambda: client)
+    return client
+
 @pytest.fixture
-def mock_celery_process_order(monkeypatch):
-    """Mocks the Celery process_order task."""
-    mock_delay_called = []
-    class MockProcessOrder:
-        def delay(self, *args, **kwargs):
-            mock_delay_called.append({"args": args, "kwargs": kwargs})
-            # Mock a Celery AsyncResult object
-            return type('obj', (object,), {'id': 'mock_task_id'})()
-    monkeypatch.setattr("backend.orders.routes.process_order", MockProcessOrder())
-    return mock_delay_called
+def submitted_paid_orders(monkeypatch):
+    """Records the order IDs queued for inventory processing instead of queuing them."""
+    submitted = []
+    monkeypatch.setattr("backend.orders.batching.submit_paid_order", submitted.append)
+    monkeypatch.setattr("backend.orders.watcher.submit_paid_order", submitted.append)
+    return submitted
 
 @pytest.fixture
 def generate_webhook_signature_helper():
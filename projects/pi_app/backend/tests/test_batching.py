@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+
+from backend.models import OrderStatus
+from backend.orders import batching
+from backend.orders.batching import BATCH_KEY, drain_batch, flush_order_batch
+from backend.orders.reservations import reserve_stock
+from backend.orders.tasks import process_order_batch
+from backend.redis_client import get_redis
+
+def paid_order(order_id, quantity):
+    """A PAID order in the default store for quantity consoles (product 2, 5 in stock)."""
+    price = 8000000
+    return {
+        "order_id": order_id, "user_identity": "client@example.com", "store_id": "main",
+        "items": [{"id": 2, "name": "Glacier White 500GB", "subtitle": "PS4", "price": price, "quantity": quantity, "unit": "each"}],
+        "shipping_cost": 0.0, "subtotal": price * quantity, "total_cost": price * quantity,
+        "status": OrderStatus.PAID.value, "created_at": datetime(2025, 6, 1),
+    }
+
+def test_flushing_an_empty_buffer_does_nothing(monkeypatch):
+    """Test that a flush scheduled for a buffer another flush already drained is a no-op."""
+    monkeypatch.setattr(batching, "process_order_batch", lambda order_ids: pytest.fail("processed an empty batch"))
+    assert drain_batch(10) == []
+    assert flush_order_batch() == {}
+
+def test_drained_orders_are_removed_exactly_once(monkeypatch):
+    """Test that each buffered order is handed to exactly one drain, oldest first, and leftovers get another flush."""
+    reflushes = []
+    monkeypatch.setattr(batching.flush_order_batch, "delay", lambda: reflushes.append(True))
+    get_redis().rpush(BATCH_KEY, "o1", "o2", "o3")
+
+    assert drain_batch(2) == ["o1", "o2"]
+    assert reflushes == [True]
+    assert drain_batch(2) == ["o3"]
+    assert reflushes == [True]
+    assert drain_batch(2) == []
+    assert get_redis().llen(BATCH_KEY) == 0
+
+def test_oversubscribed_batch_is_served_in_arrival_order(db, worker_db_client):
+    """Test that when a batch wants more than is in stock, the earliest orders complete and the rest fail and release their reservations."""
+    orders = {"first": 2, "second": 2, "third": 2}
+    db.order_history.insert_many([paid_order(order_id, quantity) for order_id, quantity in orders.items()])
+    # The cached level was stale, so every order got a reservation
+    for order_id, quantity in orders.items():
+        reserve_stock(order_id, "main", {2: quantity}, lambda product_ids: {2: 6})
+
+    results = process_order_batch(["first", "second", "third"])
+
+    assert results == {"first": "success", "second": "success", "third": "failure"}
+    statuses = {o["order_id"]: o["status"] for o in db.order_history.find({}, {"order_id": 1, "status": 1})}
+    assert statuses == {"first": OrderStatus.COMPLETED.value, "second": OrderStatus.COMPLETED.value, "third": OrderStatus.FAILED.value}
+    assert db.products.find_one({"id": 2})["quantity"] == 1
+    # The completed orders' reservations were finalized and the failed one's released
+    assert int(get_redis().get("stock:reserved:main:2")) == 0
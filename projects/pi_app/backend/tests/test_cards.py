@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from backend import config
+from jose import jwt
+
+def test_provision_cards_batch(client, db, admin_auth_headers):
+    """Test bulk card provisioning creates new cards and overwrites existing ones."""
+    access_headers, _ = admin_auth_headers
+    response = client.post('/api/cards/batch', headers=access_headers, json={"cards": [
+        {"card_id": "LOYAL001", "user_identity": "loyal@example.com"},
+        {"card_id": "LOYAL002"},
+        {"card_id": "CARD123", "status": "blocked"},
+    ]})
+    assert response.status_code == 200
+    assert response.json() == {"created": 2, "updated": 1}
+    assert db.cards.find_one({"card_id": "LOYAL001"})['user_identity'] == "loyal@example.com"
+    assert db.cards.find_one({"card_id": "CARD123"})['status'] == "blocked"
+
+def test_provision_cards_requires_admin(client, shop_client_auth_headers):
+    """Test that only admins can provision cards."""
+    access_headers, _ = shop_client_auth_headers
+    response = client.post('/api/cards/batch', headers=access_headers, json={"cards": [{"card_id": "LOYAL001"}]})
+    assert response.status_code == 403
+
+def test_provisioned_card_logs_in_as_linked_user(client, admin_auth_headers):
+    """Test that a newly provisioned card works without a restart and logs in as its account."""
+    access_headers, _ = admin_auth_headers
+    # Cache a miss for the card before it exists
+    assert client.post('/api/auth/card_login', json={"card_id": "LOYAL001"}).status_code == 401
+    client.post('/api/cards/batch', headers=access_headers, json={"cards": [
+        {"card_id": "LOYAL001", "user_identity": "loyal@example.com"},
+    ]})
+    response = client.post('/api/auth/card_login', json={"card_id": "LOYAL001"})
+    assert response.status_code == 200
+    decoded_token = jwt.decode(response.json()['access_token'], config.settings.JWT_SECRET_KEY, algorithms=["HS256"])
+    assert decoded_token['sub'] == "loyal@example.com"
+
+def test_blocked_card_is_rejected(client, admin_auth_headers):
+    """Test that blocking a cached card takes effect on the next tap."""
+    access_headers, _ = admin_auth_headers
+    assert client.post('/api/auth/card_login', json={"card_id": "CARD123"}).status_code == 200
+    response = client.patch('/api/cards/CARD123', headers=access_headers, json={"status": "blocked"})
+    assert response.status_code == 200
+    assert response.json()['status'] == "blocked"
+    assert client.post('/api/auth/card_login', json={"card_id": "CARD123"}).status_code == 401
+
+def test_expired_card_is_rejected(client, db):
+    """Test that a card past its expiry cannot log in."""
+    db.cards.update_one({"card_id": "TEMP789"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(minutes=1)}})
+    response = client.post('/api/auth/card_login', json={"card_id": "TEMP789"})
+    assert response.status_code == 401
+
+def test_admin_only_manages_its_own_stores_cards(client, db):
+    """Test that an admin bound to another store can't read, change or overwrite the default store's cards."""
+    client.post('/api/auth/register', json={"email": config.settings.ADMIN_EMAIL, "password": "admin_pass"})
+    db.users.update_one({"email": config.settings.ADMIN_EMAIL}, {"$set": {"store_ids": ["north"]}})
+    response = client.post(
+        '/api/auth/login', data={"username": config.settings.ADMIN_EMAIL, "password": "admin_pass"}, headers={"X-Store-ID": "north"},
+    )
+    north_admin = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    # CARD123 has no store_ids, so it is the default store's
+    assert client.get('/api/cards/CARD123', headers=north_admin).status_code == 404
+    assert client.patch('/api/cards/CARD123', headers=north_admin, json={"status": "blocked"}).status_code == 404
+    response = client.post('/api/cards/batch', headers=north_admin, json={"cards": [{"card_id": "CARD123", "store_ids": ["north"]}]})
+    assert response.status_code == 403
+    assert db.cards.find_one({"card_id": "CARD123"})['status'] == "active"
+
+    # New cards are bound to the admin's store, and can't be handed to another one
+    response = client.post('/api/cards/batch', headers=north_admin, json={"cards": [{"card_id": "NORTH001"}]})
+    assert response.status_code == 200
+    assert db.cards.find_one({"card_id": "NORTH001"})['store_ids'] == ["north"]
+    response = client.patch('/api/cards/NORTH001', headers=north_admin, json={"store_ids": ["main"]})
+    assert response.status_code == 403
+    response = client.post('/api/cards/batch', headers=north_admin, json={"cards": [{"card_id": "NORTH002", "store_ids": ["north", "main"]}]})
+    assert response.status_code == 403
+    assert client.get('/api/cards/NORTH001', headers=north_admin).json()['store_ids'] == ["north"]
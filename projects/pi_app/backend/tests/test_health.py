@@ -0,0 +1,27 @@
+def test_healthz(client):
+    """Test that the liveness probe answers immediately."""
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+def test_readyz_after_startup(client):
+    """Test that the readiness probe reports ready once the background startup work is done."""
+    from backend.health import startup_complete
+
+    assert startup_complete.wait(timeout=30)
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
+
+def test_seeding_is_idempotent(db, monkeypatch):
+    """Test that seeding twice leaves the same products and does not duplicate anything."""
+    from backend import database
+
+    for name in ("products", "map", "cards", "seed_state"):
+        monkeypatch.setattr(database, f"get_{name}_collection", lambda name=name: db[name])
+    database.seed_database_if_empty()
+    first = list(db.products.find({}, {"_id": 0}).sort("id"))
+    database.seed_database_if_empty()
+    assert list(db.products.find({}, {"_id": 0}).sort("id")) == first
+    assert db.map.count_documents({"name": "mall_map"}) == 1
+    assert db.cards.count_documents({}) == 3
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from backend.benchmarks import import_time
+
+def test_worker_does_not_import_api():
+    """Test that the Celery worker's entry point pulls in neither FastAPI routers nor checkout-only modules."""
+    code = (
+        "import sys, backend.celery_app as worker; worker.celery_app.loader.import_default_modules(); "
+        "print(sorted(m for m in ('fastapi', 'backend.app', 'backend.products.routes', 'qrcode', 'passlib') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+def test_api_defers_checkout_only_modules():
+    """Test that qrcode and passlib are not loaded at API startup."""
+    code = "import sys, backend.app; print(sorted(m for m in ('qrcode', 'passlib') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+# Wall-clock budgets are flaky on shared runners; CI runs the benchmark as its own step instead
+@pytest.mark.skipif(not os.environ.get("RUN_IMPORT_TIME_BUDGET"), reason="set RUN_IMPORT_TIME_BUDGET=1 to check import time budgets")
+def test_import_time_within_budget():
+    """Test that cold imports of the API and the worker stay within their budgets."""
+    assert import_time.run()
@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+
+def test_webhook_payload_is_accepted_by_backend_signature():
+    """Test that the load generator signs webhooks exactly like VietQR does."""
+    from backend.loadtest.fleet import webhook_payload
+    from backend.models import VietQRWebhookPayload
+    from backend.orders.routes import generate_vietqr_webhook_signature
+    from backend import config
+
+    payload = webhook_payload("order-1", 150000, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
+    assert generate_vietqr_webhook_signature(VietQRWebhookPayload(**payload)) == payload["signature"]
+
+def test_percentile_nearest_rank():
+    """Test the report's percentile calculation."""
+    from backend.loadtest.fleet import percentile
+
+    samples = [i / 1000 for i in range(1, 101)]
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([], 50) == 0
+
+def test_vietqr_stub_generates_qr():
+    """Test that the stub answers in the shape checkout expects."""
+    from backend.loadtest.vietqr_stub import app as stub_app
+    from backend.models import VietQRGenerateResponse
+
+    with TestClient(stub_app) as stub:
+        response = stub.post('/v2/generate', json={
+            "accountNo": "1234567890", "accountName": "NGUYEN VAN A", "acqId": 970436,
+            "amount": 150000, "addInfo": "Thanh toan don hang order-1",
+        })
+    assert response.status_code == 200
+    parsed = VietQRGenerateResponse.model_validate(response.json())
+    assert parsed.code == "00" and parsed.data.qrCode
@@ -0,0 +1,32 @@
+import json
+import logging
+
+def test_request_id_is_echoed_or_generated(client):
+    """Test that responses carry the caller's X-Request-ID, or a generated one."""
+    response = client.get('/api/products', headers={"X-Request-ID": "req-123"})
+    assert response.headers["X-Request-ID"] == "req-123"
+    assert client.get('/api/products').headers["X-Request-ID"]
+
+def test_json_formatter_includes_request_id_and_extra_fields():
+    """Test that records are rendered as one JSON object with context and extra fields."""
+    from backend.log import ContextFilter, JsonFormatter, request_id_var
+
+    record = logging.LogRecord("backend.orders", logging.INFO, __file__, 1, "Payment confirmed", None, None)
+    record.order_id = "order-1"
+    token = request_id_var.set("req-123")
+    try:
+        assert ContextFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Payment confirmed"
+    assert entry["request_id"] == "req-123"
+    assert entry["order_id"] == "order-1"
+
+def test_sampled_records_are_dropped_at_rate_zero():
+    """Test that records with sample_rate=0 never reach the queue."""
+    from backend.log import ContextFilter
+
+    record = logging.LogRecord("backend.products", logging.INFO, __file__, 1, "cache miss", None, None)
+    record.sample_rate = 0.0
+    assert not ContextFilter().filter(record)
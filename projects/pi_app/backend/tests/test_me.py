@@ -18,7 +18,7 @@ def test_update_user_status_success(client, shop_client_auth_headers):
     
     # Decode the new token and verify claims
     new_token = data['access_token']
-    decoded_new_token = jwt.decode(new_token, config.JWT_SECRET_KEY, algorithms=["HS256"])
+    decoded_new_token = jwt.decode(new_token, config.settings.JWT_SECRET_KEY, algorithms=["HS256"])
     
     assert decoded_new_token['sub'] == "client@example.com"
     assert decoded_new_token['role'] == "shop_client" # from models.Role enum
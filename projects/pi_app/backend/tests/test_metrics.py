@@ -0,0 +1,14 @@
+def test_metrics_endpoint_reports_routes_and_cache(client):
+    """Test that /metrics exposes per-route latency and cache hit/miss counts."""
+    client.get('/api/products')
+    client.get('/api/products')
+    client.get('/api/products/1')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/products",status="200"}' in body
+    assert 'route="/api/products/{product_id}"' in body
+    assert 'response_cache_requests_total{route="/api/products",result="hit"}' in body
+    assert 'mongo_command_duration_seconds' in body
+    assert 'route="/metrics"' not in body
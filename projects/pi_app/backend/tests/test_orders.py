@@ -1,4 +1,17 @@
+from backend import config
+from backend.app import app
+from backend.database import get_orders_collection
+from backend.log import ContextFilter
 from backend.models import OrderStatus
+from backend.orders import tasks
+from backend.orders.batching import catch_up
+from backend.orders.reservations import StockUnavailableError, reserve_stock
+from backend.orders.watcher import handle_change
+from backend.tracing import links_to
+from datetime import datetime
+import httpx
+import logging
+import pytest
 import time
 
 def test_checkout_requires_auth(client):
@@ -53,6 +66,55 @@ def test_initiate_checkout_success(client, shop_client_auth_headers, db):
     assert order_in_db['status'] == OrderStatus.PENDING.value
     assert order_in_db['total_cost'] == 69.0
 
+def test_initiate_checkout_insufficient_stock(client, shop_client_auth_headers, db):
+    """Test that checkout fails fast when the cart asks for more than the available stock."""
+    access_headers, _ = shop_client_auth_headers
+    checkout_payload = {
+        "items": [{"id": 2, "name": "Glacier White 500GB", "subtitle": "PS4", "price": 8000000, "currency": "VND", "quantity": 6, "unit": "each"}],
+        "shipping_cost": 0.0,
+        "subtotal": 48000000,
+        "total_cost": 48000000
+    }
+    response = client.post('/api/orders/checkout', headers=access_headers, json=checkout_payload)
+    assert response.status_code == 409
+    assert "Insufficient stock" in response.json()['detail']
+    assert db.order_history.count_documents({}) == 0
+    # Stock in MongoDB is untouched until a paid order is committed
+    assert db.products.find_one({"id": 2})['quantity'] == 5
+
+@pytest.mark.parametrize("vietqr_status, vietqr_body", [
+    (500, {"code": "99", "desc": "Internal error"}),
+    (200, {"code": "00", "data": {"qrCode": "no desc, no qrDataURL"}}),
+])
+def test_checkout_releases_stock_when_qr_generation_fails(client, shop_client_auth_headers, monkeypatch, vietqr_status, vietqr_body):
+    """Test that an error status or a malformed body from VietQR gives 503 and releases the held stock."""
+    async def fake_post(self, url, **kwargs):
+        return httpx.Response(vietqr_status, json=vietqr_body, request=httpx.Request("POST", url))
+    monkeypatch.setattr(httpx.AsyncClient, "post", fake_post)
+    access_headers, _ = shop_client_auth_headers
+    # All 5 in stock, so a reservation left behind would make the second attempt a 409
+    checkout_payload = {
+        "items": [{"id": 2, "name": "Glacier White 500GB", "subtitle": "PS4", "price": 8000000, "currency": "VND", "quantity": 5, "unit": "each"}],
+        "shipping_cost": 0.0, "subtotal": 40000000, "total_cost": 40000000,
+    }
+    for _ in range(2):
+        response = client.post('/api/orders/checkout', headers=access_headers, json=checkout_payload)
+        assert response.status_code == 503
+
+def test_initiate_checkout_price_mismatch(client, shop_client_auth_headers, db):
+    """Test that checkout rejects item prices that don't match the catalog, even if the totals add up."""
+    access_headers, _ = shop_client_auth_headers
+    checkout_payload = {
+        "items": [{"id": 1, "name": "Fifa 19", "subtitle": "PS4", "price": 1000, "currency": "VND", "quantity": 1, "unit": "pack"}],
+        "shipping_cost": 0.0,
+        "subtotal": 1000,
+        "total_cost": 1000
+    }
+    response = client.post('/api/orders/checkout', headers=access_headers, json=checkout_payload)
+    assert response.status_code == 409
+    assert "has changed" in response.json()['detail']
+    assert db.order_history.count_documents({}) == 0
+
 def test_get_order_history_requires_auth(client):
     """Test that viewing order history requires authentication."""
     response = client.get('/api/orders/history')
@@ -96,6 +158,43 @@ def test_get_order_history_success(client, shop_client_auth_headers):
     assert any(o['order_id'] == order_id for o in data)
     assert any(o['status'] == OrderStatus.COMPLETED.value for o in data)
 
+def test_get_order_history_reads_archive(client, shop_client_auth_headers, db):
+    """Test that orders moved to the monthly archive still appear in the history, after recent ones."""
+    access_headers, _ = shop_client_auth_headers
+    base_order = {
+        "user_identity": "client@example.com",
+        "store_id": "main",
+        "items": [{"id": 1, "name": "Fifa 19", "subtitle": "PS4", "price": 1500000, "currency": "VND", "quantity": 1, "unit": "pack"}],
+        "shipping_cost": 0.0, "subtotal": 1500000, "total_cost": 1500000,
+        "status": OrderStatus.COMPLETED.value,
+    }
+    db.order_history.insert_one({**base_order, "order_id": "recent_order", "created_at": datetime(2025, 6, 1)})
+    db.order_archive_2024_01.insert_one({**base_order, "order_id": "archived_order", "created_at": datetime(2024, 1, 15)})
+    db.order_archive_index.insert_one({"store_id": "main", "user_identity": "client@example.com", "month": "order_archive_2024_01"})
+
+    response = client.get('/api/orders/history', headers=access_headers)
+    assert response.status_code == 200
+    assert [o['order_id'] for o in response.json()] == ["recent_order", "archived_order"]
+
+    response = client.get('/api/orders/history?limit=1', headers=access_headers)
+    assert [o['order_id'] for o in response.json()] == ["recent_order"]
+
+def test_get_order_history_skips_abandoned_checkouts(client, shop_client_auth_headers, db):
+    """Test that a checkout whose QR code expired unpaid is not listed as a failed order."""
+    access_headers, _ = shop_client_auth_headers
+    base_order = {
+        "user_identity": "client@example.com",
+        "store_id": "main",
+        "items": [{"id": 1, "name": "Fifa 19", "subtitle": "PS4", "price": 1500000, "currency": "VND", "quantity": 1, "unit": "pack"}],
+        "shipping_cost": 0.0, "subtotal": 1500000, "total_cost": 1500000,
+        "status": OrderStatus.FAILED.value, "created_at": datetime(2025, 6, 1),
+    }
+    db.order_history.insert_one({**base_order, "order_id": "abandoned_order", "abandoned_at": datetime(2025, 6, 1)})
+    db.order_history.insert_one({**base_order, "order_id": "failed_order"})
+
+    response = client.get('/api/orders/history', headers=access_headers)
+    assert [o['order_id'] for o in response.json()] == ["failed_order"]
+
 def test_get_order_status_success(client, shop_client_auth_headers):
     """Test successful retrieval of order status from the public endpoint."""
     access_headers, _ = shop_client_auth_headers
@@ -134,11 +233,11 @@ def test_get_order_history_no_completed_orders(client, shop_client_auth_headers)
     response = client.get('/api/orders/history', headers=access_headers)
     assert response.json() == [] # Still empty as status is PENDING
 
-def test_receive_payment_webhook_success(client, db, mock_celery_process_order, generate_webhook_signature_helper):
+def test_receive_payment_webhook_success(client, db, generate_webhook_signature_helper, submitted_paid_orders):
     """Test successful payment webhook processing."""
     # Create a pending order first
-    client.post('/api/auth/register', json={"email": "webhook_test@example.com", "password": "pass"})
-    login_res = client.post('/api/auth/login', data={"username": "webhook_test@example.com", "password": "pass"})
+    client.post('/api/auth/register', json={"email": "webhook_test@example.com", "password": "webhook_pass"})
+    login_res = client.post('/api/auth/login', data={"username": "webhook_test@example.com", "password": "webhook_pass"})
     access_token = login_res.json()['access_token']
     
     checkout_payload = {
@@ -160,15 +259,23 @@ def test_receive_payment_webhook_success(client, db, mock_celery_process_order,
         "extraData": "extra",
         "signature": "" # Will be calculated
     }
-    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.VIETQR_WEBHOOK_SECRET_KEY)
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
 
     response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
     assert response.status_code == 200
     data = response.json()
     assert "message" in data
+    paid_order = db.order_history.find_one({"order_id": order_id})
+    assert paid_order['status'] == OrderStatus.PAID.value
+    assert isinstance(paid_order['paid_at'], datetime)
+    # Queued by the watcher; the stall sweep would queue it again if its batch were lost
+    assert catch_up(db.order_history) == 1
+    assert submitted_paid_orders == [order_id]
+
+    # A repeated confirmation must not move the order again
+    response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
+    assert response.status_code == 200
     assert db.order_history.find_one({"order_id": order_id})['status'] == OrderStatus.PAID.value
-    assert len(mock_celery_process_order) == 1 # Ensure Celery task was called
-    assert mock_celery_process_order[0]['args'][0] == order_id
 
 def test_receive_payment_webhook_invalid_signature(client):
     """Test webhook with invalid signature."""
@@ -197,7 +304,7 @@ def test_receive_payment_webhook_amount_mismatch(client, db, shop_client_auth_he
         "description": "Payment for order", "referenceId": order_id, "merchantId": "MOCK_MERCHANT",
         "extraData": "extra", "signature": ""
     }
-    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.VIETQR_WEBHOOK_SECRET_KEY)
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
 
     response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
     assert response.status_code == 400
@@ -212,7 +319,7 @@ def test_receive_payment_webhook_order_not_found(client, generate_webhook_signat
         "description": "Test", "referenceId": "non_existent_order", "merchantId": "MOCK",
         "extraData": "data", "signature": ""
     }
-    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.VIETQR_WEBHOOK_SECRET_KEY)
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
     response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
     assert response.status_code == 404
     data = response.json()
@@ -233,4 +340,167 @@ def test_receive_payment_webhook_validation_error(client):
     assert response.status_code == 422
     data = response.json()
     assert "detail" in data
-    assert any(err['loc'] == ['body', 'amount'] for err in data['detail'])
\ No newline at end of file
+    assert any(err['loc'] == ['body', 'amount'] for err in data['detail'])
+
+def test_commit_inventory_rolls_back_when_anything_falls_short(db, worker_db_client):
+    """Test that an aborted inventory transaction leaves every product quantity and order status as it was."""
+    db.order_history.insert_many([
+        {"order_id": order_id, "store_id": "main", "status": status.value}
+        for order_id, status in (("paid_1", OrderStatus.PAID), ("paid_2", OrderStatus.PAID), ("done", OrderStatus.COMPLETED))
+    ])
+    def snapshot():
+        quantities = {p["id"]: p["quantity"] for p in db.products.find({}, {"id": 1, "quantity": 1})}
+        statuses = {o["order_id"]: o["status"] for o in db.order_history.find({}, {"order_id": 1, "status": 1})}
+        return quantities, statuses
+    before = snapshot()
+
+    # Product 1 is decremented before product 2 turns out to be short
+    assert not tasks.commit_inventory(worker_db_client, "main", {1: 2, 2: 6}, ["paid_1", "paid_2"])
+    assert snapshot() == before
+    # Stock suffices, but one of the orders was already completed
+    assert not tasks.commit_inventory(worker_db_client, "main", {1: 2, 2: 1}, ["paid_1", "done"])
+    assert snapshot() == before
+
+    assert tasks.commit_inventory(worker_db_client, "main", {1: 2, 2: 1}, ["paid_1", "paid_2"])
+    quantities, statuses = snapshot()
+    assert quantities == {**before[0], 1: 8, 2: 4}
+    assert statuses == {"paid_1": OrderStatus.COMPLETED.value, "paid_2": OrderStatus.COMPLETED.value, "done": OrderStatus.COMPLETED.value}
+
+def test_links_to_round_trips_stored_trace_context():
+    """Test that a stored trace context turns back into a span link, and junk is skipped."""
+    carrier = {"traceparent": "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"}
+    links = links_to([carrier, None, {}, {"traceparent": "garbage"}])
+    assert len(links) == 1
+    assert format(links[0].context.trace_id, "032x") == "0af7651916cd43dd8448eb211c80319c"
+
+def test_checkout_request_id_follows_order_to_batch_task(
+    client, db, shop_client_auth_headers, generate_webhook_signature_helper, submitted_paid_orders, monkeypatch,
+):
+    """Test that the watcher and the batch task log a paid order under its checkout's request ID."""
+    access_headers, _ = shop_client_auth_headers
+    res = client.post('/api/orders/checkout', headers={**access_headers, "X-Request-ID": "req-checkout"}, json={
+        "items": [{"id": 1, "name": "Fifa 19", "subtitle": "PS4", "price": 1500000, "currency": "VND", "quantity": 1, "unit": "pack"}],
+        "shipping_cost": 5.0, "subtotal": 64.0, "total_cost": 69.0,
+    })
+    order_id = res.json()['order_id']
+    assert db.order_history.find_one({"order_id": order_id})['request_id'] == "req-checkout"
+
+    webhook_payload_data = {
+        "paymentRequestId": "txn_req", "state": "SUCCESS", "amount": 69, "description": "Payment for order",
+        "referenceId": order_id, "merchantId": "MOCK_MERCHANT", "extraData": "extra", "signature": "",
+    }
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
+    client.post('/api/orders/webhook/payment_confirmation', headers={"X-Request-ID": "req-webhook"}, json=webhook_payload_data)
+
+    records = []
+    handler = logging.Handler(logging.INFO)
+    handler.addFilter(ContextFilter())
+    handler.emit = records.append
+    orders_logger = logging.getLogger("backend.orders")
+    monkeypatch.setattr(orders_logger, "level", logging.INFO)
+    orders_logger.addHandler(handler)
+    try:
+        # What the watcher receives for the PENDING -> PAID update
+        paid_order = db.order_history.find_one({"order_id": order_id}, {"_id": 0, "order_id": 1, "trace_context": 1, "request_id": 1})
+        handle_change({"fullDocument": paid_order})
+        assert submitted_paid_orders == [order_id]
+
+        # The flush task, with the stock transaction stubbed out
+        monkeypatch.setattr(tasks, "get_db_client", lambda: {"shopping_cart_db": db})
+        monkeypatch.setattr(tasks, "process_store_orders", lambda client, store_id, orders, trace_contexts: {o.order_id: "success" for o in orders})
+        assert tasks.process_order_batch([order_id]) == {order_id: "success"}
+    finally:
+        orders_logger.removeHandler(handler)
+
+    order_records = [r for r in records if getattr(r, "order_id", None) == order_id]
+    assert {r.name for r in order_records} == {"backend.orders.watcher", "backend.orders.tasks"}
+    assert {r.request_id for r in order_records} == {"req-checkout"}
+
+def test_late_payment_for_abandoned_order_is_flagged(client, db, generate_webhook_signature_helper):
+    """Test that a payment arriving after the order expired is recorded, not silently dropped."""
+    db.order_history.insert_one({
+        "order_id": "expired_order", "user_identity": "client@example.com", "store_id": "main",
+        "items": [], "shipping_cost": 0.0, "subtotal": 69, "total_cost": 69,
+        "status": OrderStatus.FAILED.value, "created_at": datetime(2025, 6, 1), "abandoned_at": datetime(2025, 6, 1),
+    })
+    webhook_payload_data = {
+        "paymentRequestId": "txn_late", "state": "SUCCESS", "amount": 69, "description": "Payment for order",
+        "referenceId": "expired_order", "merchantId": "MOCK_MERCHANT", "extraData": "extra", "signature": "",
+    }
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
+
+    response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
+    assert response.status_code == 200
+    assert "flagged for reconciliation" in response.json()['message']
+    order = db.order_history.find_one({"order_id": "expired_order"})
+    assert order['status'] == OrderStatus.FAILED.value
+    assert order['late_payment']['payment_request_id'] == "txn_late"
+    assert order['late_payment']['amount'] == 69
+    # Kept out of reach of the TTL index that deletes abandoned orders
+    assert 'abandoned_at' not in order
+
+class ChangedAfterRead:
+    """order_history as the webhook sees it when something else updates the order right after it is read."""
+
+    def __init__(self, orders_collection, change):
+        self.orders_collection = orders_collection
+        self.change = change
+
+    def find_one(self, query, *args, **kwargs):
+        order = self.orders_collection.find_one(query, *args, **kwargs)
+        if self.change is not None:
+            self.orders_collection.update_one(query, {"$set": self.change})
+            self.change = None
+        return order
+
+    def __getattr__(self, name):
+        return getattr(self.orders_collection, name)
+
+def test_payment_racing_the_expiry_sweeper_is_flagged(client, db, generate_webhook_signature_helper, monkeypatch):
+    """Test that a payment losing the race to expiry releases the stock and is flagged, not confirmed."""
+    db.order_history.insert_one({
+        "order_id": "racing_order", "user_identity": "client@example.com", "store_id": "main",
+        "items": [], "shipping_cost": 0.0, "subtotal": 69, "total_cost": 69,
+        "status": OrderStatus.PENDING.value, "created_at": datetime.utcnow(),
+    })
+    reserve_stock("racing_order", "main", {2: 5}, lambda product_ids: {2: 5})
+    # The expiry sweeper fails the order between the webhook's read and its update
+    swept = ChangedAfterRead(db.order_history, {"status": OrderStatus.FAILED.value, "abandoned_at": datetime.utcnow()})
+    monkeypatch.setitem(app.dependency_overrides, get_orders_collection, lambda: swept)
+    webhook_payload_data = {
+        "paymentRequestId": "txn_race", "state": "SUCCESS", "amount": 69, "description": "Payment for order",
+        "referenceId": "racing_order", "merchantId": "MOCK_MERCHANT", "extraData": "extra", "signature": "",
+    }
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
+
+    response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
+    assert response.status_code == 200
+    assert "flagged for reconciliation" in response.json()['message']
+    order = db.order_history.find_one({"order_id": "racing_order"})
+    assert order['status'] == OrderStatus.FAILED.value
+    assert order['late_payment']['payment_request_id'] == "txn_race"
+    # The whole stock is available again; raises StockUnavailableError if the reservation leaked
+    reserve_stock("next_order", "main", {2: 5}, lambda product_ids: {2: 5})
+
+def test_failure_webhook_does_not_undo_a_payment(client, db, generate_webhook_signature_helper, monkeypatch):
+    """Test that a failure notice racing the PAID transition leaves the order paid and its stock reserved."""
+    db.order_history.insert_one({
+        "order_id": "paid_meanwhile", "user_identity": "client@example.com", "store_id": "main",
+        "items": [], "shipping_cost": 0.0, "subtotal": 69, "total_cost": 69,
+        "status": OrderStatus.PENDING.value, "created_at": datetime.utcnow(),
+    })
+    reserve_stock("paid_meanwhile", "main", {2: 5}, lambda product_ids: {2: 5})
+    paid = ChangedAfterRead(db.order_history, {"status": OrderStatus.PAID.value})
+    monkeypatch.setitem(app.dependency_overrides, get_orders_collection, lambda: paid)
+    webhook_payload_data = {
+        "paymentRequestId": "txn_failed", "state": "FAILED", "amount": 69, "description": "Payment for order",
+        "referenceId": "paid_meanwhile", "merchantId": "MOCK_MERCHANT", "extraData": "extra", "signature": "",
+    }
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
+
+    response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
+    assert response.status_code == 200
+    assert db.order_history.find_one({"order_id": "paid_meanwhile"})['status'] == OrderStatus.PAID.value
+    # Still reserved for the paid order
+    with pytest.raises(StockUnavailableError):
+        reserve_stock("next_order", "main", {2: 1}, lambda product_ids: {2: 5})
@@ -1,4 +1,4 @@
-from backend.models import Role
+from backend.models import Product, Role
 
 def test_get_products(client):
     """Test retrieving all products."""
@@ -16,6 +16,30 @@ def test_get_product_by_id(client):
     assert data['id'] == 1
     assert data['name'] == 'Fifa 19'
 
+def test_get_products_cache_hit_serves_stored_body(client):
+    """Test that a cache hit sends the cached JSON body with the cache headers."""
+    first = client.get('/api/products')
+    second = client.get('/api/products')
+    assert second.status_code == 200
+    assert second.headers['X-FastAPI-Cache'] == 'HIT'
+    assert second.headers['content-type'] == 'application/json'
+    assert 'ETag' in second.headers
+    assert second.json() == first.json()
+
+def test_get_product_sends_only_model_fields(client, db):
+    """Test that fields stored alongside a product, like map locations, are not sent."""
+    db.products.insert_one({
+        'id': 50, 'name': 'Coffee', 'subtitle': 'Beans', 'price': 120000.0, 'currency': 'VND',
+        'quantity': 4, 'unit': 'pack', 'product_img_url': None, 'barcode': '8934567000050',
+        'location': [{"x": 10, "y": 20}], 'store_id': 'main',
+    })
+    for url in ('/api/products/50', '/api/products/barcode/8934567000050'):
+        response = client.get(url)
+        assert response.status_code == 200
+        data = response.json()
+        assert 'location' not in data and '_id' not in data
+        assert set(data) == set(Product.model_fields)
+
 def test_get_product_not_found(client):
     """Test retrieving a non-existent product."""
     response = client.get('/api/products/999')
@@ -116,4 +140,20 @@ def test_delete_product_not_found(client, admin_auth_headers):
     response = client.delete('/api/products/999', headers=admin_access_headers)
     assert response.status_code == 404
     data = response.json()
-    assert "Product not found" in data['detail']
\ No newline at end of file
+    assert "Product not found" in data['detail']
+def test_prices_reload_when_catalog_version_goes_back(db):
+    """Test that prices cached before Redis lost the catalog version counter are not served once it counts back up."""
+    from backend.pricing import CATALOG_VERSION_PREFIX, PricingEngine, bump_catalog_version, get_catalog_version
+    from backend.redis_client import get_redis
+
+    engine = PricingEngine()
+    assert engine.resolve(db.products, "main", [1]) == {1: 150000000}
+    cached_version = get_catalog_version("main")
+
+    get_redis().delete(f"{CATALOG_VERSION_PREFIX}main")
+    db.products.update_one({"store_id": "main", "id": 1}, {"$set": {"price": 1200000}})
+    assert engine.resolve(db.products, "main", [1]) == {1: 120000000}
+
+    while get_catalog_version("main") < cached_version:
+        bump_catalog_version("main")
+    assert engine.resolve(db.products, "main", [1]) == {1: 120000000}
@@ -0,0 +1,63 @@
+import time
+
+from backend.redis_client import get_redis
+from backend.response_cache import RESPONSE_CACHE_INVALIDATION_CHANNEL, LocalResponseCache, local_response_cache
+
+def test_repeat_read_is_served_from_the_process(client):
+    """Test that a second read is an in-process (L1) hit, and a fresh process is filled from Redis (L2)."""
+    first = client.get('/api/products/1')
+    assert first.headers['X-FastAPI-Cache'] == 'MISS'
+    second = client.get('/api/products/1')
+    assert second.headers['X-FastAPI-Cache'] == 'HIT'
+
+    # As if another worker served it: only Redis has the body
+    local_response_cache.clear()
+    third = client.get('/api/products/1')
+    assert third.headers['X-FastAPI-Cache'] == 'HIT'
+    assert third.json() == first.json()
+
+    body = client.get('/metrics').text
+    assert 'response_cache_tier_lookups_total{tier="l1",result="hit"}' in body
+    assert 'response_cache_tier_lookups_total{tier="l2",result="hit"}' in body
+
+def test_product_write_clears_cached_reads(client, admin_auth_headers):
+    """Test that a product update is visible right away, not after the cache expires."""
+    admin_access_headers, _ = admin_auth_headers
+    assert client.get('/api/products/1').json()['price'] == 1500000
+    assert next(p for p in client.get('/api/products').json() if p['id'] == 1)['price'] == 1500000
+
+    response = client.put('/api/products/1', headers=admin_access_headers, json={"price": 1450000})
+    assert response.status_code == 200
+
+    refreshed = client.get('/api/products/1')
+    assert refreshed.headers['X-FastAPI-Cache'] == 'MISS'
+    assert refreshed.json()['price'] == 1450000
+    assert next(p for p in client.get('/api/products').json() if p['id'] == 1)['price'] == 1450000
+
+def test_invalidation_from_another_process_drops_local_entries():
+    """Test that a namespace cleared elsewhere, announced over pub/sub, is dropped from this process's L1."""
+    cache = LocalResponseCache(max_bytes=1024)
+    cache.start()
+    try:
+        cache.put("fastapi-cache:store:main:products:abc", b"main catalog", None)
+        cache.put("fastapi-cache:store:north:products:abc", b"north catalog", None)
+
+        # What TieredBackend.clear publishes in the process that wrote the products
+        get_redis().publish(RESPONSE_CACHE_INVALIDATION_CHANNEL, "fastapi-cache:store:main")
+        deadline = time.monotonic() + 5
+        while cache.get_with_ttl("fastapi-cache:store:main:products:abc")[1] is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        assert cache.get_with_ttl("fastapi-cache:store:main:products:abc") == (-2, None)
+        assert cache.get_with_ttl("fastapi-cache:store:north:products:abc")[1] == b"north catalog"
+    finally:
+        cache.stop()
+
+def test_map_image_cache_hit_keeps_media_type(client, db):
+    """Test that a cached map image is sent back as PNG."""
+    db.map.insert_one({"store_id": "main", "name": "mall_map", "image": b"\x89PNG\r\n\x1a\nfake"})
+    first = client.get('/api/map/map_image')
+    second = client.get('/api/map/map_image')
+    assert second.headers['X-FastAPI-Cache'] == 'HIT'
+    assert second.headers['content-type'] == 'image/png'
+    assert second.content == first.content == b"\x89PNG\r\n\x1a\nfake"
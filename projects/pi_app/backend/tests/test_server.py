@@ -0,0 +1,25 @@
+import os
+import runpy
+import subprocess
+import sys
+
+import backend
+
+GUNICORN_CONF = os.path.join(os.path.dirname(backend.__file__), "gunicorn.conf.py")
+
+def test_importing_app_opens_no_mongo_client():
+    """Test that the app can be preloaded and forked: no MongoClient exists until first use."""
+    code = "import backend.app, backend.database as database; print(database._client is None)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "True"
+
+def test_gunicorn_config_preloads_and_sizes_workers_to_cores(monkeypatch):
+    """Test that the production server preloads the app and runs one worker per available core by default."""
+    conf = runpy.run_path(GUNICORN_CONF)
+    assert conf["preload_app"] is True
+    assert conf["worker_class"] == "uvicorn_worker.UvicornWorker"
+    assert conf["workers"] == conf["available_cores"]() >= 1
+
+    from backend.config import settings
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 3)
+    assert runpy.run_path(GUNICORN_CONF)["workers"] == 3
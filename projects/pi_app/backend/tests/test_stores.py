@@ -0,0 +1,104 @@
+from backend.config import settings
+from backend.pricing import bump_catalog_version
+from backend import config
+from jose import jwt
+
+NORTH_HEADERS = {"X-Store-ID": "north"}
+
+def insert_north_product(db, **fields):
+    product = {
+        'id': 1, 'name': 'Fifa 19', 'subtitle': 'PS4', 'price': 1400000, 'currency': 'VND', 'quantity': 3,
+        'unit': 'pack', 'product_img_url': None, 'barcode': '8934567000001', 'store_id': 'north',
+    }
+    product.update(fields)
+    db.products.insert_one(product)
+    bump_catalog_version(product['store_id'])
+
+def test_products_are_scoped_by_store_header(client, db):
+    """Test that each store sees its own catalog, and no header means the default store."""
+    insert_north_product(db)
+
+    north = client.get('/api/products', headers=NORTH_HEADERS)
+    assert north.status_code == 200
+    assert [(p['id'], p['price']) for p in north.json()] == [(1, 1400000)]
+
+    main = client.get('/api/products')
+    assert {p['id'] for p in main.json()} == {1, 2, 3}
+    assert next(p for p in main.json() if p['id'] == 1)['price'] == 1500000
+
+    assert client.get('/api/products/2', headers=NORTH_HEADERS).status_code == 404
+    assert client.get('/api/products/barcode/8934567000001').status_code == 404
+    assert client.get('/api/products/barcode/8934567000001', headers=NORTH_HEADERS).status_code == 200
+
+def test_products_cache_is_separate_per_store(client, db):
+    """Test that a cached catalog is only served to the store it was built for."""
+    insert_north_product(db, name='Store Only Item', store_id='south')
+    south = client.get('/api/products', headers={"X-Store-ID": "south"})
+    assert [p['name'] for p in south.json()] == ['Store Only Item']
+    assert client.get('/api/products', headers={"X-Store-ID": "south"}).headers['X-FastAPI-Cache'] == 'HIT'
+
+    # The cached south catalog must not answer the default store
+    main = client.get('/api/products')
+    assert 'Store Only Item' not in {p['name'] for p in main.json()}
+
+def test_invalid_store_header_is_rejected(client):
+    response = client.get('/api/products', headers={"X-Store-ID": "../main"})
+    assert response.status_code == 422
+
+def test_login_puts_store_in_token(client):
+    """Test that a session belongs to the store it logged in at, and keeps it on refresh."""
+    response = client.post('/api/auth/guest_login', headers=NORTH_HEADERS)
+    assert response.status_code == 200
+    tokens = response.json()
+    claims = jwt.decode(tokens['access_token'], config.settings.JWT_SECRET_KEY, algorithms=["HS256"])
+    assert claims['store'] == 'north'
+
+    response = client.post('/api/auth/refresh', headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    claims = jwt.decode(response.json()['access_token'], config.settings.JWT_SECRET_KEY, algorithms=["HS256"])
+    assert claims['store'] == 'north'
+
+    response = client.post('/api/auth/guest_login')
+    claims = jwt.decode(response.json()['access_token'], config.settings.JWT_SECRET_KEY, algorithms=["HS256"])
+    assert claims['store'] == settings.DEFAULT_STORE_ID
+
+def test_checkout_prices_from_the_session_store(client, db):
+    """Test that checkout re-prices the cart from the catalog of the store the cart logged in at."""
+    insert_north_product(db)
+    access_token = client.post('/api/auth/guest_login', headers=NORTH_HEADERS).json()['access_token']
+    item = {'id': 1, 'name': 'Fifa 19', 'subtitle': 'PS4', 'price': 1500000, 'currency': 'VND', 'quantity': 1, 'unit': 'pack'}
+
+    # The default store's price is stale in the north store
+    response = client.post('/api/orders/checkout', headers={"Authorization": f"Bearer {access_token}"}, json={
+        "items": [item], "shipping_cost": 0, "subtotal": 1500000, "total_cost": 1500000,
+    })
+    assert response.status_code == 409
+    assert "Price of 'Fifa 19' has changed" in response.json()['detail']
+
+def test_admin_login_is_bound_to_its_stores(client, db):
+    """Test that an admin can't pick another store with the login header."""
+    client.post('/api/auth/register', json={"email": config.settings.ADMIN_EMAIL, "password": "admin_pass"})
+    login = {"username": config.settings.ADMIN_EMAIL, "password": "admin_pass"}
+    assert db.users.find_one({"email": config.settings.ADMIN_EMAIL})['store_ids'] == [settings.DEFAULT_STORE_ID]
+    assert client.post('/api/auth/login', data=login, headers=NORTH_HEADERS).status_code == 403
+
+    db.users.update_one({"email": config.settings.ADMIN_EMAIL}, {"$set": {"store_ids": ["main", "north"]}})
+    response = client.post('/api/auth/login', data=login, headers=NORTH_HEADERS)
+    assert response.status_code == 200
+    claims = jwt.decode(response.json()['access_token'], config.settings.JWT_SECRET_KEY, algorithms=["HS256"])
+    assert claims['store'] == 'north'
+
+def test_admin_without_store_ids_manages_default_store_only(client, db):
+    """Test that an admin document from before stores existed is bound to the default store."""
+    from backend.hashing import make_context
+
+    db.users.insert_one({"email": "legacy-admin@example.com", "hashed_password": make_context(4).hash("admin_pass"), "role": "admin"})
+    login = {"username": "legacy-admin@example.com", "password": "admin_pass"}
+    assert client.post('/api/auth/login', data=login, headers=NORTH_HEADERS).status_code == 403
+    assert client.post('/api/auth/login', data=login).status_code == 200
+
+def test_card_login_is_bound_to_its_stores(client, db):
+    """Test that a card bound to a store is refused elsewhere, and unbound cards work anywhere."""
+    db.cards.update_one({"card_id": "CARD123"}, {"$set": {"store_ids": ["north"]}})
+    assert client.post('/api/auth/card_login', json={"card_id": "CARD123"}).status_code == 403
+    assert client.post('/api/auth/card_login', json={"card_id": "CARD123"}, headers=NORTH_HEADERS).status_code == 200
+    assert client.post('/api/auth/card_login', json={"card_id": "TEMP789"}, headers=NORTH_HEADERS).status_code == 200
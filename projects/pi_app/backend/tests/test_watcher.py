@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+import time
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from backend.models import OrderStatus
+from backend.orders.batching import catch_up
+from backend.orders.watcher import CHANGE_STREAM_HISTORY_LOST, handle_change, open_stream
+
+class RecordingCollection:
+    """Records watch() calls; resuming fails with the given server error code."""
+
+    def __init__(self, resume_error_code=None):
+        self.resume_error_code = resume_error_code
+        self.calls = []
+
+    def watch(self, pipeline, **options):
+        self.calls.append(options)
+        if "resume_after" in options and self.resume_error_code is not None:
+            raise OperationFailure("cannot resume", code=self.resume_error_code)
+        return "stream"
+
+def test_open_stream_resumes_from_token():
+    collection = RecordingCollection()
+    assert open_stream(collection, {"_data": "token"}) == ("stream", True)
+    assert collection.calls[0]["resume_after"] == {"_data": "token"}
+
+def test_open_stream_without_token_starts_fresh():
+    collection = RecordingCollection()
+    assert open_stream(collection, None) == ("stream", False)
+    assert "resume_after" not in collection.calls[0]
+
+def test_open_stream_falls_back_when_token_left_the_oplog():
+    """Test that a token the oplog no longer has opens a fresh stream, so the caller catches up."""
+    collection = RecordingCollection(resume_error_code=CHANGE_STREAM_HISTORY_LOST)
+    assert open_stream(collection, {"_data": "token"}) == ("stream", False)
+    assert "resume_after" not in collection.calls[1]
+
+def test_open_stream_raises_other_errors():
+    with pytest.raises(OperationFailure):
+        open_stream(RecordingCollection(resume_error_code=13), {"_data": "token"})
+
+def test_catch_up_queues_paid_orders(db, submitted_paid_orders):
+    """Test that catch-up queues PAID orders, and with paid_before only the stalled ones."""
+    now = datetime.utcnow()
+    db.order_history.insert_many([
+        {"order_id": "stalled", "status": OrderStatus.PAID.value, "paid_at": now - timedelta(minutes=10)},
+        {"order_id": "legacy", "status": OrderStatus.PAID.value},
+        {"order_id": "just_paid", "status": OrderStatus.PAID.value, "paid_at": now},
+        {"order_id": "pending", "status": OrderStatus.PENDING.value},
+        {"order_id": "done", "status": OrderStatus.COMPLETED.value, "paid_at": now - timedelta(minutes=10)},
+    ])
+
+    assert catch_up(db.order_history) == 3
+    assert sorted(submitted_paid_orders) == ["just_paid", "legacy", "stalled"]
+
+    submitted_paid_orders.clear()
+    assert catch_up(db.order_history, paid_before=now - timedelta(minutes=2)) == 2
+    assert sorted(submitted_paid_orders) == ["legacy", "stalled"]
+
+def test_paid_update_reaches_submit_paid_order(db, submitted_paid_orders):
+    """Test that a PENDING -> PAID update comes through the change stream and is queued."""
+    try:
+        stream, resumed = open_stream(db.order_history, None)
+    except OperationFailure:
+        pytest.skip("change streams need MongoDB running as a replica set")
+    with stream:
+        db.order_history.insert_one({"order_id": "paid_order", "status": OrderStatus.PENDING.value})
+        db.order_history.insert_one({"order_id": "failed_order", "status": OrderStatus.PENDING.value})
+        db.order_history.update_one({"order_id": "failed_order"}, {"$set": {"status": OrderStatus.FAILED.value}})
+        db.order_history.update_one({"order_id": "paid_order"}, {"$set": {"status": OrderStatus.PAID.value}})
+
+        deadline = time.monotonic() + 10
+        while not submitted_paid_orders and time.monotonic() < deadline:
+            change = stream.try_next()
+            if change is not None:
+                handle_change(change)
+    assert not resumed
+    assert submitted_paid_orders == ["paid_order"]
@@ -0,0 +1,136 @@
+# backend/tracing.py
+"""
+OpenTelemetry tracing for the API, the Celery worker and the order watcher.
+
+FastAPI requests, Celery tasks, pymongo commands and httpx calls are traced
+automatically. Celery carries the trace context in its task headers, so a
+task's span is a child of whatever published it; the Celery instrumentation
+is installed in every process that publishes tasks (worker processes and the
+order watcher, see instrument_celery).
+
+A paid order crosses several traces: the checkout request, the VietQR
+webhook, the change stream watcher and the inventory batch. Checkout stores
+its trace context on the order document as `trace_context`, and the later
+spans link back to it, so one order can be followed end to end.
+
+Tracing is off unless TRACE_EXPORT_DIR (one JSON span per line, a file per
+process) or TRACE_OTLP_ENDPOINT (an OpenTelemetry collector) is set. Spans
+are tagged with SERVICE_NAME. setup_tracing() must run before any MongoClient
+is created, because pymongo only reports to listeners registered before that.
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from celery.signals import worker_process_init, worker_process_shutdown
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from .config import settings
+
+tracer = trace.get_tracer("backend")
+
+_provider: Optional[TracerProvider] = None
+_setup_lock = threading.Lock()
+
+class JsonLinesSpanExporter(SpanExporter):
+    """
+    Appends finished spans, one JSON object per line, to <directory>/<service>-<pid>.jsonl.
+    The file is picked per export, so forked worker processes each get their own.
+    """
+
+    def __init__(self, directory: str, service_name: str):
+        self.directory = directory
+        self.service_name = service_name
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        path = os.path.join(self.directory, f"{self.service_name}-{os.getpid()}.jsonl")
+        with open(path, "a") as out:
+            for span in spans:
+                out.write(json.dumps(json.loads(span.to_json())) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+def tracing_enabled() -> bool:
+    return bool(settings.TRACE_EXPORT_DIR or settings.TRACE_OTLP_ENDPOINT)
+
+def setup_tracing():
+    """Installs the tracer provider and instruments pymongo and httpx. Safe to call more than once."""
+    global _provider
+    if not tracing_enabled():
+        return
+    with _setup_lock:
+        if _provider is not None:
+            return
+        # The instrumentation packages import what they instrument, so load them only when tracing is on
+        from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+        from opentelemetry.instrumentation.pymongo import PymongoInstrumentor
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": settings.SERVICE_NAME}))
+        if settings.TRACE_EXPORT_DIR:
+            provider.add_span_processor(BatchSpanProcessor(
+                JsonLinesSpanExporter(settings.TRACE_EXPORT_DIR, settings.SERVICE_NAME)
+            ))
+        if settings.TRACE_OTLP_ENDPOINT:
+            # Only needed when a collector is configured
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.TRACE_OTLP_ENDPOINT)))
+        trace.set_tracer_provider(provider)
+        PymongoInstrumentor().instrument()
+        HTTPXClientInstrumentor().instrument()
+        _provider = provider
+
+def shutdown_tracing():
+    """Flushes buffered spans."""
+    global _provider
+    with _setup_lock:
+        if _provider is not None:
+            _provider.shutdown()
+            _provider = None
+
+def instrument_app(app):
+    if tracing_enabled():
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="/metrics,/healthz,/readyz")
+
+def instrument_celery():
+    """Traces task runs and puts the trace context in the headers of published tasks."""
+    if tracing_enabled():
+        from opentelemetry.instrumentation.celery import CeleryInstrumentor
+        CeleryInstrumentor().instrument()
+
+@worker_process_init.connect
+def _instrument_worker_process(**kwargs):
+    # The Celery instrumentation has to be installed in each forked worker process
+    instrument_celery()
+
+@worker_process_shutdown.connect
+def _flush_worker_spans(**kwargs):
+    if _provider is not None:
+        _provider.force_flush()
+
+# --- Order trace context ---
+
+def current_trace_context() -> Dict[str, str]:
+    """The current span's context, in a form that can be stored on a document."""
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+def links_to(carriers: Iterable[Optional[Dict[str, str]]]) -> List[trace.Link]:
+    """Span links to the traces stored by current_trace_context()."""
+    links = []
+    for carrier in carriers:
+        if not carrier:
+            continue
+        span_context = trace.get_current_span(propagate.extract(carrier)).get_span_context()
+        if span_context.is_valid:
+            links.append(trace.Link(span_context))
+    return links
@@ -1,57 +1,88 @@
 # backend/users/routes.py
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from pymongo import collection
 import uuid
 
-from .. import pwd_context, config
-from ..database import get_users_collection
+from .. import config
+from ..database import get_users_collection, get_orders_collection, get_cards_collection
+from ..cards.registry import card_registry
+from ..hashing import hash_password, verify_password
 from ..models import UserCreate, User, CardLogin, Role
+from ..rate_limit import check_rate_limit, limit_by_ip
+from ..stores import check_store_access, store_from_header
 from .. import auth
 
+# Each endpoint is limited per client IP in its own bucket, so a store's carts
+# behind one NAT address don't use up each other's logins. Card taps are also
+# limited per card. Guest logins skip bcrypt and get a much higher limit.
+register_rate_limit = limit_by_ip("register", config.settings.REGISTER_RATE_LIMIT_PER_MINUTE)
+login_rate_limit = limit_by_ip("login", config.settings.LOGIN_RATE_LIMIT_PER_MINUTE)
+card_login_rate_limit = limit_by_ip("card_login", config.settings.CARD_LOGIN_IP_RATE_LIMIT_PER_MINUTE)
+guest_login_rate_limit = limit_by_ip("guest_login", config.settings.GUEST_LOGIN_RATE_LIMIT_PER_MINUTE)
+
 router = APIRouter(
     prefix="/api/auth",
     tags=["Authentication"]
 )
 
-@router.post('/register', status_code=status.HTTP_201_CREATED)
-def register_user(
+@router.post('/register', status_code=status.HTTP_201_CREATED, dependencies=[Depends(register_rate_limit)])
+async def register_user(
     user_data: UserCreate,
     users_collection: collection.Collection = Depends(get_users_collection),
 ):
     """Registers a new user."""
-    if users_collection.find_one({"email": user_data.email}):
+    # pymongo blocks, so it runs on the threadpool rather than the event loop
+    if await run_in_threadpool(users_collection.find_one, {"email": user_data.email}):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="User with this email already exists"
         )
     
     # Assign role based on email
-    user_role = Role.ADMIN if user_data.email == config.ADMIN_EMAIL else Role.SHOP_CLIENT
+    user_role = Role.ADMIN if user_data.email == config.settings.ADMIN_EMAIL else Role.SHOP_CLIENT
 
-    hashed_password = pwd_context.hash(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     new_user = User(
         email=user_data.email, 
         hashed_password=hashed_password, 
-        role=user_role)
+        role=user_role,
+        # Admins manage products; bind them to a store rather than trust the login header
+        store_ids=[config.settings.DEFAULT_STORE_ID] if user_role == Role.ADMIN else None)
     
-    users_collection.insert_one(new_user.model_dump())
+    await run_in_threadpool(users_collection.insert_one, new_user.model_dump())
     
     return {"message": f"User {user_data.email} created successfully"}
 
-@router.post('/login')
-def login_user(
+@router.post('/login', dependencies=[Depends(login_rate_limit)])
+async def login_user(
     form_data: OAuth2PasswordRequestForm = Depends(),
+    store_id: str = Depends(store_from_header),
     users_collection: collection.Collection = Depends(get_users_collection),
 ):
     """Logs in a user and returns JWT access and refresh tokens."""
-    user_doc = users_collection.find_one({"email": form_data.username})
+    user_doc = await run_in_threadpool(users_collection.find_one, {"email": form_data.username})
     
-    if user_doc and pwd_context.verify(form_data.password, user_doc["hashed_password"]):
-        user_role = user_doc.get("role", Role.SHOP_CLIENT) # Default to SHOP_CLIENT if role not found
-        token_data = {"sub": form_data.username, "role": user_role.value}
+    if user_doc:
+        is_valid, new_hash = await verify_password(form_data.password, user_doc["hashed_password"])
+    else:
+        is_valid, new_hash = False, None
+
+    if is_valid:
+        if new_hash:
+            # Stored with an older cost setting; upgrade it while we have the password
+            await run_in_threadpool(
+                users_collection.update_one, {"_id": user_doc["_id"]}, {"$set": {"hashed_password": new_hash}},
+            )
+        user_role = Role(user_doc.get("role", Role.SHOP_CLIENT)) # Default to SHOP_CLIENT if role not found
+        store_ids = user_doc.get("store_ids")
+        if store_ids is None and user_role == Role.ADMIN:
+            store_ids = [config.settings.DEFAULT_STORE_ID]
+        check_store_access(store_ids, store_id)
+        token_data = {"sub": form_data.username, "role": user_role.value, "store": store_id}
         access_token = auth.create_access_token(data=token_data)
-        refresh_token = auth.create_refresh_token(data={"sub": form_data.username})
+        refresh_token = auth.create_refresh_token(data=token_data)
         return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
         
     raise HTTPException(
@@ -60,70 +91,102 @@ def login_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-@router.post('/card_login')
-def card_login(card_login_data: CardLogin):
+@router.post('/card_login', dependencies=[Depends(card_login_rate_limit)])
+def card_login(
+    card_login_data: CardLogin,
+    store_id: str = Depends(store_from_header),
+    cards_collection: collection.Collection = Depends(get_cards_collection),
+):
     """
     Logs in a user with a card ID and returns a JWT access token with limited permissions.
+    The card must be registered, active and unexpired. A card linked to an
+    account logs in as that account.
     """
     card_id = card_login_data.card_id
+    check_rate_limit("card_login", card_id, config.settings.CARD_LOGIN_RATE_LIMIT_PER_MINUTE)
 
-    # --- DEMO VALIDATION ---
-    # In a real application, you would look up the card_id in a database
-    # and verify its validity, potentially linking it to a user account.
-    VALID_CARD_IDS = ["CARD123", "GUEST456", "TEMP789"]
-    if card_id not in VALID_CARD_IDS:
+    card = card_registry.authenticate(card_id, cards_collection)
+    if card is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid card ID"
         )
+    check_store_access(card.store_ids, store_id)
 
-    # Create a JWT with the card_id as identity and a custom 'role' claim
-    token_data = {"sub": card_id, "role": Role.SHOP_CLIENT.value}
+    token_data = {"sub": card.user_identity or card_id, "role": Role.SHOP_CLIENT.value, "store": store_id}
     access_token = auth.create_access_token(data=token_data)
-    refresh_token = auth.create_refresh_token(data={"sub": card_id})
+    refresh_token = auth.create_refresh_token(data=token_data)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 @router.post('/refresh')
 def refresh_access_token(
-    current_user: auth.TokenData = Depends(auth.get_current_user),
-    users_collection: collection.Collection = Depends(get_users_collection),
+    current_user: auth.TokenData = Depends(auth.get_refresh_token_user),
 ):
     """
     Endpoint to refresh an expired access token using a valid refresh token.
-    NOTE: In a real app, you'd check if the token is a refresh token (e.g., via a 'type' claim).
-    For simplicity, we're allowing any valid token to generate a new access token.
+    Only tokens with type 'refresh' are accepted. The role is taken from the
+    refresh token itself, so no database lookup is needed.
     """
-    # The role might not be in the refresh token, so we fetch it from the DB
-    user_doc = users_collection.find_one({"email": current_user.identity})
-    user_role = Role.SHOP_CLIENT # Default for card IDs or if not found
-    if user_doc:
-        user_role = user_doc.get("role", Role.SHOP_CLIENT)
-
-    token_data = {"sub": current_user.identity, "role": user_role.value}
+    token_data = {
+        "sub": current_user.identity,
+        "role": current_user.role or Role.SHOP_CLIENT.value,
+        "store": current_user.store_id,
+    }
     new_access_token = auth.create_access_token(data=token_data)
     return {"access_token": new_access_token, "token_type": "bearer"}
 
-@router.post('/guest_login')
-def guest_login(
+@router.post('/revoke', status_code=status.HTTP_204_NO_CONTENT)
+def revoke_bearer_token(
+    current_user: auth.TokenData = Depends(auth.decode_token_dependency),
+):
+    """
+    Revokes the bearer token (access or refresh) until it expires, e.g. on logout.
+    """
+    auth.revoke_token(current_user)
+    return
+
+@router.post('/guest_login', dependencies=[Depends(guest_login_rate_limit)])
+def guest_login(store_id: str = Depends(store_from_header)):
+    """
+    Logs in a guest and returns JWT tokens.
+    Guest sessions are stateless: nothing is hashed or stored, the identity
+    lives only in the signed tokens. See /guest/promote to keep the session.
+    """
+    guest_email = f"guest_{uuid.uuid4()}@temp.com"
+    token_data = {"sub": guest_email, "role": Role.GUEST.value, "store": store_id}
+    access_token = auth.create_access_token(data=token_data)
+    refresh_token = auth.create_refresh_token(data=token_data)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+@router.post('/guest/promote', status_code=status.HTTP_201_CREATED, dependencies=[Depends(register_rate_limit)])
+async def promote_guest(
+    user_data: UserCreate,
+    current_user: auth.TokenData = Depends(auth.role_required([Role.GUEST])),
     users_collection: collection.Collection = Depends(get_users_collection),
+    orders_collection: collection.Collection = Depends(get_orders_collection),
 ):
     """
-    Creates a temporary guest user and logs them in, returning JWT tokens.
-    Each call creates a new guest user.
+    Turns the current guest session into a registered account.
+    Orders placed as the guest are moved to the new account.
     """
-    guest_id = str(uuid.uuid4())
-    guest_email = f"guest_{guest_id}@temp.com"
-    # Guests don't need a memorable password, but we hash one for consistency with User model
-    hashed_password = pwd_context.hash(str(uuid.uuid4())) 
-
-    new_guest_user = User(
-        email=guest_email,
-        hashed_password=hashed_password,
-        role=Role.SHOP_CLIENT
+    if await run_in_threadpool(users_collection.find_one, {"email": user_data.email}):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User with this email already exists"
+        )
+
+    new_user = User(
+        email=user_data.email,
+        hashed_password=await hash_password(user_data.password),
+        role=Role.SHOP_CLIENT)
+    await run_in_threadpool(users_collection.insert_one, new_user.model_dump())
+    await run_in_threadpool(
+        orders_collection.update_many,
+        {"user_identity": current_user.identity},
+        {"$set": {"user_identity": user_data.email}},
     )
-    users_collection.insert_one(new_guest_user.model_dump())
 
-    token_data = {"sub": guest_email, "role": Role.SHOP_CLIENT.value}
+    token_data = {"sub": user_data.email, "role": Role.SHOP_CLIENT.value, "store": current_user.store_id}
     access_token = auth.create_access_token(data=token_data)
-    refresh_token = auth.create_refresh_token(data={"sub": guest_email})
-    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
\ No newline at end of file
+    refresh_token = auth.create_refresh_token(data=token_data)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
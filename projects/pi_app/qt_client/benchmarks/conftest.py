@@ -0,0 +1,20 @@
+import pytest
+from PyQt5.QtWidgets import QApplication
+from qt_client.main import ShoppingCartApp
+
+@pytest.fixture(scope="session")
+def qapp():
+    """Fixture for the QApplication."""
+    app = QApplication.instance() if QApplication.instance() else QApplication([])
+    yield app
+
+@pytest.fixture(scope="session")
+def shopping_cart_app(qapp):
+    """
+    One main window for the whole run; building it is not what is being measured.
+    The startup product fetch is stubbed out, so no backend is needed and the
+    run doesn't wait on connection timeouts or an error dialog.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(ShoppingCartApp, "fetch_products_from_api", lambda self: None)
+        return ShoppingCartApp()
@@ -0,0 +1,50 @@
+"""
+pytest-benchmark suite for the client's per-frame hot paths: UWB positioning,
+which runs for every serial line, and redrawing the cart after a scan.
+Baselines and comparisons: see backend/benchmarks/suite.py.
+"""
+import math
+
+import pytest
+
+from qt_client.utils.serial_reader import ANCHORS, UWBSerialReader
+
+# Where the cart is, in mm, and the anchor ranges the tag would report from there
+CART_POSITION = (2500, 2000)
+DISTANCES = [round(math.dist(CART_POSITION, anchor)) for anchor in ANCHORS]
+SERIAL_LINE = " ".join(
+    f"0x{0xa000 + i:04x}: ={distance}" for i, distance in enumerate(DISTANCES)
+) + "\r\n"
+
+def make_cart(num_items):
+    return [
+        {
+            "id": i,
+            "name": f"Product {i}",
+            "subtitle": "Demo item",
+            "price": 10000.0 + i * 500,
+            "currency": "VND",
+            "quantity": 1 + i % 3,
+        }
+        for i in range(num_items)
+    ]
+
+def test_lse_trilateration(benchmark):
+    reader = UWBSerialReader()
+    x, y = benchmark(reader.lse_trilateration, DISTANCES)
+    # Distances are whole millimetres, so allow for the rounding
+    assert abs(x - CART_POSITION[0]) < 10 and abs(y - CART_POSITION[1]) < 10
+
+def test_process_data(benchmark):
+    """Parse, trilaterate and median-filter, with the 50-position history full as it is in steady state."""
+    reader = UWBSerialReader()
+    for _ in range(50):
+        reader.process_data(SERIAL_LINE)
+    assert benchmark(reader.process_data, SERIAL_LINE) is not None
+
+@pytest.mark.parametrize("num_items", [5, 30])
+def test_set_cart_products(benchmark, shopping_cart_app, num_items):
+    cart_screen = shopping_cart_app.cart_screen_page
+    products = make_cart(num_items)
+    benchmark(cart_screen.set_cart_products, products)
+    assert len(cart_screen.product_widgets) == num_items